@@ -0,0 +1,406 @@
+import os
+import sys
+import pwd
+import json
+import time
+import socket
+import struct
+import shutil
+import argparse
+import platform
+import tempfile
+import threading
+
+import redssh
+
+from tests.embedded_server.openssh import OpenSSHServer
+
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+KEY_PATH = os.path.join(os.path.dirname(BENCH_DIR),'tests','ssh_host_key')
+BIND_HOST = '127.0.0.1'
+MEGABYTE = 1048576.0
+
+
+def free_port():
+    sock = socket.socket(socket.AF_INET,socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET,socket.SO_REUSEADDR,1)
+    sock.bind((BIND_HOST,0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return(port)
+
+
+def latency_stats(samples):
+    samples = sorted(samples)
+    return({
+        'samples':len(samples),
+        'min':samples[0],
+        'mean':sum(samples)/len(samples),
+        'p50':samples[len(samples)//2],
+        'p95':samples[min(len(samples)-1,int(len(samples)*0.95))],
+        'max':samples[-1]
+    })
+
+
+def throughput_stats(size,samples):
+    best = min(samples)
+    return({'bytes':size,'samples':len(samples),'seconds':best,'MBps':size/MEGABYTE/best})
+
+
+class EchoServer(object):
+    '''
+    Plain TCP echo server for the tunnels to forward to.
+    '''
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET,socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET,socket.SO_REUSEADDR,1)
+        self.sock.bind((BIND_HOST,0))
+        self.sock.listen(16)
+        self.port = self.sock.getsockname()[1]
+        self.thread = threading.Thread(target=self.serve,daemon=True)
+        self.thread.start()
+
+    def serve(self):
+        while True:
+            try:
+                (conn,addr) = self.sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self.echo,args=(conn,),daemon=True).start()
+
+    def echo(self,conn):
+        with conn:
+            data = conn.recv(262144)
+            while len(data)>0:
+                conn.sendall(data)
+                data = conn.recv(262144)
+
+    def close(self):
+        self.sock.close()
+
+
+class Bench(object):
+    def __init__(self,client,sizes,repeat,work_dir):
+        self.client = client
+        self.sizes = sizes
+        self.repeat = repeat
+        self.work_dir = work_dir
+        self.username = pwd.getpwuid(os.geteuid()).pw_name
+        self.prompt = b'$ '
+        if self.username=='root':
+            self.prompt = b'# '
+        self.port = free_port()
+        self.server = OpenSSHServer(port=self.port,server_key=KEY_PATH)
+        self.server.start_server()
+        self.echo_server = EchoServer()
+
+    def close(self):
+        self.echo_server.close()
+        self.server.stop()
+        del self.server
+
+    def connect(self,**kwargs):
+        redssh.clients.default_client = self.client
+        rs = redssh.RedSSH(**kwargs)
+        rs.connect(BIND_HOST,self.port,username=self.username,key_filepath=KEY_PATH)
+        return(rs)
+
+    def wait_for(self,rs,marker):
+        data = b''
+        while not marker in data:
+            for chunk in rs.read(True):
+                data+=chunk
+                if marker in data:
+                    break
+        return(data)
+
+    def bench_connect(self):
+        samples = []
+        for i in range(self.repeat):
+            start = time.perf_counter()
+            rs = self.connect()
+            samples.append(time.perf_counter()-start)
+            rs.exit()
+        return(latency_stats(samples))
+
+    def bench_execute_command(self,rs):
+        samples = []
+        for i in range(self.repeat):
+            start = time.perf_counter()
+            rs.execute_command('true')
+            samples.append(time.perf_counter()-start)
+        return(latency_stats(samples))
+
+    def bench_shell_echo(self,rs):
+        self.wait_for(rs,self.prompt)
+        samples = []
+        for i in range(self.repeat):
+            marker = ('bench'+str(i)+'done').encode('utf8')
+            start = time.perf_counter()
+            rs.send('echo bench'+str(i)+'"done"\r\n')
+            self.wait_for(rs,marker)
+            samples.append(time.perf_counter()-start)
+        return(latency_stats(samples))
+
+    def transfer(self,put,get):
+        results = {'upload':{},'download':{}}
+        for size in self.sizes:
+            local_path = os.path.join(self.work_dir,'local_'+str(size))
+            remote_path = os.path.join(self.work_dir,'remote_'+str(size))
+            with open(local_path,'wb') as f:
+                f.write(os.urandom(size))
+            upload = []
+            download = []
+            for i in range(self.repeat):
+                start = time.perf_counter()
+                put(local_path,remote_path)
+                upload.append(time.perf_counter()-start)
+                start = time.perf_counter()
+                get(remote_path,local_path)
+                download.append(time.perf_counter()-start)
+            results['upload'][str(size)] = throughput_stats(size,upload)
+            results['download'][str(size)] = throughput_stats(size,download)
+            os.remove(local_path)
+            os.remove(remote_path)
+        return(results)
+
+    def bench_sftp(self,rs):
+        rs.start_sftp()
+        return(self.transfer(rs.sftp.put_file,rs.sftp.get_file))
+
+    def bench_sftp_delta(self,rs):
+        '''
+        Re-upload a file with one byte changed, all of it with ``put_file`` against only the changed block with ``put_file_delta``.
+        '''
+        rs.start_sftp()
+        results = {'full':{},'delta':{}}
+        for size in self.sizes:
+            local_path = os.path.join(self.work_dir,'local_'+str(size))
+            remote_path = os.path.join(self.work_dir,'remote_'+str(size))
+            data = bytearray(os.urandom(size))
+            with open(local_path,'wb') as f:
+                f.write(data)
+            rs.sftp.put_file(local_path,remote_path)
+            full = []
+            delta = []
+            for i in range(self.repeat):
+                data[(i*7919)%size] ^= 0xff
+                with open(local_path,'wb') as f:
+                    f.write(data)
+                start = time.perf_counter()
+                rs.sftp.put_file(local_path,remote_path)
+                full.append(time.perf_counter()-start)
+                data[(i*7919+size//2)%size] ^= 0xff
+                with open(local_path,'wb') as f:
+                    f.write(data)
+                start = time.perf_counter()
+                sent = rs.sftp.put_file_delta(local_path,remote_path)
+                delta.append(time.perf_counter()-start)
+            results['full'][str(size)] = throughput_stats(size,full)
+            results['delta'][str(size)] = throughput_stats(size,delta)
+            results['delta'][str(size)]['bytes_sent'] = sent
+            os.remove(local_path)
+            os.remove(remote_path)
+        return(results)
+
+    def bench_sftp_tree(self,rs):
+        '''
+        Upload and download a tree of many small files, file by file against as one tar stream.
+        '''
+        rs.start_sftp()
+        local_path = os.path.join(self.work_dir,'tree_local')
+        for i in range(500):
+            dir_path = os.path.join(local_path,'dir'+str(i%20))
+            os.makedirs(dir_path,exist_ok=True)
+            with open(os.path.join(dir_path,'file'+str(i)),'wb') as f:
+                f.write(os.urandom(1024))
+        results = {}
+        for tar in [False,True]:
+            mode = 'tar' if tar==True else 'per_file'
+            upload = []
+            download = []
+            for i in range(self.repeat):
+                remote_path = os.path.join(self.work_dir,'tree_remote')
+                download_path = os.path.join(self.work_dir,'tree_download')
+                start = time.perf_counter()
+                rs.sftp.put_folder(local_path,remote_path,tar=tar)
+                upload.append(time.perf_counter()-start)
+                start = time.perf_counter()
+                rs.sftp.get_folder(remote_path,download_path,tar=tar)
+                download.append(time.perf_counter()-start)
+                shutil.rmtree(remote_path)
+                shutil.rmtree(download_path)
+            results[mode] = {'upload':latency_stats(upload),'download':latency_stats(download)}
+        shutil.rmtree(local_path)
+        return(results)
+
+    def bench_scp(self,rs):
+        if not 'scp_recv2' in dir(rs.client.session):
+            return(None) # This client only offers SCP as a fallback to SFTP.
+        rs.start_scp()
+        def get(remote_path,local_path):
+            with open(local_path,'wb') as f:
+                f.write(rs.scp.read(remote_path,iter=False))
+        return(self.transfer(rs.scp.put_file,get))
+
+    def channel_throughput(self,rs):
+        results = {}
+        for size in self.sizes:
+            samples = []
+            for i in range(self.repeat):
+                start = time.perf_counter()
+                (ret,out) = rs.execute_many(['head -c '+str(size)+' /dev/zero'])[0]
+                samples.append(time.perf_counter()-start)
+                if not len(out)==size:
+                    raise(ConnectionError('Got '+str(len(out))+' of '+str(size)+' bytes.'))
+            results[str(size)] = throughput_stats(size,samples)
+        return(results)
+
+    def bench_ciphers(self):
+        '''
+        Bulk channel throughput with each cipher from the method profiles forced in both directions, then with each profile as negotiated.
+        Ciphers this client or the server doesn't support are reported as errors.
+        '''
+        results = {'ciphers':{},'profiles':{}}
+        ciphers = []
+        for profile in redssh.enums.METHOD_PROFILES.values():
+            for cipher in profile.get(redssh.enums.MethodKind.crypt,'').split(','):
+                if len(cipher)>0 and not cipher in ciphers:
+                    ciphers.append(cipher)
+        redssh.clients.default_client = self.client
+        crypt = redssh.RedSSH().enums.MethodPreference.crypt.value
+        runs = [('ciphers',cipher,{'method_preferences':dict([(method_type,cipher) for method_type in crypt])}) for cipher in ciphers]
+        runs+=[('profiles',profile.value,{'method_profile':profile}) for profile in redssh.enums.MethodProfile]
+        for (group,name,kwargs) in runs:
+            rs = None
+            try:
+                rs = self.connect(**kwargs)
+                results[group][name] = self.channel_throughput(rs)
+                results[group][name]['cipher'] = rs.methods(crypt[0])
+                if isinstance(results[group][name]['cipher'],bytes):
+                    results[group][name]['cipher'] = results[group][name]['cipher'].decode('utf8')
+            except Exception as e:
+                results[group][name] = {'error':repr(e)}
+            finally:
+                if not rs==None:
+                    rs.exit()
+        return(results)
+
+    def tunnel_throughput(self,connect):
+        results = {}
+        for size in self.sizes:
+            payload = os.urandom(size)
+            samples = []
+            for i in range(self.repeat):
+                sock = connect()
+                sock.setsockopt(socket.IPPROTO_TCP,socket.TCP_NODELAY,1)
+                start = time.perf_counter()
+                sender = threading.Thread(target=sock.sendall,args=(payload,),daemon=True)
+                sender.start()
+                received = 0
+                while received<size:
+                    data = sock.recv(262144)
+                    if len(data)==0:
+                        raise(ConnectionError('Tunnel closed after '+str(received)+' of '+str(size)+' bytes.'))
+                    received+=len(data)
+                samples.append(time.perf_counter()-start)
+                sender.join()
+                sock.close()
+            results[str(size)] = throughput_stats(size,samples)
+        return(results)
+
+    def bench_local_tunnel(self,rs):
+        port = rs.local_tunnel(0,BIND_HOST,self.echo_server.port)
+        try:
+            return(self.tunnel_throughput(lambda: socket.create_connection((BIND_HOST,port))))
+        finally:
+            rs.close_tunnels()
+
+    def bench_remote_tunnel(self,rs):
+        port = free_port()
+        rs.remote_tunnel(port,BIND_HOST,self.echo_server.port)
+        try:
+            time.sleep(0.5)
+            return(self.tunnel_throughput(lambda: socket.create_connection((BIND_HOST,port))))
+        finally:
+            rs.close_tunnels()
+
+    def bench_dynamic_tunnel(self,rs):
+        port = rs.dynamic_tunnel(0)
+        def connect():
+            sock = socket.create_connection((BIND_HOST,port))
+            sock.sendall(b'\x05\x01\x00')
+            sock.recv(2)
+            sock.sendall(b'\x05\x01\x00\x01'+socket.inet_aton(BIND_HOST)+struct.pack('!H',self.echo_server.port))
+            reply = sock.recv(10)
+            if len(reply)<2 or not reply[1]==0:
+                raise(ConnectionError('SOCKS connect failed: '+repr(reply)))
+            return(sock)
+        try:
+            return(self.tunnel_throughput(connect))
+        finally:
+            rs.close_tunnels()
+
+    def run(self,only=None):
+        results = {}
+        benches = ['connect','execute_command','shell_echo','sftp','sftp_delta','sftp_tree','scp','ciphers','local_tunnel','remote_tunnel','dynamic_tunnel']
+        for name in benches:
+            if not only==None and not name in only:
+                continue
+            rs = None
+            try:
+                if name in ('connect','ciphers'):
+                    results[name] = getattr(self,'bench_'+name)()
+                else:
+                    rs = self.connect()
+                    results[name] = getattr(self,'bench_'+name)(rs)
+            except Exception as e:
+                results[name] = {'error':repr(e)}
+            finally:
+                if not rs==None:
+                    rs.exit()
+            sys.stderr.write(self.client+' '+name+': '+json.dumps(results[name])+'\n')
+        return(results)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure RedSSH latency and throughput against the embedded OpenSSH server.')
+    parser.add_argument('--clients',default=','.join(sorted(redssh.clients.enabled_clients)),help='Comma separated SSH clients to benchmark.')
+    parser.add_argument('--sizes',default='1048576,16777216',help='Comma separated transfer sizes in bytes.')
+    parser.add_argument('--repeat',type=int,default=5,help='How many times to repeat each measurement.')
+    parser.add_argument('--only',default=None,help='Comma separated benchmarks to run, defaults to all of them.')
+    parser.add_argument('--output',default=None,help='File to write the JSON results to, defaults to stdout.')
+    args = parser.parse_args(argv)
+
+    only = None
+    if not args.only==None:
+        only = args.only.split(',')
+    report = {
+        'redssh_version':redssh.VERSION,
+        'python':platform.python_version(),
+        'platform':platform.platform(),
+        'timestamp':time.time(),
+        'sizes':[int(size) for size in args.sizes.split(',')],
+        'repeat':args.repeat,
+        'results':{}
+    }
+    for client in args.clients.split(','):
+        work_dir = tempfile.mkdtemp(prefix='redssh_bench_')
+        bench = Bench(client,report['sizes'],args.repeat,work_dir)
+        try:
+            report['results'][client] = bench.run(only)
+        finally:
+            bench.close()
+            shutil.rmtree(work_dir,ignore_errors=True)
+
+    output = json.dumps(report,indent=4,sort_keys=True)
+    if args.output==None:
+        print(output)
+    else:
+        with open(args.output,'w') as f:
+            f.write(output+'\n')
+
+
+if __name__ == '__main__':
+    main()
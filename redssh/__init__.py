@@ -26,6 +26,13 @@
 VERSION = u'3.0.1'
 
 from .redssh import RedSSH
+from .asyncredssh import AsyncRedSSH
+from . import pool
+from . import fanout
+from . import metrics
+from . import compression
+from . import known_hosts
+from . import auth
 from . import clients
 from .clients.libssh2 import libssh2
 from .clients.libssh import libssh
@@ -0,0 +1,393 @@
+# RedSSH
+# Copyright (C) 2018 - 2022 Red_M ( http://bitbucket.com/Red_M )
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import asyncio
+import functools
+import selectors
+import socket
+
+from . import enums
+from .redssh import RedSSH
+
+
+class AsyncRedSSH(RedSSH):
+    '''
+    An :mod:`asyncio` version of :class:`redssh.RedSSH`.
+    Takes the same arguments as :class:`redssh.RedSSH`.
+
+    Session I/O is driven from the event loop by watching the session socket with ``loop.add_reader``/``loop.add_writer``,
+    so a single event loop can run many sessions without a thread per session.
+    The SSH handshake, authentication, starting SFTP/SCP and opening tunnels are still blocking in the underlying libraries
+    and are run in the event loop's default executor instead.
+
+    Every library call made from the event loop still takes the session's lock (``client.session._block_lock``).
+    The keepalive thread and the thread running the session's tunnels take the same lock for their own library calls,
+    so while either of them is in a call the event loop's thread blocks until that call returns.
+    '''
+    def __init__(self,*args,**kwargs):
+        super().__init__(*args,**kwargs)
+        self._waiters = {
+            selectors.EVENT_READ:[],
+            selectors.EVENT_WRITE:[]
+        }
+        self._watching = set()
+        self._open_lock = None
+
+    def _watch(self,loop,event):
+        if not event in self._watching:
+            if event==selectors.EVENT_READ:
+                loop.add_reader(self.client.sock,self._ready,event)
+            else:
+                loop.add_writer(self.client.sock,self._ready,event)
+            self._watching.add(event)
+
+    def _unwatch(self,loop,event):
+        if event in self._watching:
+            if event==selectors.EVENT_READ:
+                loop.remove_reader(self.client.sock)
+            else:
+                loop.remove_writer(self.client.sock)
+            self._watching.remove(event)
+
+    def _ready(self,event):
+        self._unwatch(asyncio.get_running_loop(),event)
+        waiters = self._waiters[event]
+        self._waiters[event] = []
+        for future in waiters:
+            if future.done()==False:
+                future.set_result(None)
+
+    def _woken(self):
+        self.client._wait_drain()
+        for event in self._waiters:
+            self._ready(event)
+
+    async def _wait(self):
+        '''
+        The coroutine version of :func:`redssh.clients.base_client.BaseClient._block_select`.
+        Parks without a timeout under the same rules, see :func:`redssh.clients.base_client.BaseClient._wait_prepare`,
+        otherwise waits at most ``_select_timeout``.
+        '''
+        client = self.client
+        loop = asyncio.get_running_loop()
+        (events,park,timeout) = client._wait_prepare()
+        future = loop.create_future()
+        try:
+            for event in self._waiters:
+                if events & event:
+                    self._waiters[event].append(future)
+                    self._watch(loop,event)
+            if park==True:
+                loop.add_reader(client._wait_waker[0],self._woken)
+                await future
+            else:
+                await asyncio.wait([future],timeout=timeout)
+        finally:
+            for event in self._waiters:
+                if future in self._waiters[event]:
+                    self._waiters[event].remove(future)
+                    if len(self._waiters[event])==0:
+                        self._unwatch(loop,event)
+            if park==True:
+                loop.remove_reader(client._wait_waker[0])
+            client._wait_finish(park)
+
+    async def _block(self,func,*args,**kwargs):
+        out = self.client._call(func,*args,**kwargs)
+        while out==self.enums.Client.eagain and self.client.__shutdown_all__.is_set()==False:
+            await self._wait()
+            out = self.client._call(func,*args,**kwargs)
+        return(out)
+
+    async def _block_write(self,func,data):
+        view = self.client._write_buffer(data)
+        data_len = len(view)
+        total_written = 0
+        while total_written<data_len and self.client.__shutdown_all__.is_set()==False:
+            (rc,bytes_written) = self.client._call(func,self.client._write_slice(view,total_written))
+            total_written+=bytes_written
+            if rc==self.enums.Client.eagain:
+                await self._wait()
+        return(total_written)
+
+    async def _read(self,channel,block=False,until_eof=False):
+        read = getattr(channel,self.enums.Channel.read.value)
+        eof = getattr(channel,self.enums.Channel.eof.value)
+        out = []
+        while self.client.__shutdown_all__.is_set()==False:
+            try:
+                (size,data) = self.client._call(read)
+            except self.enums.Exceptions.EOF.value:
+                break
+            if size>0:
+                out.append(data[:size])
+                continue
+            if self.client._call(eof)==True:
+                break
+            if block==False or (len(out)>0 and until_eof==False):
+                break
+            await self._wait()
+        return(b''.join(out))
+
+    async def _open_socket(self,loop,hostname,port,timeout):
+        last_error = None
+        for (family,socktype,proto,canonname,sockaddr) in await loop.getaddrinfo(hostname,port,type=socket.SOCK_STREAM):
+            sock = socket.socket(family,socktype,proto)
+            sock.setblocking(False)
+            try:
+                await asyncio.wait_for(loop.sock_connect(sock,sockaddr),timeout)
+            except (OSError,asyncio.TimeoutError) as e:
+                sock.close()
+                last_error = e
+                continue
+            sock.setsockopt(socket.SOL_SOCKET,socket.SO_KEEPALIVE,1)
+            sock.setsockopt(socket.IPPROTO_TCP,socket.TCP_NODELAY,self.client.tcp_nodelay)
+            return(sock)
+        raise(last_error)
+
+    async def connect(self,hostname,port=22,username='',password=None,
+        allow_agent=False,host_based=None,key_filepath=None,passphrase=None,
+        look_for_keys=False,sock=None,timeout=None):
+        '''
+        The coroutine version of :func:`redssh.RedSSH.connect`, takes the same arguments.
+        The TCP connection is made on the event loop, the handshake and authentication are run in the default executor.
+        '''
+        loop = asyncio.get_running_loop()
+        own_sock = False
+        if sock==None:
+            sock = await self._open_socket(loop,hostname,port,timeout)
+            own_sock = True
+        connect = functools.partial(super().connect,hostname,port,username,password,allow_agent,host_based,key_filepath,passphrase,look_for_keys,sock,timeout)
+        try:
+            await loop.run_in_executor(None,connect)
+        except:
+            if own_sock==True:
+                sock.close()
+            raise
+
+    async def eof(self):
+        '''
+        Returns ``True`` or ``False`` when the main channel has recieved an ``EOF``.
+        '''
+        if self.client.past_login==True:
+            return(await self._block(getattr(self.client.channel,self.enums.Channel.eof.value)))
+
+    async def setenv(self,varname,value):
+        '''
+        Set an environment variable on the main channel.
+
+        :param varname: Name of environment variable to set on the remote channel.
+        :type varname: ``str``
+        :param value: Value to set ``varname`` to.
+        :type value: ``str``
+        :return: ``None``
+        '''
+        if self.client.past_login==True:
+            await self._block(getattr(self.client.channel,self.enums.Channel.setenv.value),varname,value)
+
+    async def read(self,block=False):
+        '''
+        Recieve data from the remote session.
+        Only works if the current session has made it past the login process.
+
+        :param block: Wait until data is received from the remote server. ``True``
+            will wait until data is recieved and ``False`` may return ``b''`` if no data is available from the remote server.
+        :type block: ``bool``
+        :return: ``bytes`` - All of the data that was available from the remote server.
+        '''
+        if self.client.past_login==True:
+            return(await self._read(self.client.channel,block))
+        return(b'')
+
+    async def send(self,string):
+        '''
+        Send data to the remote session.
+        Only works if the current session has made it past the login process.
+
+        :param string: String to send to the remote session, ``bytes`` or any other object supporting the buffer protocol can also be sent.
+        :type string: ``str``/``bytes``
+        :return: ``int`` - Amount of bytes sent to remote machine.
+        '''
+        if self.client.past_login==True:
+            return(await self._block_write(getattr(self.client.channel,self.enums.Channel.write.value),string))
+        return(0)
+
+    async def write(self,string):
+        '''
+        See :func:`redssh.AsyncRedSSH.send`
+        '''
+        return(await self.send(string))
+
+    async def flush(self):
+        '''
+        Flush all data on the primary channel's stdin to the remote connection.
+        Only works if connected, otherwise returns ``0``.
+
+        :return: ``int`` - Amount of bytes sent to remote machine.
+        '''
+        if self.client.past_login==True:
+            return(await self._block(getattr(self.client.channel,self.enums.Channel.flush.value)))
+        return(0)
+
+    async def open_channel(self,pty=False):
+        '''
+        Open a new SSH channel on the session without starting a shell on it.
+
+        :param pty: Request a pty for the channel.
+        :type pty: ``bool``
+        :return: ``redssh.RedSSH.channel``
+        '''
+        if self._open_lock==None:
+            self._open_lock = asyncio.Lock()
+        session = self.client.session
+        async with self._open_lock: # libssh can only have one channel opening on a session at a time.
+            if 'channel_new' in dir(session):
+                channel = self.client._call(session.channel_new)
+                self.client._call(channel.set_blocking,False)
+                await self._block(channel.open_session)
+                if self.client.request_pty==True and pty==True:
+                    await self._block(channel.request_pty_size,self.client.terminal,0,0)
+            else:
+                channel = await self._block(session.open_session)
+                if self.client.request_pty==True and pty==True:
+                    await self._block(channel.pty,self.client.terminal)
+        return(channel)
+
+    async def execute_command(self,command,env=None,channel=None,pty=False):
+        '''
+        Run a command. The coroutine finishes once the command has exited.
+
+        :param command: Command to execute.
+        :type command: ``str``
+        :param env: Environment variables to set for ``command``.
+        :type env: ``dict``
+        :param channel: Use an existing SSH channel from :func:`redssh.AsyncRedSSH.open_channel` instead of spawning a new one.
+        :type channel: ``redssh.RedSSH.channel``
+        :param pty: Request a pty for the command to be executed via.
+        :type pty: ``bool``
+        :return: ``tuple (int, str)`` - of ``(return_code, command_output)``
+        '''
+        if env==None:
+            env = {}
+        if channel==None:
+            channel = await self.open_channel(pty)
+        for key in env:
+            await self._block(getattr(channel,self.enums.Channel.setenv.value),key,env[key])
+        await self._block(getattr(channel,self.enums.Channel.exec_command.value),command)
+        out = await self._read(channel,True,True)
+        if 'wait_closed' in dir(channel):
+            # libssh2 only has the exit status once the remote side has closed the channel.
+            await self._block(channel.close)
+            ret = await self._block(channel.get_exit_status)
+        else:
+            ret = await self._block(channel.get_exit_status)
+            while ret==-1 and self.client._call(channel.is_closed)==False and self.client.__shutdown_all__.is_set()==False:
+                await self._wait()
+                ret = await self._block(channel.get_exit_status)
+            await self._block(channel.send_eof)
+            await self._block(channel.close)
+        del channel
+        return(ret,out)
+
+    async def execute_many(self,commands,env=None,pty=False,max_channels=8):
+        '''
+        Run several commands at the same time on this session, each on its own channel.
+
+        :param commands: Commands to execute.
+        :type commands: ``list``
+        :param env: Environment variables to set for every command.
+        :type env: ``dict``
+        :param pty: Request a pty for the commands to be executed via.
+        :type pty: ``bool``
+        :param max_channels: Maximum amount of channels to have open at once.
+        :type max_channels: ``int``
+        :return: ``list`` - of ``tuple (int, str)`` - of ``(return_code, command_output)`` in the same order as ``commands``
+        '''
+        limit = asyncio.Semaphore(max(max_channels,1))
+        async def run(command):
+            async with limit:
+                return(await self.execute_command(command,env=env,pty=pty))
+        return(list(await asyncio.gather(*[run(command) for command in commands])))
+
+    async def _run_in_executor(self,func,*args):
+        return(await asyncio.get_running_loop().run_in_executor(None,functools.partial(func,*args)))
+
+    async def start_sftp(self):
+        '''
+        See :func:`redssh.RedSSH.start_sftp`, this is run in the default executor.
+        The SFTP client itself is not a coroutine client.
+
+        :return: ``None``
+        '''
+        await self._run_in_executor(super().start_sftp)
+
+    async def start_scp(self):
+        '''
+        See :func:`redssh.RedSSH.start_scp`, this is run in the default executor.
+        The SCP client itself is not a coroutine client.
+
+        :return: ``None``
+        '''
+        await self._run_in_executor(super().start_scp)
+
+    async def local_tunnel(self,local_port,remote_host,remote_port,bind_addr='127.0.0.1',error_level=enums.TunnelErrorLevel.debug):
+        '''
+        See :func:`redssh.RedSSH.local_tunnel`.
+
+        :return: ``int`` The local port that has been bound.
+        '''
+        return(await self._run_in_executor(super().local_tunnel,local_port,remote_host,remote_port,bind_addr,error_level))
+
+    async def remote_tunnel(self,local_port,remote_host,remote_port,bind_addr='127.0.0.1',error_level=enums.TunnelErrorLevel.warn):
+        '''
+        See :func:`redssh.RedSSH.remote_tunnel`.
+
+        :return: ``None``
+        '''
+        return(await self._run_in_executor(super().remote_tunnel,local_port,remote_host,remote_port,bind_addr,error_level))
+
+    async def dynamic_tunnel(self,local_port,bind_addr='127.0.0.1',error_level=enums.TunnelErrorLevel.warn):
+        '''
+        See :func:`redssh.RedSSH.dynamic_tunnel`.
+
+        :return: ``int`` The local port that has been bound.
+        '''
+        return(await self._run_in_executor(super().dynamic_tunnel,local_port,bind_addr,error_level))
+
+    async def shutdown_tunnel(self,tunnel_type,sport,rhost=None,rport=None,bind_addr='127.0.0.1'):
+        '''
+        See :func:`redssh.RedSSH.shutdown_tunnel`.
+
+        :return: ``None``
+        '''
+        await self._run_in_executor(super().shutdown_tunnel,tunnel_type,sport,rhost,rport,bind_addr)
+
+    async def close_tunnels(self):
+        '''
+        Closes all SSH tunnels if any are open.
+        '''
+        await self._run_in_executor(super().close_tunnels)
+
+    async def exit(self):
+        '''
+        Kill the current session if connected.
+        '''
+        if self.client.past_login==True:
+            self.client.__shutdown_all__.set()
+            for event in self._waiters:
+                self._ready(event)
+        await self._run_in_executor(super().exit)
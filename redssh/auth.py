@@ -0,0 +1,171 @@
+# RedSSH
+# Copyright (C) 2018 - 2022 Red_M ( http://bitbucket.com/Red_M )
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+'''
+State shared by every session in the process to make authenticating quicker when many sessions are opened.
+
+Sessions only cache when given a cache with ``RedSSH(auth_cache=cache)``, :data:`redssh.auth.shared_cache` shares one
+across the process and a new :class:`redssh.auth.AuthCache` keeps a group of sessions apart from the rest.
+'''
+
+import os
+import socket
+import hashlib
+import threading
+import contextlib
+
+
+class AuthCache(object):
+    '''
+    Remembers which authentication method worked for each ``(hostname, port, username)`` so that it is tried first the next time,
+    keeps private keys loaded so that they are only read and decrypted once and keeps connections to SSH agents open.
+
+    Which methods there are and how keys are loaded is up to each client, methods are ``tuple`` s that start with the method name,
+    like ``('publickey', key_path)``.
+
+    Loaded keys are kept decrypted in memory, one for each path and passphrase used, until :func:`redssh.auth.AuthCache.clear` is called.
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._methods = {}
+        self._keys = {}
+        self._agents = {}
+
+    def method(self,hostname,port,username):
+        '''
+        The method that last worked for ``username`` on ``hostname`` and ``port``.
+
+        :return: ``tuple`` or ``None``
+        '''
+        with self._lock:
+            return(self._methods.get((hostname,port,username)))
+
+    def order(self,hostname,port,username,methods):
+        '''
+        ``methods`` with the one that last worked moved to the front,
+        a remembered method can hold more detail than the one it matches, like which key of an agent worked.
+
+        :param methods: Methods in the order the client would try them.
+        :type methods: ``list``
+        :return: ``list``
+        '''
+        remembered = self.method(hostname,port,username)
+        if not remembered==None:
+            for method in methods:
+                if remembered[:len(method)]==method:
+                    return([method]+[other for other in methods if not other==method])
+        return(list(methods))
+
+    def succeeded(self,hostname,port,username,method):
+        '''
+        Remember that ``method`` worked for ``username`` on ``hostname`` and ``port``.
+
+        :param method: The method that worked.
+        :type method: ``tuple``
+        :return: ``None``
+        '''
+        with self._lock:
+            self._methods[(hostname,port,username)] = method
+
+    def failed(self,hostname,port,username):
+        '''
+        Forget the method remembered for ``username`` on ``hostname`` and ``port`` as nothing worked.
+
+        :return: ``None``
+        '''
+        with self._lock:
+            self._methods.pop((hostname,port,username),None)
+
+    def load_key(self,path,passphrase,loader):
+        '''
+        The private key at ``path`` decrypted with ``passphrase``, only calling ``loader`` when the key hasn't been loaded
+        with the same passphrase before or the file has changed since.
+        The passphrase is only kept as a hash.
+
+        :param path: Path to the private key.
+        :type path: ``str``
+        :param passphrase: Passphrase to decrypt the key.
+        :type passphrase: ``str``
+        :param loader: Called as ``loader(path, passphrase)`` to load the key, what it returns is cached.
+        :type loader: ``callable``
+        :return: What ``loader`` returned.
+        '''
+        stat = os.stat(path)
+        state = (stat.st_ino,stat.st_size,stat.st_mtime_ns)
+        if passphrase==None:
+            passphrase = ''
+        if isinstance(passphrase,type('')):
+            passphrase = passphrase.encode('utf8')
+        cache_key = (os.path.abspath(path),hashlib.sha256(passphrase).digest())
+        with self._lock:
+            cached = self._keys.get(cache_key)
+        if not cached==None and cached[0]==state:
+            return(cached[1])
+        key = loader(path,passphrase.decode('utf8'))
+        with self._lock:
+            self._keys[cache_key] = (state,key)
+        return(key)
+
+    @contextlib.contextmanager
+    def agent(self,path):
+        '''
+        A duplicate file descriptor of the connection to the SSH agent at ``path``, connecting the first time.
+        An agent answers one request at a time on each connection so other sessions wait until the block is done,
+        whoever the descriptor is given to should close it. The connection is dropped if the block raises.
+
+        :param path: Path to the agent's socket, usually ``SSH_AUTH_SOCK``.
+        :type path: ``str``
+        :return: ``int``
+        '''
+        with self._lock:
+            if not path in self._agents:
+                self._agents[path] = [threading.Lock(),None]
+            agent = self._agents[path]
+        with agent[0]:
+            if agent[1]==None:
+                agent[1] = socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+                try:
+                    agent[1].connect(path)
+                except:
+                    agent[1].close()
+                    agent[1] = None
+                    raise
+            try:
+                yield(os.dup(agent[1].fileno()))
+            except:
+                agent[1].close()
+                agent[1] = None
+                raise
+
+    def clear(self):
+        '''
+        Forget every method and key and close the connections to agents.
+
+        :return: ``None``
+        '''
+        with self._lock:
+            self._methods = {}
+            self._keys = {}
+            agents = self._agents
+            self._agents = {}
+        for (lock,sock) in agents.values():
+            with lock:
+                if not sock==None:
+                    sock.close()
+
+
+#: A cache for sessions across the process to share, sessions only use it when given it.
+shared_cache = AuthCache()
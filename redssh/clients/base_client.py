@@ -18,11 +18,18 @@
 import os
 import re
 import enum
+import time
+import socket
+import functools
+import selectors
+import collections
 import threading
 import multiprocessing
 
 from redssh import exceptions
 from redssh import enums
+from redssh import compression
+from redssh.clients import channel_io
 
 class BaseClientModules:
     client_enums = None
@@ -43,6 +50,7 @@ class BaseClient(object):
     :param known_hosts: Set the known hosts file to a set location other than ``'~/.ssh/known_hosts'``, ``None`` is the default location.
     :type known_hosts: ``str``
     :param ssh_host_key_verification: Change the behaviour of remote host key verification. Can be set to one of the following values, ``strict``, ``warn``, ``auto_add`` or ``none``.
+        Keys marked ``@revoked`` in the known hosts file are always refused unless this is ``none``.
     :type ssh_host_key_verification: :class:`redssh.enums.SSHHostKeyVerify`
     :param ssh_keepalive_interval: Enable or disable SSH keepalive packets, value is interval in seconds, ``0`` is off.
     :type ssh_keepalive_interval: ``float``
@@ -56,11 +64,14 @@ class BaseClient(object):
     :type auto_terminate_tunnels: ``bool``
     :param tcp_nodelay: Set `TCP_NODELAY` for the underlying :func:`socket.socket`, by default this is off via `False`.
     :type tcp_nodelay: ``bool``
+    :param tunnel_buffer_size: Most bytes buffered for each connection through a tunnel in each direction, by default this is 1MB.
+    :type tunnel_buffer_size: ``int``
     '''
-    def __init__(self,encoding='utf8',terminal='vt100',known_hosts=None,ssh_host_key_verification=enums.SSHHostKeyVerify.warn,ssh_keepalive_interval=0.0,auto_terminate_tunnels=False,tcp_nodelay=False):
+    def __init__(self,encoding='utf8',terminal='vt100',known_hosts=None,ssh_host_key_verification=enums.SSHHostKeyVerify.warn,ssh_keepalive_interval=0.0,auto_terminate_tunnels=False,tcp_nodelay=False,tunnel_buffer_size=1048576):
         self.debug = False
         self.__shutdown_all__ = multiprocessing.Event()
         self.tcp_nodelay = tcp_nodelay
+        self.tunnel_buffer_size = tunnel_buffer_size
         self.terminal = terminal
         self.encoding = encoding
         self.request_pty = True
@@ -74,6 +85,18 @@ class BaseClient(object):
         self._auto_select_timeout_enabled = True
         self._select_timeout = 0.005
         self._select_tun_timeout = 0.001
+        self._write_window = 1048576
+        self._read_window = 1048576
+        self.metrics = None
+        self.adaptive_compression = compression.AdaptiveCompression()
+        self.auth_cache = None
+        self._wait_local = threading.local()
+        self._wait_generation = 0
+        self._wait_waiters = 0
+        self._wait_parked = False
+        self._wait_waker = None
+        self._channel_io_owner = None
+        self._channel_io_lock = threading.Lock()
         self.ssh_keepalive_interval = ssh_keepalive_interval
         self.ssh_host_key_verification = ssh_host_key_verification
         if known_hosts==None:
@@ -98,10 +121,265 @@ class BaseClient(object):
         if thread.is_alive()==True:
             thread.join()
 
+    def _close_sock(self):
+        '''
+        Close the session's socket once the session is done with it,
+        clients whose library closes the socket itself override this so the descriptor is not closed twice.
+        '''
+        self.sock.close()
+
+    def _block_directions(self):
+        '''
+        Returns the raw direction flags the underlying session is currently blocked on,
+        clients override this to ask their library. ``0`` means the direction is unknown.
+        '''
+        return(0)
+
+    def _write_buffer(self,data):
+        '''
+        Returns a flat byte ``memoryview`` over ``data`` for ``_block_write``.
+        Anything supporting the buffer protocol can be written, ``str`` is encoded with ``self.encoding`` first.
+        '''
+        if isinstance(data,str):
+            data = data.encode(self.encoding)
+        return(memoryview(data).cast('B'))
+
+    def _write_slice(self,view,offset):
+        '''
+        The SSH libraries only accept ``bytes``, so hand them at most ``self._write_window`` bytes from ``offset``.
+        A short write then only copies what was left of that window again, not everything left to write.
+        '''
+        if offset==0 and isinstance(view.obj,bytes) and len(view.obj)==len(view) and len(view)<=self._write_window:
+            return(view.obj)
+        return(view[offset:offset+self._write_window].tobytes())
+
+    def _read_into(self,func,buffer):
+        '''
+        Fill ``buffer`` from ``func``, which is called with how many bytes are still wanted (capped to ``self._read_window``).
+        Returns the amount of bytes read, this is less than the size of ``buffer`` if EOF was reached first.
+        '''
+        view = memoryview(buffer).cast('B')
+        total_read = 0
+        read = lambda: func(min(len(view)-total_read,self._read_window))
+        read.__wrapped__ = func
+        for data in self._read_iter(read,True,len(view)):
+            view[total_read:total_read+len(data)] = data
+            total_read+=len(data)
+        return(total_read)
+
+    def _metrics_tags(self,func):
+        while True:
+            if isinstance(func,functools.partial):
+                func = func.func
+            elif hasattr(func,'__wrapped__'):
+                func = func.__wrapped__
+            else:
+                break
+        # A fixed label per kind of channel, tagging each channel apart would make a new series for every channel opened.
+        if 'sftp' in type(getattr(func,'__self__',func)).__module__:
+            return({'channel':'sftp'})
+        return({'channel':'channel'})
+
+    def _timed(self,name,func,*args,**kwargs):
+        '''
+        Call ``func`` and report how long it took as ``name`` when metrics are enabled.
+        '''
+        if self.metrics==None:
+            return(func(*args,**kwargs))
+        start = time.perf_counter()
+        try:
+            return(func(*args,**kwargs))
+        finally:
+            self.metrics.observe(name,time.perf_counter()-start)
+
+    def _auth_with(self,hostname,port,username,methods,attempt):
+        '''
+        Try each of ``methods`` with ``attempt`` until one works, starting with the one that worked last time when there is an ``auth_cache``.
+        ``attempt`` returns the method to remember when it worked and ``None`` when it didn't.
+        '''
+        if not self.auth_cache==None:
+            methods = self.auth_cache.order(hostname,port,username,methods)
+        auth_types_tried = []
+        for method in methods:
+            if method[0]=='agent':
+                auth_types_tried.append('publickey')
+            else:
+                auth_types_tried.append(method[0])
+            if not self.metrics==None:
+                self.metrics.increment('auth.attempts',tags={'method':method[0]})
+            worked = attempt(method)
+            if not worked==None:
+                if not self.auth_cache==None:
+                    self.auth_cache.succeeded(hostname,port,username,worked)
+                return(None)
+        if not self.auth_cache==None:
+            self.auth_cache.failed(hostname,port,username)
+        raise(exceptions.AuthenticationFailedException(list(set(auth_types_tried))))
+
+    def _call_measured(self,func,args,kwargs):
+        start = time.perf_counter()
+        with self.session._block_lock:
+            acquired = time.perf_counter()
+            try:
+                return(func(*args,**kwargs))
+            finally:
+                self._wait_generation+=1
+                self._wait_local.generation = self._wait_generation
+                if self._wait_parked==True:
+                    self._wait_wake()
+                self.metrics.observe('lock.wait',acquired-start)
+                self.metrics.observe('lock.hold',time.perf_counter()-acquired)
+
+    def _call(self,func,*args,**kwargs):
+        '''
+        Call into the SSH library while holding the session lock.
+        Any thread parked without a timeout in :func:`redssh.clients.base_client.BaseClient._block_select`
+        is woken up afterwards as this call may have consumed data meant for that thread.
+        '''
+        if not self.metrics==None:
+            return(self._call_measured(func,args,kwargs))
+        with self.session._block_lock:
+            try:
+                return(func(*args,**kwargs))
+            finally:
+                self._wait_generation+=1
+                self._wait_local.generation = self._wait_generation
+                if self._wait_parked==True:
+                    self._wait_wake()
+
+    def _wait_wake(self):
+        if not self._wait_waker==None:
+            try:
+                self._wait_waker[1].send(b'\x00')
+            except (BlockingIOError,OSError):
+                pass
+
+    def _wait_selector(self,events,park):
+        local = self._wait_local
+        if not getattr(local,'sock',None) is self.sock:
+            if not getattr(local,'selector',None)==None:
+                local.selector.close()
+            local.selector = selectors.DefaultSelector()
+            local.selector.register(self.sock,events)
+            local.sock = self.sock
+            local.events = events
+            local.waker = None
+        elif not local.events==events:
+            local.selector.modify(self.sock,events)
+            local.events = events
+        waker = None
+        if park==True:
+            waker = self._wait_waker[0]
+        if not local.waker is waker:
+            if not local.waker==None:
+                local.selector.unregister(local.waker)
+            if not waker==None:
+                local.selector.register(waker,selectors.EVENT_READ)
+            local.waker = waker
+        return(local.selector)
+
+    def _wait_close(self):
+        local = self._wait_local
+        if not getattr(local,'selector',None)==None:
+            local.selector.close()
+        self._wait_local = threading.local()
+        if not self._wait_waker==None:
+            for sock in self._wait_waker:
+                sock.close()
+            self._wait_waker = None
+        self._wait_parked = False
+        self._wait_waiters = 0
+
+    def _wait_prepare(self,_select_timeout=None):
+        '''
+        Register this thread as waiting on the session socket.
+
+        When this thread is the only one using the session and nothing has touched the session since this thread's
+        last library call, it can park on socket readiness without a timeout.
+        Otherwise another thread may have consumed the data this thread is waiting on,
+        so the wait is bounded by ``_select_timeout`` or ``self._select_timeout`` like it always used to be.
+
+        :return: ``tuple (int, bool, float)`` - of ``(events, park, _select_timeout)``, pass ``park`` to :func:`redssh.clients.base_client.BaseClient._wait_finish` once done waiting.
+        '''
+        events = 0
+        with self.session._block_lock:
+            block_direction = self._block_directions()
+            if block_direction & self.enums.Poll.read:
+                events|=selectors.EVENT_READ
+            if block_direction & self.enums.Poll.write:
+                events|=selectors.EVENT_WRITE
+            park = (_select_timeout==None and events>0 and self._wait_waiters==0 and self._wait_parked==False and
+                getattr(self._wait_local,'generation',None)==self._wait_generation)
+            if park==True:
+                if self._wait_waker==None:
+                    self._wait_waker = socket.socketpair()
+                    for sock in self._wait_waker:
+                        sock.setblocking(False)
+                self._wait_parked = True
+            elif _select_timeout==None:
+                _select_timeout = self._select_timeout
+            self._wait_waiters+=1
+        if events==0:
+            events = selectors.EVENT_READ
+        return((events,park,_select_timeout))
+
+    def _wait_finish(self,park):
+        with self.session._block_lock:
+            self._wait_waiters-=1
+            if park==True:
+                self._wait_parked = False
+
+    def _wait_drain(self):
+        try:
+            while len(self._wait_waker[0].recv(4096))>0:
+                pass
+        except (BlockingIOError,OSError):
+            pass
+
     def _block_select(self,_select_timeout=None):
-        if _select_timeout==None:
-            _select_timeout = self._select_timeout
-        self.session._block_call(_select_timeout)
+        '''
+        Wait until the session socket is ready in the direction the session is blocked on.
+        See :func:`redssh.clients.base_client.BaseClient._wait_prepare` for how long this waits.
+        '''
+        (events,park,_select_timeout) = self._wait_prepare(_select_timeout)
+        if not self.metrics==None:
+            start = time.perf_counter()
+        try:
+            for (key,mask) in self._wait_selector(events,park).select(_select_timeout):
+                if park==True and key.fileobj is self._wait_waker[0]:
+                    self._wait_drain()
+        finally:
+            self._wait_finish(park)
+            if not self.metrics==None:
+                self.metrics.increment('select.calls')
+                self.metrics.observe('select.wait',time.perf_counter()-start)
+
+    def _channel_io(self):
+        '''
+        The :class:`redssh.clients.channel_io.ChannelIO` that runs the tunnels for this session, started on first use.
+        '''
+        with self._channel_io_lock:
+            if self._channel_io_owner==None or self._channel_io_owner._thread.is_alive()==False:
+                self._channel_io_owner = channel_io.ChannelIO(self,self.tunnel_buffer_size)
+            return(self._channel_io_owner)
+
+    def _channel_io_stop(self):
+        with self._channel_io_lock:
+            if not self._channel_io_owner==None:
+                self._channel_io_owner.stop()
+                self._channel_io_owner = None
+
+    def _method_preferences(self,method_profile,method_preferences):
+        '''
+        The preferences of ``method_profile`` for this client's SSH library, overridden by any explicit ``method_preferences``.
+        '''
+        preferences = {}
+        if not method_profile==None:
+            for (kind,pref) in enums.METHOD_PROFILES[enums.MethodProfile(method_profile)].items():
+                for method_type in self.enums.MethodPreference[kind.value].value:
+                    preferences[method_type] = pref
+        preferences.update(method_preferences)
+        return(preferences)
 
     def before_connect_options(self):
         pass
@@ -109,6 +387,78 @@ class BaseClient(object):
     def after_connect_options(self):
         pass
 
+    def _exec_read(self,channel,size=None):
+        '''
+        Read whatever is waiting on ``channel`` without blocking, up to ``size`` bytes if given or the library's default otherwise.
+        Returns ``None`` once the channel is at ``EOF`` and ``b''`` if there is just nothing to read yet.
+        '''
+        args = ()
+        if not size==None:
+            args = (size,)
+        try:
+            (size,data) = self._call(getattr(channel,self.enums.Channel.read.value),*args)
+        except self.enums.Exceptions.EOF.value:
+            return(None)
+        if size>0:
+            if not self.metrics==None:
+                self.metrics.observe('read.bytes',size,self._metrics_tags(channel))
+            return(data[:size])
+        if self._call(getattr(channel,self.enums.Channel.eof.value))==True:
+            return(None)
+        return(b'')
+
+    def execute_many(self,commands,env=None,pty=False,max_channels=8):
+        '''
+        Run several commands at the same time, each on its own channel of this session.
+        All of the channels are serviced from one loop that only waits on the session's socket when none of them had anything to do.
+
+        :param commands: Commands to execute.
+        :type commands: ``list``
+        :param env: Environment variables to set for every command.
+        :type env: ``dict``
+        :param pty: Request a pty for the commands to be executed via.
+        :type pty: ``bool``
+        :param max_channels: Maximum amount of channels to have open at once, the remaining commands are started as earlier ones finish.
+        :type max_channels: ``int``
+        :return: ``list`` - of ``tuple (int, str)`` - of ``(return_code, command_output)`` in the same order as ``commands``
+        '''
+        if env==None:
+            env = {}
+        return(self._exec_all([functools.partial(self._exec_channel,command,env,pty) for command in commands],max_channels))
+
+    def _exec_all(self,starts,max_channels):
+        results = [None]*len(starts)
+        pending = collections.deque(enumerate(starts))
+        running = []
+        while (len(pending)>0 or len(running)>0) and self.__shutdown_all__.is_set()==False:
+            while len(pending)>0 and len(running)<max(max_channels,1):
+                (index,start) = pending.popleft()
+                running.append((index,start(),[],[False]))
+            progress = False
+            for job in list(running):
+                (index,channel,out,at_eof) = job
+                if at_eof[0]==False:
+                    # libssh2 won't report EOF while there is stderr left unread and a full stderr window stalls the command, so it is read and thrown away.
+                    if len(self._exec_read_stderr(channel))>0:
+                        progress = True
+                    data = self._exec_read(channel)
+                    if data==None:
+                        at_eof[0] = True
+                    elif len(data)>0:
+                        out.append(data)
+                        progress = True
+                        continue
+                    else:
+                        continue
+                ret = self._exec_exit_status(channel)
+                if not ret==None:
+                    results[index] = (ret,b''.join(out))
+                    running.remove(job)
+                    progress = True
+            if progress==False:
+                self._block_select()
+        return(results)
+
     def local_tunnel(self,local_port,remote_host,remote_port,bind_addr='127.0.0.1',error_level=enums.TunnelErrorLevel.warn):
         '''
 
@@ -125,34 +475,18 @@ class BaseClient(object):
         :type remote_port: ``int``
         :param bind_addr: The bind address on this machine to bind to for the local port.
         :type bind_addr: ``str``
-        :param error_level: The level of verbosity that errors in tunnel threads will use.
+        :param error_level: The level of verbosity that errors in tunnels will use.
         :type error_level: :class:`redssh.enums.TunnelErrorLevel`
         :return: ``int`` The local port that has been bound.
         '''
         if isinstance(remote_host,type('')) and isinstance(remote_port,type(0)):
             option_string = str(bind_addr)+':'+str(local_port)+':'+remote_host+':'+str(remote_port)
             if not option_string in self.tunnels[enums.TunnelType.local]:
-                wait_for_chan = threading.Event()
-                thread_terminate = threading.Event()
-
-                class SubHander(self._modules.tunneling.LocalPortServerHandler):
-                    ssh_session = self
-                    chain_host = remote_host
-                    chain_port = remote_port
-                    terminate = thread_terminate
-                    wchan = wait_for_chan
-
-                tun_server = self._modules.tunneling.LocalPortServer((bind_addr,local_port),SubHander,self,thread_terminate,remote_host,remote_port,wait_for_chan,error_level)
-                tun_thread = threading.Thread(target=tun_server.serve_forever)
-                tun_thread.daemon = True
-                tun_thread.name = enums.TunnelType.local+':'+option_string
-                tun_thread.start()
-                wait_for_chan.wait()
+                forward = self._channel_io().listen(enums.TunnelType.local,bind_addr,local_port,(remote_host,remote_port),error_level)
                 if local_port==0:
-                    local_port = tun_server.socket.getsockname()[1]
+                    local_port = forward.port
                     option_string = str(bind_addr)+':'+str(local_port)+':'+remote_host+':'+str(remote_port)
-                    tun_thread.name = enums.TunnelType.local+':'+option_string
-                self.tunnels[enums.TunnelType.local][option_string] = (tun_thread,thread_terminate,tun_server,local_port)
+                self.tunnels[enums.TunnelType.local][option_string] = (forward,forward.terminate,None,local_port)
             return(local_port)
 
     def remote_tunnel(self,local_port,remote_host,remote_port,bind_addr='127.0.0.1',error_level=enums.TunnelErrorLevel.warn):
@@ -166,20 +500,14 @@ class BaseClient(object):
         :type remote_host: ``str``
         :param remote_port: The remote host's port to connect to via the local machine.
         :type remote_port: ``int``
-        :param error_level: The level of verbosity that errors in tunnel threads will use.
+        :param error_level: The level of verbosity that errors in tunnels will use.
         :type error_level: :class:`redssh.enums.TunnelErrorLevel`
         :return: ``None``
         '''
         option_string = str(bind_addr)+':'+str(local_port)+':'+remote_host+':'+str(remote_port)
         if not option_string in self.tunnels[enums.TunnelType.remote]:
-            wait_for_chan = threading.Event()
-            thread_terminate = threading.Event()
-            tun_thread = threading.Thread(target=self._modules.tunneling.remote_tunnel_server,args=(self,remote_host,remote_port,bind_addr,local_port,thread_terminate,wait_for_chan,error_level))
-            tun_thread.daemon = True
-            tun_thread.name = enums.TunnelType.remote+':'+option_string
-            tun_thread.start()
-            wait_for_chan.wait()
-            self.tunnels[enums.TunnelType.remote][option_string] = (tun_thread,thread_terminate,None,None)
+            forward = self._channel_io().remote(bind_addr,local_port,(remote_host,remote_port),error_level)
+            self.tunnels[enums.TunnelType.remote][option_string] = (forward,forward.terminate,None,None)
         return(None)
 
     def dynamic_tunnel(self,local_port,bind_addr='127.0.0.1',error_level=enums.TunnelErrorLevel.warn):
@@ -194,33 +522,17 @@ class BaseClient(object):
         :type local_port: ``int``
         :param bind_addr: The bind address on this machine to bind to for the local port.
         :type bind_addr: ``str``
-        :param error_level: The level of verbosity that errors in tunnel threads will use.
+        :param error_level: The level of verbosity that errors in tunnels will use.
         :type error_level: :class:`redssh.enums.TunnelErrorLevel`
         :return: ``int`` The local port that has been bound.
         '''
         option_string = bind_addr+':'+str(local_port)
         if not option_string in self.tunnels[enums.TunnelType.dynamic]:
-            wait_for_chan = threading.Event()
-            thread_terminate = threading.Event()
-
-            class SubHander(self._modules.tunneling.LocalPortServerHandler):
-                ssh_session = self
-                chain_host = None
-                chain_port = None
-                terminate = thread_terminate
-                wchan = wait_for_chan
-
-            tun_server = self._modules.tunneling.LocalPortServer((bind_addr,local_port),SubHander,self,thread_terminate,None,None,wait_for_chan,error_level)
-            tun_thread = threading.Thread(target=tun_server.serve_forever)
-            tun_thread.daemon = True
-            tun_thread.name = enums.TunnelType.dynamic+':'+option_string
-            tun_thread.start()
-            wait_for_chan.wait()
+            forward = self._channel_io().listen(enums.TunnelType.dynamic,bind_addr,local_port,None,error_level)
             if local_port==0:
-                local_port = tun_server.socket.getsockname()[1]
+                local_port = forward.port
                 option_string = bind_addr+':'+str(local_port)
-                tun_thread.name = enums.TunnelType.dynamic+':'+option_string
-            self.tunnels[enums.TunnelType.dynamic][option_string] = (tun_thread,thread_terminate,tun_server,local_port)
+            self.tunnels[enums.TunnelType.dynamic][option_string] = (forward,forward.terminate,None,local_port)
         return(local_port)
 
     def tunnel_is_alive(self,tunnel_type,sport,rhost=None,rport=None,bind_addr='127.0.0.1'):
@@ -318,6 +630,8 @@ class BaseClient(object):
         '''
         if self.past_login==True:
             self.__shutdown_all__.set()
+            self._wait_wake()
+            self._channel_io_stop()
             self.close_tunnels()
             self.close_tunnels()
             if self.__check_for_attr__('sftp')==True:
@@ -331,7 +645,8 @@ class BaseClient(object):
                 self._block(self.session.disconnect)
             except:
                 pass
-            self.sock.close()
+            self._close_sock()
+            self._wait_close()
             del self.channel,self._ssh_keepalive_thread
             del self.session
             del self.sock
@@ -345,3 +660,15 @@ class BaseClient(object):
                 enums.TunnelType.x11:{}
             }
             self.past_login = False
+        elif self.__check_for_attr__('sock')==True:
+            # A connect that failed part way through leaves its socket, and maybe its session, behind.
+            if not self._ssh_keepalive_thread==None:
+                self.__shutdown_thread__(self._ssh_keepalive_thread,self._ssh_keepalive_event,None)
+                self._ssh_keepalive_thread = None
+                self._ssh_keepalive_event = None
+            if self.__check_for_attr__('session')==True:
+                self._close_sock()
+                del self.session
+            else:
+                self.sock.close()
+            del self.sock
@@ -1,5 +1,203 @@
 
+import os
+import stat
+import shlex
+import hashlib
+
 from redssh import utils
+from redssh import enums
+from redssh.clients.base_transfer import BaseTransfer
+
+
+class BaseSFTP(BaseTransfer):
+    '''
+    Shared parts of the SFTP clients.
+    '''
+    def get_folder(self,remote_path,local_path,workers=1,tar=False,compression=enums.Compression.none):
+        '''
+        Download an entire folder via SFTP from the remote session. Similar to ``cp -r /target/* /files``
+        Also retains file permissions and modification times.
+        Only directories and regular files are downloaded, symlinks and other special files are skipped.
+
+        The whole remote tree is listed and created locally first, then the files are downloaded.
+        With ``workers`` above ``1`` that many files are downloaded at once, each over its own SFTP channel on this session.
+        With ``tar`` the tree is unpacked from a tar archive as it arrives, which is much faster for trees of many small files.
+        The libssh client always downloads one file at a time, see `redssh.sftp.RedSFTP.put_folder`.
+
+        :param remote_path: The remote path to download from.
+        :type remote_path: ``str``
+        :param local_path: The local path, on the machine where your code is running from, to download the ``remote_path`` to.
+        :type local_path: ``str``
+        :param workers: The number of files to download at once.
+        :type workers: ``int``
+        :param tar: Stream the whole tree as one tar archive from ``tar -c`` on the remote server instead of downloading file by file, needs ``tar`` on the remote server.
+        :type tar: ``bool``
+        :param compression: With ``tar``, gzip the archive on its way over the session. ``auto`` chooses from how well the start of the tree
+            compresses and the link speed measured by earlier transfers on this session, see :mod:`redssh.compression`.
+        :type compression: :class:`redssh.enums.Compression`
+        '''
+        if tar==True:
+            self._tar_get_folder(remote_path,local_path,compression)
+            return
+        dirs = [(remote_path,local_path,self.stat(remote_path))]
+        files = []
+        os.makedirs(local_path,exist_ok=True)
+        for (remote_dir_path,local_dir_path,dir_attrs) in dirs:
+            for (name,attrs) in self._read_dir(remote_dir_path):
+                if name in ('.','..'):
+                    continue
+                remote_entry_path = os.path.join(remote_dir_path,name)
+                local_entry_path = os.path.join(local_dir_path,name)
+                if stat.S_ISDIR(attrs.permissions):
+                    os.makedirs(local_entry_path,exist_ok=True)
+                    dirs.append((remote_entry_path,local_entry_path,attrs))
+                elif stat.S_ISREG(attrs.permissions):
+                    files.append((remote_entry_path,local_entry_path))
+        self._parallel(workers,'get_file',files)
+        # Deepest first, so the files going into a directory can't change its time or be stopped by its mode.
+        for (remote_dir_path,local_dir_path,dir_attrs) in reversed(dirs):
+            os.chmod(local_dir_path,dir_attrs.permissions & 0o7777)
+            os.utime(local_dir_path,(dir_attrs.atime,dir_attrs.mtime))
+
+    def _attrs_size(self,attrs):
+        return(attrs.size)
+
+    def _sync_folder(self,local_path,remote_path,workers,checksum,delete):
+        '''
+        The ``sync`` mode of ``put_folder``, every remote directory is listed once and only files that are missing
+        or differ from the local file are uploaded.
+        '''
+        files = []
+        compare = []
+        created = set()
+        for (dirpath,dirnames,filenames) in os.walk(local_path):
+            remote_dir_path = os.path.normpath(os.path.join(remote_path,os.path.relpath(dirpath,local_path)))
+            remote_entries = {}
+            if not remote_dir_path in created:
+                remote_entries = dict(self._read_dir(remote_dir_path))
+            for dirname in sorted(dirnames):
+                remote_dir_entry = os.path.join(remote_dir_path,dirname)
+                attrs = remote_entries.get(dirname)
+                if attrs==None or stat.S_ISDIR(attrs.permissions)==False:
+                    if not attrs==None:
+                        self._remove_tree(remote_dir_entry,attrs)
+                    self.mkdir(remote_dir_entry,os.stat(os.path.join(dirpath,dirname)).st_mode)
+                    created.add(remote_dir_entry)
+            for filename in filenames:
+                local_file_path = os.path.join(dirpath,filename)
+                remote_file_path = os.path.join(remote_dir_path,filename)
+                local_stat = os.stat(local_file_path)
+                attrs = remote_entries.get(filename)
+                if attrs==None or stat.S_ISREG(attrs.permissions)==False:
+                    if not attrs==None:
+                        self._remove_tree(remote_file_path,attrs)
+                    files.append((local_file_path,remote_file_path))
+                elif not self._attrs_size(attrs)==local_stat.st_size:
+                    files.append((local_file_path,remote_file_path))
+                elif checksum==True:
+                    compare.append((local_file_path,remote_file_path))
+                elif not int(attrs.mtime)==int(local_stat.st_mtime):
+                    files.append((local_file_path,remote_file_path))
+            if delete==True:
+                for name in remote_entries:
+                    if not name in ('.','..') and not name in dirnames and not name in filenames:
+                        self._remove_tree(os.path.join(remote_dir_path,name),remote_entries[name])
+        if len(compare)>0:
+            remote_hashes = self._remote_hashes([remote_file_path for (local_file_path,remote_file_path) in compare])
+            for (local_file_path,remote_file_path) in compare:
+                if not remote_hashes.get(remote_file_path)==self._local_hash(local_file_path):
+                    files.append((local_file_path,remote_file_path))
+        self._parallel(workers,'put_file',files)
+
+    def _remove_tree(self,remote_path,attrs):
+        if stat.S_ISDIR(attrs.permissions):
+            for (name,entry_attrs) in self._read_dir(remote_path):
+                if not name in ('.','..'):
+                    self._remove_tree(os.path.join(remote_path,name),entry_attrs)
+            self.rmdir(remote_path)
+        else:
+            self.unlink(remote_path)
+
+    def _remote_hashes(self,remote_paths,batch_size=256):
+        '''
+        SHA-256 hashes of ``remote_paths`` from ``sha256sum`` on the remote server, a batch of paths per command.
+        Paths that couldn't be hashed are left out.
+        '''
+        hashes = {}
+        for start in range(0,len(remote_paths),batch_size):
+            command = 'sha256sum -- '+' '.join([shlex.quote(path) for path in remote_paths[start:start+batch_size]])
+            (ret,out) = self.ssh_session.execute_command(command)
+            for line in out.splitlines():
+                if b'  ' in line:
+                    (digest,path) = line.split(b'  ',1)
+                    hashes[path.decode('utf8')] = digest.decode('utf8')
+        return(hashes)
+
+    def _resume_offset(self,local_path,remote_path,partial_size,complete_size,resume_check):
+        '''
+        Where a transfer that was interrupted after ``partial_size`` bytes of a ``complete_size`` byte file can carry on from.
+        The last ``resume_check`` bytes of the partial file are compared between ``local_path`` and ``remote_path`` first.
+        Returns ``0`` so the transfer starts over when they differ or the partial file is larger than the complete one.
+        '''
+        if partial_size>complete_size:
+            return(0)
+        check_size = min(resume_check,partial_size)
+        if check_size>0:
+            with open(local_path,'rb') as local_file:
+                local_file.seek(partial_size-check_size)
+                local_data = local_file.read(check_size)
+            if not local_data==self._read_range(remote_path,partial_size-check_size,check_size):
+                return(0)
+        return(partial_size)
+
+    def _remote_block_hashes(self,remote_path,block_size):
+        '''
+        SHA-256 hashes of every ``block_size`` block of ``remote_path``, worked out on the remote server by GNU ``split``.
+
+        :return: ``list`` of ``str`` or ``None`` if the remote server couldn't hash the file.
+        '''
+        (ret,out) = self.ssh_session.execute_command('split -b '+str(int(block_size))+' --filter=sha256sum -- '+shlex.quote(remote_path))
+        if not ret==0:
+            return(None)
+        return([line.split(b' ',1)[0].decode('utf8') for line in out.splitlines()])
+
+    def _changed_blocks(self,local_path,remote_hashes,block_size):
+        '''
+        Yields ``tuple (int, bytes)`` of ``(offset, data)`` for every ``block_size`` block of ``local_path`` that doesn't match ``remote_hashes``.
+        '''
+        with open(local_path,'rb') as local_file:
+            index = 0
+            data = local_file.read(block_size)
+            while len(data)>0:
+                if index>=len(remote_hashes) or not hashlib.sha256(data).hexdigest()==remote_hashes[index]:
+                    yield((index*block_size,data))
+                index+=1
+                data = local_file.read(block_size)
+
+    def _local_hash(self,local_path):
+        digest = hashlib.sha256()
+        with open(local_path,'rb') as local_file:
+            data = local_file.read(1048576)
+            while len(data)>0:
+                digest.update(data)
+                data = local_file.read(1048576)
+        return(digest.hexdigest())
+
+    def _worker_pool(self,workers):
+        '''
+        Get ``workers`` SFTP clients on this session, this client being the first one.
+        Extra clients each have their own SFTP channel, they are opened on first use and kept for later transfers.
+        '''
+        if utils.check_for_attr(self,'_workers')==False:
+            self._workers = []
+        pool = self._workers
+        while len(pool)<workers-1:
+            pool.append(self.__class__(self.ssh_session))
+        for worker in pool:
+            worker.enable_fsync = self.enable_fsync
+            worker.ignore_existing_dirs = self.ignore_existing_dirs
+        return([self]+pool[:workers-1])
+
 
 class RedSFTPFile(object):
     '''
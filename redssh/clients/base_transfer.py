@@ -0,0 +1,274 @@
+# RedSSH
+# Copyright (C) 2018 - 2022 Red_M ( http://bitbucket.com/Red_M )
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import time
+import shlex
+import zlib
+import tarfile
+import threading
+import collections
+
+from redssh import enums
+from redssh import exceptions
+
+
+class BaseTransfer(object):
+    '''
+    Shared parts of the SFTP and SCP clients for moving many files or whole trees: running transfers over several
+    channels at once and streaming a tree as a tar archive through ``tar`` on the remote server.
+    '''
+    _concurrent_channels = True
+    _tar_buffer_size = 262144
+
+    def _worker_pool(self,workers):
+        '''
+        Get ``workers`` clients to run transfers with, this client being the first one.
+        By default every transfer opens a channel of its own so this client is used for all of them.
+        '''
+        return([self]*workers)
+
+    def _tar_put_folder(self,local_path,remote_path,compression):
+        '''
+        The ``tar`` mode of ``put_folder``, ``local_path`` is archived as it is walked and the archive is streamed
+        straight into ``tar -x`` on the remote server, so the whole tree costs one channel instead of several round trips per file.
+        '''
+        start = time.perf_counter()
+        upload = _TarUpload(self,remote_path,compression)
+        with tarfile.open(fileobj=upload,mode='w|',bufsize=self._tar_buffer_size) as tar:
+            tar.add(local_path,arcname='.')
+        upload.close()
+        self._tar_finish(_ChannelReader(self.ssh_session,upload.channel),upload.command)
+        self._tar_record_link(upload.wire_bytes,time.perf_counter()-start,upload.gzip)
+
+    def _tar_get_folder(self,remote_path,local_path,compression):
+        '''
+        The ``tar`` mode of ``get_folder``, ``tar -c`` on the remote server streams the tree back over one channel
+        and it is unpacked into ``local_path`` as it arrives.
+        '''
+        start = time.perf_counter()
+        quoted_path = shlex.quote(remote_path)
+        ratio = None
+        if compression==enums.Compression.auto:
+            # Only the remote server can see the data, so it measures how well the start of the archive compresses.
+            sample = 'tar -c -f - -C '+quoted_path+' . 2>/dev/null | head -c '+str(self.ssh_session.adaptive_compression.sample_size)
+            (ret,out) = self.ssh_session.execute_command('echo $('+sample+' | wc -c) $('+sample+' | gzip -1 | wc -c)')
+            sizes = out.split()
+            if len(sizes)==2 and int(sizes[0])>0:
+                ratio = int(sizes[1])/int(sizes[0])
+        gzip = self._tar_gzip(compression,ratio)
+        if gzip==True:
+            command = 'tar -c -z -f - -C '+quoted_path+' .'
+        else:
+            command = 'tar -c -f - -C '+quoted_path+' .'
+        channel = self.ssh_session._exec_channel(command,{},False)
+        os.makedirs(local_path,exist_ok=True)
+        reader = _ChannelReader(self.ssh_session,channel)
+        try:
+            with tarfile.open(fileobj=reader,mode='r|gz' if gzip==True else 'r|',bufsize=self._tar_buffer_size) as tar:
+                if hasattr(tarfile,'tar_filter'):
+                    tar.extraction_filter = tarfile.tar_filter
+                # Pythons without extraction filters unpack whatever the archive says, so every member is checked here as well.
+                tar.extractall(local_path,members=self._tar_safe_members(tar,local_path))
+        except (tarfile.ReadError,exceptions.UnsafeArchiveMemberException):
+            # A failed ``tar -c`` sends nothing usable, report its exit status and error instead.
+            # After an unsafe member the rest of the archive is read and thrown away so the channel is closed cleanly.
+            self._tar_finish(reader,command)
+            raise
+        self._tar_finish(reader,command)
+        self._tar_record_link(reader.read_bytes,time.perf_counter()-start,gzip)
+
+    def _tar_safe_members(self,tar,local_path):
+        '''
+        Members of ``tar`` as it is read, raising `redssh.exceptions.UnsafeArchiveMemberException` for an absolute path,
+        a ``..`` component, a device or a link that points outside of ``local_path``.
+        '''
+        root = os.path.realpath(local_path)
+        def inside(path):
+            return(os.path.commonpath([root,os.path.realpath(path)])==root)
+        for member in tar:
+            target = os.path.join(root,member.name)
+            safe = os.path.isabs(member.name)==False and not '..' in member.name.split('/') and inside(target) and member.isdev()==False
+            if safe==True and member.issym()==True:
+                safe = os.path.isabs(member.linkname)==False and inside(os.path.join(os.path.dirname(target),member.linkname))
+            elif safe==True and member.islnk()==True:
+                safe = os.path.isabs(member.linkname)==False and inside(os.path.join(root,member.linkname))
+            if safe==False:
+                raise(exceptions.UnsafeArchiveMemberException(member.name,local_path))
+            yield(member)
+
+    def _tar_gzip(self,compression,ratio):
+        '''
+        Whether a tar transfer should be gzip compressed, with ``compression`` set to auto
+        this is up to the session's `redssh.compression.AdaptiveCompression` and ``ratio``, ``None`` if it couldn't be measured.
+        '''
+        if compression==enums.Compression.auto:
+            gzip = False
+            if not ratio==None:
+                gzip = self.ssh_session.adaptive_compression.choose(ratio)
+                if not self.ssh_session.metrics==None:
+                    self.ssh_session.metrics.observe('compression.ratio',ratio)
+        else:
+            gzip = compression==enums.Compression.gzip
+        if not self.ssh_session.metrics==None:
+            self.ssh_session.metrics.increment('compression.choice',tags={'compression':'gzip' if gzip==True else 'none'})
+        return(gzip)
+
+    def _tar_record_link(self,wire_bytes,seconds,gzip):
+        throughput = self.ssh_session.adaptive_compression.record_link(wire_bytes,seconds,gzip)
+        if not throughput==None and not self.ssh_session.metrics==None:
+            self.ssh_session.metrics.observe('link.throughput',throughput,{'compression':'gzip' if gzip==True else 'none'})
+
+    def _tar_finish(self,reader,command):
+        out = []
+        data = reader.read()
+        while len(data)>0:
+            out.append(data)
+            data = reader.read()
+        ret = self.ssh_session._exec_exit_status(reader.channel)
+        while ret==None and self.ssh_session.__shutdown_all__.is_set()==False:
+            self.ssh_session._block_select()
+            ret = self.ssh_session._exec_exit_status(reader.channel)
+        if not ret==0:
+            raise(exceptions.RemoteCommandFailedException(command,ret,b''.join(out+reader.stderr)))
+
+    def _parallel(self,workers,func_name,jobs):
+        '''
+        Run ``func_name`` for every ``tuple`` of arguments in ``jobs``, spread over up to ``workers`` channels.
+        Each channel works through the remaining jobs in its own thread, all of them sharing this session.
+        The first error stops any jobs that have not started yet and is raised once every thread has finished.
+        '''
+        jobs = collections.deque(jobs)
+        if self._concurrent_channels==False:
+            workers = 1
+        workers = max(1,min(workers,len(jobs)))
+        if workers==1:
+            while len(jobs)>0 and self.ssh_session.__shutdown_all__.is_set()==False:
+                getattr(self,func_name)(*jobs.popleft())
+            return
+        errors = []
+        def run(worker):
+            while len(errors)==0 and self.ssh_session.__shutdown_all__.is_set()==False:
+                try:
+                    job = jobs.popleft()
+                except IndexError:
+                    break
+                try:
+                    getattr(worker,func_name)(*job)
+                except Exception as e:
+                    errors.append(e)
+        threads = []
+        for worker in self._worker_pool(workers):
+            thread = threading.Thread(target=run,args=(worker,))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        if len(errors)>0:
+            raise(errors[0])
+
+
+class _TarUpload(object):
+    '''
+    Minimal file object for `tarfile` that streams the archive into ``tar -x`` on the remote server.
+    The channel is only started once the compression is chosen, with auto compression the first
+    `redssh.compression.AdaptiveCompression.sample_size` bytes are held back and sampled for that.
+    '''
+    def __init__(self,transfer,remote_path,compression):
+        self.transfer = transfer
+        self.ssh_session = transfer.ssh_session
+        self.remote_path = remote_path
+        self.compression = compression
+        self.sample_size = 0
+        if compression==enums.Compression.auto:
+            self.sample_size = self.ssh_session.adaptive_compression.sample_size
+        self.sample = []
+        self.sample_len = 0
+        self.channel = None
+        self.command = None
+        self.compressor = None
+        self.gzip = False
+        self.wire_bytes = 0
+
+    def _start(self):
+        sample = b''.join(self.sample)
+        self.sample = []
+        ratio = None
+        if self.compression==enums.Compression.auto:
+            ratio = self.ssh_session.adaptive_compression.sample(sample)
+        self.gzip = self.transfer._tar_gzip(self.compression,ratio)
+        quoted_path = shlex.quote(self.remote_path)
+        if self.gzip==True:
+            self.compressor = zlib.compressobj(1,zlib.DEFLATED,31)
+            self.command = 'mkdir -p -- '+quoted_path+' && tar -x -z -o -p -f - -C '+quoted_path+' 2>&1'
+        else:
+            self.command = 'mkdir -p -- '+quoted_path+' && tar -x -o -p -f - -C '+quoted_path+' 2>&1'
+        self.channel = self.ssh_session._exec_channel(self.command,{},False)
+        self._send(sample)
+
+    def _send(self,data):
+        if not self.compressor==None:
+            data = self.compressor.compress(data)
+        if len(data)>0:
+            self.wire_bytes+=len(data)
+            self.ssh_session._block_write(self.channel.write,data)
+
+    def write(self,data):
+        if self.channel==None:
+            self.sample.append(bytes(data))
+            self.sample_len+=len(data)
+            if self.sample_len>=self.sample_size:
+                self._start()
+        else:
+            self._send(data)
+
+    def close(self):
+        if self.channel==None:
+            self._start()
+        if not self.compressor==None:
+            data = self.compressor.flush()
+            self.wire_bytes+=len(data)
+            self.ssh_session._block_write(self.channel.write,data)
+        self.ssh_session._block(self.channel.send_eof)
+
+
+class _ChannelReader(object):
+    '''
+    Minimal file object for `tarfile` that reads the stdout of an exec channel, returning ``b''`` once it is at ``EOF``.
+    Anything the command writes to stderr is kept in ``stderr``.
+    '''
+    def __init__(self,ssh_session,channel):
+        self.ssh_session = ssh_session
+        self.channel = channel
+        self.stderr = []
+        self.read_bytes = 0
+
+    def read(self,size=None):
+        data = self.ssh_session._exec_read(self.channel,size)
+        while data==b'' and self.ssh_session.__shutdown_all__.is_set()==False:
+            # Unread stderr keeps the channel from reaching EOF.
+            stderr = self.ssh_session._exec_read_stderr(self.channel)
+            if len(stderr)>0:
+                self.stderr.append(stderr)
+            else:
+                self.ssh_session._block_select()
+            data = self.ssh_session._exec_read(self.channel,size)
+        if data==None:
+            return(b'')
+        self.read_bytes+=len(data)
+        return(data)
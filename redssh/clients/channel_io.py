@@ -0,0 +1,654 @@
+# RedSSH
+# Copyright (C) 2018 - 2022 Red_M ( http://bitbucket.com/Red_M )
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import sys
+import time
+import errno
+import socket
+import struct
+import selectors
+import threading
+import traceback
+import collections
+
+from redssh import enums
+
+
+SOCKS_VERSION = 5
+
+STREAM_SOCKS = 'socks'
+STREAM_OPENING = 'opening'
+STREAM_CONNECTING = 'connecting'
+STREAM_OPEN = 'open'
+STREAM_FAILED = 'failed'
+STREAM_CLOSED = 'closed'
+
+
+class Forward(object):
+    '''
+    A tunnel that is accepting connections, either a listening socket on this machine or a port forwarded from the remote side.
+    This stands in for the tunnel's thread in ``BaseClient.tunnels`` so it has ``is_alive`` and ``join``.
+    '''
+    def __init__(self,engine,tunnel_type,listener,bind_addr,port,target,error_level):
+        self.engine = engine
+        self.tunnel_type = tunnel_type
+        self.listener = listener
+        self.bind_addr = bind_addr
+        self.port = port
+        self.target = target
+        self.error_level = error_level
+        self.streams = set()
+        self.terminate = threading.Event()
+        self.closed = threading.Event()
+
+    def is_alive(self):
+        return(self.closed.is_set()==False)
+
+    def join(self,timeout=None):
+        self.engine.wake()
+        if self.engine.is_alive()==True:
+            self.closed.wait(timeout)
+
+    def report(self,address):
+        error_level = self.error_level
+        if error_level==enums.TunnelErrorLevel.warn:
+            print('Exception happened during processing of request from',address,file=sys.stderr)
+        elif error_level==enums.TunnelErrorLevel.debug:
+            print('Exception happened during processing of request from',address,file=sys.stderr)
+            traceback.print_exc()
+        elif error_level==enums.TunnelErrorLevel.error:
+            print('-'*40,file=sys.stderr)
+            print('Exception happened during processing of request from',address,file=sys.stderr)
+            traceback.print_exc()
+            print('-'*40,file=sys.stderr)
+        if self.engine.client.auto_terminate_tunnels==True:
+            self.terminate.set()
+
+
+class Stream(object):
+    '''
+    One connection through a tunnel and the data waiting to go each way.
+    '''
+    def __init__(self,forward,sock,address,state):
+        self.forward = forward
+        self.sock = sock
+        self.address = address
+        self.state = state
+        self.target = forward.target
+        self.chan = None
+        self.pending = {}
+        self.socks = bytearray()
+        self.socks_methods = False
+        self.to_sock = bytearray()
+        self.to_chan = bytearray()
+        self.recv_size = forward.engine.min_recv_size
+        self.sock_eof = False
+        self.chan_eof = False
+        self.sock_shut = False
+        self.chan_eof_sent = False
+        self.events = 0
+
+
+class ChannelIO(object):
+    '''
+    Runs every tunnel of a session from a single thread.
+
+    Tunnels used to get a thread per listener plus a thread per connection, each polling the session socket and
+    fighting over the session lock to read its own channel. Instead this thread waits on the session socket,
+    every listening socket and every tunnelled socket with one selector. It accepts connections, does the SOCKS
+    handshake for dynamic tunnels, opens and accepts channels and moves data between each socket and its channel.
+
+    Each connection buffers at most ``buffer_size`` bytes each way. Once a buffer is full the side filling it is not
+    read from until it drains, which leaves the data in the socket's receive buffer or the channel's SSH window.
+
+    Sockets are read into one reused buffer, starting with ``min_recv_size`` bytes per ``recv`` and doubling for as long
+    as reads fill it, up to the session's write window. Everything read from a socket before its channel is written to
+    goes out in one channel write, so a stream of small packets does not turn into a stream of small SSH messages.
+    Channels are read up to however much room is left in their connection's buffer and written up to however much
+    room is left in the remote side's window, so a connection that is stuck in one direction never holds up the other
+    direction or any other connection.
+
+    Only one channel is opened at a time, libssh2 can only track one channel open per session.
+
+    :param client: The client whose session the tunnels belong to.
+    :type client: :class:`redssh.clients.base_client.BaseClient`
+    :param buffer_size: Bytes to buffer per connection in each direction.
+    :type buffer_size: ``int``
+    '''
+    def __init__(self,client,buffer_size=1048576):
+        self.client = client
+        self.tunneling = client._modules.tunneling
+        self.buffer_size = buffer_size
+        self.min_recv_size = min(16384,buffer_size)
+        self.max_recv_size = max(self.min_recv_size,min(buffer_size,client._write_window))
+        self._recv_buffer = memoryview(bytearray(self.max_recv_size))
+        self.idle_timeout = 0.25
+        self.forwards = set()
+        self.streams = set()
+        self.opening = collections.deque()
+        self.closing = []
+        self._dead = []
+        self._commands = collections.deque()
+        self._stop = False
+        self._session_events = 0
+        self._idle = 0
+        self._last_accept = 0.0
+        self._selector = selectors.DefaultSelector()
+        self._waker = socket.socketpair()
+        for sock in self._waker:
+            sock.setblocking(False)
+        self._selector.register(self._waker[0],selectors.EVENT_READ,'waker')
+        self._thread = threading.Thread(target=self._run)
+        self._thread.name = 'channel_io'
+        self._thread.daemon = True
+        self._thread.start()
+
+    def listen(self,tunnel_type,bind_addr,port,target,error_level):
+        '''
+        Start accepting connections on a local port.
+
+        :param tunnel_type: ``local`` to forward every connection to ``target`` or ``dynamic`` to ask each connection where to go via SOCKS.
+        :type tunnel_type: :class:`redssh.enums.TunnelType`
+        :param target: ``tuple (str, int)`` - of ``(host, port)`` for ``local`` tunnels.
+        :return: :class:`redssh.clients.channel_io.Forward`
+        '''
+        listener = socket.socket(socket.AF_INET,socket.SOCK_STREAM)
+        try:
+            listener.setsockopt(socket.SOL_SOCKET,socket.SO_REUSEADDR,1)
+            listener.setsockopt(socket.IPPROTO_TCP,socket.TCP_NODELAY,self.client.tcp_nodelay)
+            listener.bind((bind_addr,port))
+            listener.listen(128)
+            listener.setblocking(False)
+        except Exception:
+            listener.close()
+            raise
+        forward = Forward(self,tunnel_type,listener,bind_addr,listener.getsockname()[1],target,error_level)
+        self._submit(self._add_forward,forward)
+        return(forward)
+
+    def remote(self,bind_addr,port,target,error_level):
+        '''
+        Ask the server to listen on ``port`` and forward every connection it gets to ``target`` from this machine.
+
+        :return: :class:`redssh.clients.channel_io.Forward`
+        '''
+        listener = self.tunneling.remote_listen(self.client,bind_addr,port)
+        forward = Forward(self,enums.TunnelType.remote,listener,bind_addr,port,target,error_level)
+        self._submit(self._add_forward,forward)
+        return(forward)
+
+    def wake(self):
+        try:
+            self._waker[1].send(b'\x00')
+        except (BlockingIOError,OSError):
+            pass
+
+    def stop(self):
+        self._stop = True
+        self.wake()
+        if not self._thread is threading.current_thread():
+            self._thread.join()
+
+    def is_alive(self):
+        return(self._thread.is_alive())
+
+    def _submit(self,func,*args):
+        self._commands.append((func,args))
+        self.wake()
+
+    def _add_forward(self,forward):
+        if not forward.tunnel_type==enums.TunnelType.remote:
+            self._selector.register(forward.listener,selectors.EVENT_READ,forward)
+        self.forwards.add(forward)
+
+    def _report(self,forwards):
+        for forward in forwards:
+            forward.report((forward.bind_addr,forward.port))
+
+    def _run(self):
+        try:
+            block = True
+            while self._stop==False and self.client.__shutdown_all__.is_set()==False:
+                while len(self._commands)>0:
+                    (func,args) = self._commands.popleft()
+                    try:
+                        func(*args)
+                    except Exception:
+                        if func==self._add_forward:
+                            self._report(args)
+                            self._close_forward(args[0])
+                        else:
+                            self._report(list(self.forwards))
+                try:
+                    for forward in list(self.forwards):
+                        if forward.terminate.is_set()==True:
+                            self._close_forward(forward)
+                    (progress,session_ready) = self._handle(self._wait(block))
+                    progress = self._pump(session_ready) or progress
+                    self._release()
+                    block = (progress==False)
+                except Exception:
+                    # Which tunnel this belongs to isn't known so every one hears about it, the loop carries on for the rest.
+                    # Back off before trying again so something that keeps failing doesn't spin.
+                    self._report(list(self.forwards))
+                    time.sleep(self.idle_timeout)
+                    block = True
+        finally:
+            while len(self._commands)>0:
+                (func,args) = self._commands.popleft()
+                if func==self._add_forward:
+                    self._close_forward(args[0])
+            for forward in list(self.forwards):
+                self._close_forward(forward)
+            self._release()
+            self._selector.close()
+            for sock in self._waker:
+                sock.close()
+
+    def _uses_session(self):
+        if len(self.streams)>0 or len(self.closing)>0:
+            return(True)
+        for forward in self.forwards:
+            if forward.tunnel_type==enums.TunnelType.remote:
+                return(True)
+        return(False)
+
+    def _watch(self,fileobj,current,events,data):
+        if current==events:
+            return(events)
+        if current==0:
+            self._selector.register(fileobj,events,data)
+        elif events==0:
+            self._selector.unregister(fileobj)
+        else:
+            self._selector.modify(fileobj,events,data)
+        return(events)
+
+    def _wait(self,block):
+        client = self.client
+        uses_session = self._uses_session()
+        timeout = 0
+        events = 0
+        if block==True:
+            self._idle+=1
+        else:
+            self._idle = 0
+        if uses_session==True:
+            if block==True:
+                # Never park on the session socket, one of this thread's own library calls may have already read
+                # the data another channel was waiting on. Back off instead so an idle session costs next to nothing.
+                (events,park,timeout) = client._wait_prepare(min(client._select_timeout*(2**min(self._idle,16)),self.idle_timeout))
+                if not self.tunneling.accept_interval==None:
+                    for forward in self.forwards:
+                        if forward.tunnel_type==enums.TunnelType.remote:
+                            timeout = min(timeout,self.tunneling.accept_interval)
+                            break
+            else:
+                events = selectors.EVENT_READ
+        elif block==True:
+            timeout = None
+        self._session_events = self._watch(client.sock,self._session_events,events,'session')
+        try:
+            return(self._selector.select(timeout))
+        finally:
+            if uses_session==True and block==True:
+                client._wait_finish(False)
+
+    def _handle(self,ready):
+        progress = False
+        session_ready = False
+        for (key,mask) in ready:
+            if key.data=='waker':
+                try:
+                    while len(self._waker[0].recv(4096))>0:
+                        pass
+                except (BlockingIOError,OSError):
+                    pass
+                progress = True
+            elif key.data=='session':
+                session_ready = True
+            elif isinstance(key.data,Forward):
+                self._accept(key.data)
+                progress = True
+            else:
+                self._socket_ready(key.data,mask)
+                self._update(key.data)
+                progress = True
+        return((progress,session_ready))
+
+    def _accept(self,forward):
+        for i in range(64):
+            try:
+                (sock,address) = forward.listener.accept()
+            except (BlockingIOError,InterruptedError):
+                return()
+            except OSError:
+                forward.report((forward.bind_addr,forward.port))
+                return()
+            sock.setblocking(False)
+            sock.setsockopt(socket.IPPROTO_TCP,socket.TCP_NODELAY,self.client.tcp_nodelay)
+            if forward.tunnel_type==enums.TunnelType.dynamic:
+                stream = Stream(forward,sock,address,STREAM_SOCKS)
+            else:
+                stream = Stream(forward,sock,address,STREAM_OPENING)
+                self.opening.append(stream)
+            forward.streams.add(stream)
+            self.streams.add(stream)
+            self._update(stream)
+
+    def _connect(self,forward,chan):
+        (host,port) = forward.target
+        sock = None
+        try:
+            (family,socktype,proto,canonname,address) = socket.getaddrinfo(host,port,0,socket.SOCK_STREAM)[0]
+            sock = socket.socket(family,socktype,proto)
+            sock.setblocking(False)
+            sock.setsockopt(socket.IPPROTO_TCP,socket.TCP_NODELAY,self.client.tcp_nodelay)
+            rc = sock.connect_ex(address)
+            if not rc in (0,errno.EINPROGRESS,errno.EWOULDBLOCK):
+                raise(OSError(rc,os.strerror(rc)))
+        except OSError:
+            forward.report((host,port))
+            if not sock==None:
+                sock.close()
+            self._close_channel(chan)
+            return()
+        stream = Stream(forward,sock,address,STREAM_CONNECTING)
+        stream.chan = chan
+        forward.streams.add(stream)
+        self.streams.add(stream)
+        self._update(stream)
+
+    def _socket_ready(self,stream,mask):
+        try:
+            if mask & selectors.EVENT_WRITE:
+                if stream.state==STREAM_CONNECTING:
+                    error = stream.sock.getsockopt(socket.SOL_SOCKET,socket.SO_ERROR)
+                    if not error==0:
+                        raise(OSError(error,os.strerror(error)))
+                    stream.state = STREAM_OPEN
+                self._send(stream)
+            if mask & selectors.EVENT_READ:
+                self._recv(stream)
+        except (BlockingIOError,InterruptedError):
+            pass
+        except OSError:
+            if stream.state==STREAM_CONNECTING:
+                stream.forward.report(stream.target)
+            self._close_stream(stream)
+
+    def _recv(self,stream):
+        # Drain what the socket has (up to the buffer limit) so it all goes out in as few channel writes as possible.
+        while stream.sock_eof==False and len(stream.to_chan)<self.buffer_size:
+            size = min(stream.recv_size,self.buffer_size-len(stream.to_chan))
+            received = stream.sock.recv_into(self._recv_buffer[:size])
+            if received==0:
+                stream.sock_eof = True
+            elif stream.state==STREAM_SOCKS:
+                stream.socks+=self._recv_buffer[:received]
+                self._socks(stream)
+                return()
+            else:
+                stream.to_chan+=self._recv_buffer[:received]
+            if received<size:
+                if received<stream.recv_size//4 and stream.recv_size>self.min_recv_size:
+                    stream.recv_size//=2
+                return()
+            if stream.recv_size<self.max_recv_size:
+                stream.recv_size = min(stream.recv_size*2,self.max_recv_size)
+
+    def _send(self,stream):
+        if len(stream.to_sock)>0 and not stream.state==STREAM_CONNECTING:
+            try:
+                sent = stream.sock.send(stream.to_sock)
+            except (BlockingIOError,InterruptedError):
+                return()
+            del stream.to_sock[:sent]
+        if stream.chan_eof==True and len(stream.to_sock)==0 and stream.sock_shut==False:
+            stream.sock_shut = True
+            stream.sock.shutdown(socket.SHUT_WR)
+
+    def _socks_reply(self,stream,error,address_type=1):
+        stream.to_sock+=struct.pack('!BBBBIH',SOCKS_VERSION,error,0,address_type,0,0)
+
+    def _socks(self,stream):
+        # https://github.com/rushter/socks5
+        buf = stream.socks
+        if stream.socks_methods==False:
+            if len(buf)<2:
+                return()
+            (version,nmethods) = struct.unpack('!BB',buf[:2])
+            if not (version==SOCKS_VERSION and nmethods>0):
+                self._socks_reply(stream,5)
+                stream.state = STREAM_FAILED
+                return()
+            if len(buf)<2+nmethods:
+                return()
+            del buf[:2+nmethods]
+            stream.to_sock+=struct.pack('!BB',SOCKS_VERSION,0)
+            stream.socks_methods = True
+        if len(buf)<4:
+            return()
+        (version,cmd,_,address_type) = struct.unpack('!BBBB',buf[:4])
+        if address_type==1: # IPv4
+            end = 8
+        elif address_type==3: # Domain name
+            if len(buf)<5:
+                return()
+            end = 5+buf[4]
+        elif address_type==4: # IPv6
+            end = 20
+        else:
+            self._socks_reply(stream,8,address_type)
+            stream.state = STREAM_FAILED
+            return()
+        if len(buf)<end+2:
+            return()
+        if address_type==1:
+            address = socket.inet_ntoa(bytes(buf[4:8]))
+        elif address_type==3:
+            address = bytes(buf[5:end]).decode('utf8')
+        else:
+            address = socket.inet_ntop(socket.AF_INET6,bytes(buf[4:20]))
+        port = struct.unpack('!H',buf[end:end+2])[0]
+        if not (version==SOCKS_VERSION and cmd==1): # Only CONNECT
+            self._socks_reply(stream,7,address_type)
+            stream.state = STREAM_FAILED
+            return()
+        stream.target = (address,port)
+        stream.to_chan+=buf[end+2:]
+        stream.socks = bytearray()
+        stream.state = STREAM_OPENING
+        self.opening.append(stream)
+
+    def _finished(self,stream):
+        # Each direction is half closed on its own like OpenSSH does, the stream is done once both are.
+        if stream.state==STREAM_FAILED:
+            return(len(stream.to_sock)==0 or stream.sock_eof==True)
+        if stream.state==STREAM_SOCKS:
+            return(stream.sock_eof)
+        return(stream.chan_eof_sent==True and stream.sock_shut==True)
+
+    def _update(self,stream):
+        if stream.state==STREAM_CLOSED:
+            return()
+        if self._finished(stream)==True:
+            self._close_stream(stream)
+            return()
+        events = 0
+        if stream.sock_eof==False and len(stream.to_chan)<self.buffer_size and not stream.state in (STREAM_CONNECTING,STREAM_FAILED):
+            events|=selectors.EVENT_READ
+        if stream.state==STREAM_CONNECTING or len(stream.to_sock)>0:
+            events|=selectors.EVENT_WRITE
+        stream.events = self._watch(stream.sock,stream.events,events,stream)
+
+    def _pump(self,session_ready):
+        client = self.client
+        progress = False
+        while len(self.opening)>0:
+            stream = self.opening[0]
+            if stream.state==STREAM_CLOSED and not 'started' in stream.pending:
+                self.opening.popleft()
+                continue
+            stream.pending['started'] = True
+            try:
+                chan = self.tunneling.open_direct(client,stream.pending,stream.target[0],stream.target[1],stream.address[0],stream.address[1])
+            except Exception:
+                self.opening.popleft()
+                if not stream.state==STREAM_CLOSED:
+                    stream.forward.report(stream.address)
+                    if stream.forward.tunnel_type==enums.TunnelType.dynamic:
+                        self._socks_reply(stream,5)
+                        stream.state = STREAM_FAILED
+                        self._update(stream)
+                    else:
+                        self._close_stream(stream)
+                progress = True
+                continue
+            if chan==None:
+                break
+            self.opening.popleft()
+            stream.pending = {}
+            progress = True
+            if stream.state==STREAM_CLOSED:
+                self._close_channel(chan)
+                continue
+            stream.chan = chan
+            stream.state = STREAM_OPEN
+            if stream.forward.tunnel_type==enums.TunnelType.dynamic:
+                self._socks_reply(stream,0)
+        if session_ready==True or self.tunneling.accept_interval==None or time.monotonic()-self._last_accept>=self.tunneling.accept_interval:
+            self._last_accept = time.monotonic()
+            for forward in list(self.forwards):
+                if forward.tunnel_type==enums.TunnelType.remote and forward.terminate.is_set()==False:
+                    progress = self._remote_accept(forward) or progress
+        for stream in list(self.streams):
+            if not stream.chan==None:
+                progress = self._pump_stream(stream,session_ready) or progress
+                self._update(stream)
+        for chan in list(self.closing):
+            try:
+                done = self.tunneling.close_channel(client,chan)
+            except Exception:
+                done = True
+            if done==True:
+                self.closing.remove(chan)
+                self._dead.append(chan)
+        return(progress)
+
+    def _remote_accept(self,forward):
+        progress = False
+        for i in range(64):
+            try:
+                chan = self.tunneling.remote_accept(self.client,forward.listener)
+            except Exception:
+                forward.report((forward.bind_addr,forward.port))
+                forward.terminate.set()
+                break
+            if chan==None:
+                break
+            progress = True
+            self._connect(forward,chan)
+        return(progress)
+
+    def _pump_stream(self,stream,session_ready):
+        client = self.client
+        progress = False
+        try:
+            if len(stream.to_chan)>0:
+                # Only hand the library what the remote side's window has room for. With the window shut there is
+                # nothing to do until a window adjust could have come in, which needs the session socket to be readable.
+                window = self.tunneling.window(client,stream.chan)
+                if window>0 or session_ready==True:
+                    size = client._write_window
+                    if window>0:
+                        size = min(size,window)
+                    with memoryview(stream.to_chan) as view:
+                        data = view[:size].tobytes()
+                    written = self.tunneling.write(client,stream.chan,data,window)
+                    if written>0:
+                        del stream.to_chan[:written]
+                        progress = True
+            if stream.sock_eof==True and len(stream.to_chan)==0 and stream.chan_eof_sent==False:
+                stream.chan_eof_sent = self.tunneling.send_eof(client,stream.chan)
+                progress = stream.chan_eof_sent or progress
+            while stream.chan_eof==False and len(stream.to_sock)<self.buffer_size:
+                data = client._exec_read(stream.chan,min(self.buffer_size-len(stream.to_sock),client._read_window))
+                if data==None:
+                    stream.chan_eof = True
+                    progress = True
+                elif len(data)>0:
+                    stream.to_sock+=data
+                    progress = True
+                    continue
+                break
+            self._send(stream)
+        except Exception:
+            self._close_stream(stream)
+            return(True)
+        return(progress)
+
+    def _close_channel(self,chan):
+        if self.client.__shutdown_all__.is_set()==True:
+            self._dead.append(chan)
+            return()
+        try:
+            done = self.tunneling.close_channel(self.client,chan)
+        except Exception:
+            done = True
+        if done==True:
+            self._dead.append(chan)
+        else:
+            self.closing.append(chan)
+
+    def _close_stream(self,stream):
+        if stream.state==STREAM_CLOSED:
+            return()
+        stream.state = STREAM_CLOSED
+        self.streams.discard(stream)
+        stream.forward.streams.discard(stream)
+        stream.events = self._watch(stream.sock,stream.events,0,stream)
+        stream.sock.close()
+        chan = stream.chan
+        stream.chan = None
+        if not chan==None:
+            self._close_channel(chan)
+
+    def _close_forward(self,forward):
+        for stream in list(forward.streams):
+            self._close_stream(stream)
+        if forward.tunnel_type==enums.TunnelType.remote:
+            if self.client.__shutdown_all__.is_set()==False:
+                try:
+                    self.tunneling.remote_cancel(self.client,forward.listener,forward.bind_addr,forward.port)
+                except Exception:
+                    pass
+            self._dead.append(forward.listener)
+        else:
+            if forward in self.forwards:
+                self._selector.unregister(forward.listener)
+            forward.listener.close()
+        forward.listener = None
+        self.forwards.discard(forward)
+        forward.closed.set()
+
+    def _release(self):
+        # Let go of closed channels while holding the session lock, freeing a channel is not thread safe.
+        if len(self._dead)>0:
+            with self.client.session._block_lock:
+                self._dead = []
@@ -39,12 +39,22 @@ class Channel(enum.Enum):
     write = 'write'
     flush = 'flush'
     send_eof = 'send_eof'
+    eof = 'is_eof'
     close = 'close'
 
+class MethodPreference(enum.Enum): # Names from ssh.options, the option objects themselves can't be dict keys.
+    kex = ('KEY_EXCHANGE',)
+    crypt = ('CIPHERS_C_S','CIPHERS_S_C')
+    mac = ('HMAC_C_S','HMAC_S_C')
+
 class SFTP(enum.IntEnum):
     DEFAULT_WRITE_MODE = libssh.enums.SFTP_AT.O_RDWR | libssh.enums.SFTP_AT.O_CREAT | libssh.enums.SFTP_AT.O_TRUNC
     DEFAULT_READ_MODE = libssh.enums.SFTP_AT.O_RDONLY
     DEFAULT_FILE_MODE = 0o664
+    DEFAULT_CHUNK_SIZE = 32768
+    DEFAULT_MAX_INFLIGHT = 64
+    UPDATE_WRITE_MODE = libssh.enums.SFTP_AT.O_RDWR | libssh.enums.SFTP_AT.O_CREAT
+    DEFAULT_DELTA_BLOCK_SIZE = 1048576
 
 class SFTP_S(enum.IntEnum):
     # File mode masks
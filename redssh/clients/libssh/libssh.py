@@ -21,9 +21,14 @@ from ssh import exceptions
 from ssh.session import Session, SSH_READ_PENDING, SSH_WRITE_PENDING, SSH_AUTH_SUCCESS, SSH_AUTH_DENIED, SSH_AUTH_PARTIAL, SSH_AUTH_INFO, SSH_AUTH_AGAIN, SSH_AUTH_ERROR
 from ssh import scp
 from ssh import sftp
+from ssh.sftp_attributes import SFTPAttributes
 from ssh import enums
 from ssh import key
 from ssh import options
 from ssh import error_codes
 from ssh import utils
 
+# Not exported by ssh-python, from libssh/sftp.h
+SSH_FILEXFER_ATTR_SIZE = 0x00000001
+SSH_FILEXFER_ATTR_ACMODTIME = 0x00000008
+
@@ -21,6 +21,7 @@ import re
 import time
 import hashlib
 import threading
+import functools
 import multiprocessing
 import socket
 import select
@@ -58,25 +59,29 @@ class LibSSH(BaseClient):
     :type ssh_keepalive_interval: ``float``
     :param set_flags: Not supported in ssh2-python 0.18.0
     :type set_flags: ``dict``
-    :param method_preferences: Not supported in ssh2-python 0.18.0
+    :param method_preferences: Algorithm preference strings to negotiate with, keyed by ``ssh.options`` option name like ``'CIPHERS_C_S'``, these override ``method_profile``.
     :type method_preferences: ``dict``
+    :param method_profile: Negotiate ciphers, MACs and key exchanges from one of the built in profiles, ``throughput``, ``latency`` or ``low_cpu``. ``None`` leaves libssh's defaults.
+    :type method_profile: :class:`redssh.enums.MethodProfile`
     :param callbacks: Not supported yet
     :type callbacks: ``dict``
     :param auto_terminate_tunnels: Automatically terminate tunnels when errors are detected
     :type auto_terminate_tunnels: ``bool``
     :param tcp_nodelay: Set `TCP_NODELAY` for the underlying :func:`socket.socket`, by default this is off via `False`.
     :type tcp_nodelay: ``bool``
+    :param tunnel_buffer_size: Most bytes buffered for each connection through a tunnel in each direction, by default this is 1MB.
+    :type tunnel_buffer_size: ``int``
     '''
-    def __init__(self,*args,set_flags={},method_preferences={},callbacks={},**kwargs):
+    def __init__(self,*args,set_flags={},method_preferences={},method_profile=None,callbacks={},**kwargs):
         super().__init__(*args,**kwargs)
 
-        set_flags.update(method_preferences)
         self.set_options = set_flags
         self.callbacks = callbacks
         self._ssh_keepalive_thread = None
         self._ssh_keepalive_event = None
         self._modules = LibSSHModules
         self.enums = self._modules.client_enums
+        self.method_preferences = self._method_preferences(method_profile,method_preferences)
 
     def ssh_keepalive(self):
         timeout = 0.01
@@ -86,6 +91,13 @@ class LibSSH(BaseClient):
             timeout = self._block(self.session.keepalive_send,_select_timeout=self._select_timeout)
             self._ssh_keepalive_event.wait(timeout=timeout)
 
+    def _close_sock(self):
+        # libssh closes the socket when the session is freed, closing it here as well could close whatever reused the descriptor since.
+        self.sock.detach()
+
+    def _block_directions(self):
+        return(self.session.get_poll_flags())
+
     def _block(self,func,*args,**kwargs):
         if self.__shutdown_all__.is_set()==False:
             default_str = 'sdkljfhklsdjf'
@@ -95,62 +107,76 @@ class LibSSH(BaseClient):
             else:
                 _select_timeout = float(_select_timeout)
                 del kwargs['_select_timeout']
-            out = libssh.error_codes.SSH_AGAIN
-            while out==libssh.error_codes.SSH_AGAIN:
+            out = self._call(func,*args,**kwargs)
+            while out==libssh.error_codes.SSH_AGAIN and self.__shutdown_all__.is_set()==False:
+                if not self.metrics==None:
+                    self.metrics.increment('block.eagain')
                 self._block_select(_select_timeout)
-                with self.session._block_lock:
-                    out = func(*args,**kwargs)
+                out = self._call(func,*args,**kwargs)
             return(out)
 
     def _block_write(self,func,data,_select_timeout=None):
-        data_len = len(data)
+        view = self._write_buffer(data)
+        data_len = len(view)
         total_written = 0
-        while total_written<data_len:
-            if self.__shutdown_all__.is_set()==False:
+        while total_written<data_len and self.__shutdown_all__.is_set()==False:
+            (rc,bytes_written) = self._call(func,self._write_slice(view,total_written))
+            total_written+=bytes_written
+            if not self.metrics==None:
+                self.metrics.observe('write.bytes',bytes_written,self._metrics_tags(func))
+            if rc==libssh.error_codes.SSH_AGAIN:
+                if not self.metrics==None:
+                    self.metrics.increment('block.eagain')
                 self._block_select(_select_timeout)
-                with self.session._block_lock:
-                    (rc,bytes_written) = func(data[total_written:])
-                total_written+=bytes_written
         return(total_written)
 
     def _read_iter(self,func,block=False,max_read=-1,_select_timeout=None):
         pos = 0
+        total_read = 0
         remainder_len = 0
         remainder = b''
-        if self.__shutdown_all__.is_set()==False:
-            self._block_select(_select_timeout)
-            with self.session._block_lock:
-                try:
-                    (size,data) = func()
-                except libssh.exceptions.EOF:
-                    return(b'')
+        if self.__shutdown_all__.is_set()==False and max_read!=0:
+            try:
+                (size,data) = self._call(func)
+            except libssh.exceptions.EOF:
+                return(b'')
             while size==libssh.error_codes.SSH_AGAIN or size>0:
                 if size==libssh.error_codes.SSH_AGAIN:
-                    if self.__shutdown_all__.is_set()==False:
+                    if not self.metrics==None:
+                        self.metrics.increment('block.eagain')
+                    if block==False and _select_timeout==None:
+                        self._block_select(self._select_timeout)
+                    else:
                         self._block_select(_select_timeout)
-                        with self.session._block_lock:
-                            try:
-                                (size,data) = func()
-                            except libssh.exceptions.EOF:
-                                return(b'')
+                    if self.__shutdown_all__.is_set()==True:
+                        return(b'')
+                    try:
+                        (size,data) = self._call(func)
+                    except libssh.exceptions.EOF:
+                        return(b'')
                 # if timeout is not None and size==libssh.error_codes.SSH_AGAIN:
-                if size==libssh.error_codes.SSH_AGAIN and (block==False or (max_read>size and max_read!=-1)):
+                if size==libssh.error_codes.SSH_AGAIN and block==False:
                     return(b'')
                 while size>0:
+                    if not self.metrics==None:
+                        self.metrics.observe('read.bytes',size,self._metrics_tags(func))
                     while pos<size:
+                        if max_read!=-1 and size-pos>max_read-total_read:
+                            size = pos+max_read-total_read
                         if remainder_len>0:
                             yield(remainder+data[pos:size])
                             remainder = b''
                             remainder_len = 0
                         else:
                             yield(data[pos:size])
+                        total_read+=size-pos
                         pos = size
-                    self._block_select(_select_timeout)
-                    with self.session._block_lock:
-                        try:
-                            (size,data) = func()
-                        except libssh.exceptions.EOF:
-                            return(b'')
+                    if max_read!=-1 and total_read>=max_read:
+                        return(b'')
+                    try:
+                        (size,data) = self._call(func)
+                    except libssh.exceptions.EOF:
+                        return(b'')
                     pos = 0
             if remainder_len>0:
                 yield(remainder)
@@ -173,38 +199,67 @@ class LibSSH(BaseClient):
         except Exception as e:
             pass
 
-    def _auth(self,username,password,allow_agent,host_based,key_filepath,passphrase,look_for_keys):
+    def _auth(self,hostname,port,username,password,allow_agent,host_based,key_filepath,passphrase,look_for_keys):
         auth_supported = self._auth_get_supported()
-        auth_types_tried = []
-        if isinstance(auth_supported,type([])):
-
-            if libssh.enums.Auth_Method.PUBLICKEY in auth_supported:
-                if allow_agent==True:
-                    auth_types_tried.append('publickey')
-                    if self._auth_attempt(self.session.userauth_agent)==libssh.SSH_AUTH_SUCCESS:
-                        return()
-                elif key_filepath!=None:
-                    auth_types_tried.append('publickey')
-                    pkey = libssh.key.import_privkey_file(key_filepath,passphrase)
-                    if self._auth_attempt(self.session.userauth_publickey,pkey)==libssh.SSH_AUTH_SUCCESS:
-                        return()
-
-                # elif host_based==True:
-                    # auth_types_tried.append('hostbased')
-                    # if res==self._auth_attempt(self.session.userauth_hostbased_fromfile,username,private_key,hostname,passphrase=passphrase):
-                        # return()
-
-            if libssh.enums.Auth_Method.PASSWORD in auth_supported:
-                if not password==None:
-                    auth_types_tried.append('password')
-                    if self._auth_attempt(self.session.userauth_password,None,password)==libssh.SSH_AUTH_SUCCESS:
-                        return()
-            # if libssh.enums.Auth_Method.INTERACTIVE in auth_supported:
-                # auth_types_tried.append('keyboard-interactive')
-                # if self._auth_attempt(self.session.userauth_keyboardinteractive,None,password)==libssh.SSH_AUTH_SUCCESS:
+        methods = []
+
+        if libssh.enums.Auth_Method.PUBLICKEY in auth_supported:
+            if allow_agent==True:
+                methods.append(('agent',))
+            if not key_filepath==None:
+                if isinstance(key_filepath,type(''))==True:
+                    key_filepath = [key_filepath]
+                for private_key in key_filepath:
+                    if os.path.exists(private_key) and os.path.isfile(private_key):
+                        methods.append(('publickey',private_key))
+
+            # elif host_based==True:
+                # auth_types_tried.append('hostbased')
+                # if res==self._auth_attempt(self.session.userauth_hostbased_fromfile,username,private_key,hostname,passphrase=passphrase):
                     # return()
 
-        raise(exceptions.AuthenticationFailedException(list(set(auth_types_tried))))
+        if libssh.enums.Auth_Method.PASSWORD in auth_supported:
+            if not password==None:
+                methods.append(('password',))
+        # if libssh.enums.Auth_Method.INTERACTIVE in auth_supported:
+            # auth_types_tried.append('keyboard-interactive')
+            # if self._auth_attempt(self.session.userauth_keyboardinteractive,None,password)==libssh.SSH_AUTH_SUCCESS:
+                # return()
+
+        self._auth_with(hostname,port,username,methods,lambda method: self._auth_method(method,password,passphrase))
+
+    def _auth_method(self,method,password,passphrase):
+        if method[0]=='agent':
+            worked = self._auth_agent()
+        elif method[0]=='publickey':
+            worked = self._auth_attempt(self._auth_publickey,method[1],passphrase)
+        else:
+            worked = self._auth_attempt(self.session.userauth_password,None,password)
+        if worked==libssh.SSH_AUTH_SUCCESS:
+            return(method)
+
+    def _auth_publickey(self,key_filepath,passphrase):
+        if self.auth_cache==None:
+            pkey = libssh.key.import_privkey_file(key_filepath,passphrase)
+        else:
+            pkey = self.auth_cache.load_key(key_filepath,passphrase,libssh.key.import_privkey_file)
+        return(self.session.userauth_publickey(pkey))
+
+    def _auth_agent(self):
+        agent_path = os.environ.get('SSH_AUTH_SOCK')
+        if self.auth_cache==None or agent_path==None:
+            return(self._auth_attempt(self.session.userauth_agent))
+        # libssh closes the agent socket it is given along with the session, so each session gets a duplicate of the shared connection.
+        try:
+            with self.auth_cache.agent(agent_path) as agent_fd:
+                try:
+                    self.session.set_agent_socket(agent_fd)
+                except:
+                    os.close(agent_fd)
+                    raise
+                return(self.session.userauth_agent())
+        except (OSError,libssh.exceptions.BaseSSHError):
+            return(None)
 
     def eof(self):
         '''
@@ -214,12 +269,20 @@ class LibSSH(BaseClient):
             return(self._block(self.channel.is_eof))
 
     def methods(self, method):
-        pass
-        # '''
-        # Returns what value was settled on during session negotiation.
-        # '''
-        # if self.__check_for_attr__('session')==True:
-            # return(self._block(self.session.options_get,method)) # broken in redlibssh, refer to https://api.libssh.org/stable/group__libssh__session.html#gaaa9d400920cad4d6e4a0fb09ff8c7b01
+        '''
+        Returns what value was settled on during session negotiation.
+        ``method`` is the name of one of the ``ssh.options`` key exchange, cipher or MAC options, like ``'CIPHERS_C_S'``.
+        '''
+        if self.__check_for_attr__('session')==True:
+            getters = {
+                'KEY_EXCHANGE':self.session.get_kex_algo,
+                'CIPHERS_C_S':self.session.get_cipher_out,
+                'CIPHERS_S_C':self.session.get_cipher_in,
+                'HMAC_C_S':self.session.get_hmac_out,
+                'HMAC_S_C':self.session.get_hmac_in
+            }
+            if method in getters:
+                return(self._call(getters[method]))
 
     def setenv(self, varname, value):
         '''
@@ -284,7 +347,7 @@ class LibSSH(BaseClient):
             raise(exceptions.NoAuthenticationOfferedException())
         if self.past_login==False:
             if sock==None:
-                self.sock = socket.create_connection((hostname,port),timeout)
+                self.sock = self._timed('connect.tcp',socket.create_connection,(hostname,port),timeout)
                 self.sock.setsockopt(socket.SOL_SOCKET,socket.SO_KEEPALIVE,1)
                 self.sock.setsockopt(socket.IPPROTO_TCP,socket.TCP_NODELAY,self.tcp_nodelay)
             else:
@@ -305,8 +368,11 @@ class LibSSH(BaseClient):
             self.session.options_set(libssh.options.HOST, hostname)
             self.session.options_set(libssh.options.USER, username)
             self.session.options_set_port(self.sock.getsockname()[1])
+            for pref in self.method_preferences:
+                if isinstance(pref,str): # Preferences meant for libssh2 are skipped.
+                    self.session.options_set(getattr(libssh.options,pref), self.method_preferences[pref])
             self.session.set_socket(self.sock)
-            self.session.connect()
+            self._timed('connect.handshake',self.session.connect)
 
             # __initial = time.time()
             # self.session.keepalive_send()
@@ -314,9 +380,9 @@ class LibSSH(BaseClient):
             # if new_select_timeout>self._select_timeout and self._auto_select_timeout_enabled==True:
                 # self._select_timeout = new_select_timeout
 
-            self.check_host_key()
+            self._timed('connect.host_key',self.check_host_key)
 
-            self._auth(username,password,allow_agent,host_based,key_filepath,passphrase,look_for_keys)
+            self._timed('connect.auth',self._auth,hostname,port,username,password,allow_agent,host_based,key_filepath,passphrase,look_for_keys)
 
             # if self.ssh_keepalive_interval>0:
                 # self.session.keepalive_config(True, self.ssh_keepalive_interval)
@@ -324,7 +390,7 @@ class LibSSH(BaseClient):
                 # self._ssh_keepalive_event = threading.Event()
                 # self._ssh_keepalive_thread.start()
             self.session.set_blocking(False)
-            self.channel = self.open_channel(True,self.request_pty)
+            self.channel = self._timed('connect.channel',self.open_channel,True,self.request_pty)
 
             # if 'callback_set' in dir(self.session):
                 # self._forward_x11()
@@ -351,8 +417,8 @@ class LibSSH(BaseClient):
         Send data to the remote session.
         Only works if the current session has made it past the login process.
 
-        :param string: String to send to the remote session.
-        :type string: ``str``
+        :param string: String to send to the remote session, ``bytes`` or any other object supporting the buffer protocol can also be sent.
+        :type string: ``str``/``bytes``
         :return: ``int`` - Amount of bytes sent to remote machine.
         '''
         if self.past_login==True:
@@ -394,23 +460,33 @@ class LibSSH(BaseClient):
         '''
         if env==None:
             env = {}
-        if len(env)>0:
-            for key in env:
-                self.setenv(key,env[key])
-        out = b''
+        # Goes through the same loop as execute_many so stderr is drained and can't stall the command.
+        return(self._exec_all([functools.partial(self._exec_channel,command,env,pty,channel)],1)[0])
+
+    def _exec_channel(self,command,env,pty,channel=None):
         if channel==None:
             channel = self.open_channel(True,pty)
+        for key in env:
+            self._block(channel.request_env,key,env[key])
         self._block(channel.request_exec,command)
-        ret = self._block(channel.get_exit_status)
-        while self._block(channel.is_eof)==False and ret==-1:
-            ret = self._block(channel.get_exit_status)
-        iter = self._read_iter(channel.read_nonblocking,True)
-        for data in iter:
-            out+=data
+        return(channel)
+
+    def _exec_read_stderr(self,channel):
+        try:
+            (size,data) = self._call(channel.read_nonblocking,is_stderr=True)
+        except self.enums.Exceptions.EOF.value:
+            return(b'')
+        if size>0:
+            return(data[:size])
+        return(b'')
+
+    def _exec_exit_status(self,channel):
+        ret = self._call(channel.get_exit_status)
+        if ret==-1 and self._call(channel.is_closed)==False:
+            return(None)
         self._block(channel.send_eof)
         self._block(channel.close)
-        del channel
-        return(ret,out)
+        return(ret)
 
     def start_sftp(self):
         '''
@@ -17,23 +17,33 @@
 
 
 import os
+import collections
 
 from redssh.clients.libssh import libssh
 from redssh.clients.libssh import enums
+from redssh.clients.base_sftp import BaseSFTP
+from redssh.enums import Compression
 from redssh.clients.base_sftp import RedSFTPFile
 from redssh import exceptions
 
 DEFAULT_WRITE_MODE = enums.SFTP.DEFAULT_WRITE_MODE
 DEFAULT_READ_MODE = enums.SFTP.DEFAULT_READ_MODE
 DEFAULT_FILE_MODE = enums.SFTP.DEFAULT_FILE_MODE
+DEFAULT_CHUNK_SIZE = enums.SFTP.DEFAULT_CHUNK_SIZE
+DEFAULT_MAX_INFLIGHT = enums.SFTP.DEFAULT_MAX_INFLIGHT
+DEFAULT_DELTA_BLOCK_SIZE = enums.SFTP.DEFAULT_DELTA_BLOCK_SIZE
+UPDATE_WRITE_MODE = enums.SFTP.UPDATE_WRITE_MODE
 
-class RedSFTP(object):
+class RedSFTP(BaseSFTP):
     '''
     .. warning::
     This will only interact with the remote server as the user you logged in as, not the current user you are running commands as.
 
     Set ``self.ignore_existing_dirs`` to ``False`` to make `redssh.sftp.RedSFTP.mkdir` not ignore already existing directories.
     '''
+    # libssh's SFTP requests don't return until they are answered, so extra channels would only queue up on the session lock.
+    _concurrent_channels = False
+
     def __init__(self,ssh_session):
         self.ssh_session = ssh_session
         self.enable_fsync = False
@@ -50,14 +60,16 @@ class RedSFTP(object):
         return(self.ssh_session._block(func,*args,**kwargs))
 
     def _block_write(self,func,data,_select_timeout=None):
-        data_len = len(data)
+        view = self.ssh_session._write_buffer(data)
+        data_len = len(view)
         total_written = 0
-        while total_written<data_len:
-            if self.ssh_session.__shutdown_all__.is_set()==False:
+        while total_written<data_len and self.ssh_session.__shutdown_all__.is_set()==False:
+            bytes_written = self.ssh_session._call(func,self.ssh_session._write_slice(view,total_written))
+            total_written+=bytes_written
+            if not self.ssh_session.metrics==None:
+                self.ssh_session.metrics.observe('write.bytes',bytes_written,self.ssh_session._metrics_tags(func))
+            if bytes_written==0:
                 self.ssh_session._block_select(_select_timeout)
-                with self.ssh_session.session._block_lock:
-                    bytes_written = func(data[total_written:])
-                total_written+=bytes_written
         return(total_written)
 
 
@@ -209,6 +221,33 @@ class RedSFTP(object):
             yield(iter.name,iter)
             iter = self._block(dir_obj.readdir)
 
+    def _read_range(self,remote_path,offset,size):
+        f = self.open(remote_path,DEFAULT_READ_MODE,DEFAULT_FILE_MODE)
+        try:
+            self.seek(f,offset)
+            data = bytearray(size)
+            del data[self.read(f,buffer=data):]
+        finally:
+            self.close(f)
+        return(data)
+
+    def _read_dir(self,remote_path):
+        '''
+        Read every entry of ``remote_path`` and close the directory handle again.
+
+        :return: ``list`` of ``tuple (str, ssh.sftp_attributes.SFTPAttributes)``
+        '''
+        entries = []
+        dir_obj = self.open_dir(remote_path)
+        try:
+            attrs = self._block(dir_obj.readdir)
+            while not attrs==None:
+                entries.append((attrs.name.decode('utf8'),attrs))
+                attrs = self._block(dir_obj.readdir)
+        finally:
+            self._block(dir_obj.closedir)
+        return(entries)
+
     def open_dir(self,remote_path):
         '''
         Opens a directory object over SFTP on the remote server.
@@ -267,13 +306,13 @@ class RedSFTP(object):
 
         :param file_obj: `ssh.sftp.SFTPHandle` to interact with.
         :type file_obj: `ssh.sftp.SFTPHandle`
-        :param data_bytes: Bytes to write to the file with.
+        :param data_bytes: Bytes to write to the file with, any object supporting the buffer protocol can be used.
         :type data_bytes: ``byte str``
         :return: ``None``
         '''
         self._block_write(file_obj.write,data_bytes)
 
-    def read(self,file_obj,iter=True):
+    def read(self,file_obj,iter=True,buffer=None):
         '''
         Read from file object over SFTP on the remote server.
 
@@ -281,15 +320,16 @@ class RedSFTP(object):
         :type file_obj: `ssh.sftp.SFTPHandle`
         :param iter: Flag for if you want the iterable object instead of just a byte string returned.
         :type iter: ``bool``
-        :return: ``byte str`` or ``iter``
+        :param buffer: Read straight into this writable buffer (eg a ``bytearray``) until it is full or EOF is reached, ``iter`` is ignored when this is set.
+        :type buffer: ``bytearray`` or ``memoryview``
+        :return: ``byte str`` or ``iter``, or ``int`` the amount of bytes read into ``buffer``
         '''
+        if not buffer==None:
+            return(self.ssh_session._read_into(file_obj.read,buffer))
         if iter==True:
             return(self.ssh_session._read_iter(file_obj.read,True))
         elif iter==False:
-            data = b''
-            for chunk in self.ssh_session._read_iter(file_obj.read,True):
-                data+=chunk
-            return(data)
+            return(b''.join(self.ssh_session._read_iter(file_obj.read,True)))
 
     def close(self,file_obj):
         '''
@@ -302,50 +342,217 @@ class RedSFTP(object):
         self.fsync(file_obj)
         self._block(file_obj.close)
 
-    def put_folder(self,local_path,remote_path):
+    def put_folder(self,local_path,remote_path,workers=1,sync=False,checksum=False,delete=False,tar=False,compression=Compression.none):
         '''
         Upload an entire folder via SFTP to the remote session. Similar to ``cp -r /files/* /target``
         Also retains file permissions.
         Local path must be a directory to upload, if a path to a file is provided, nothing will happen.
 
+        The whole directory tree is created on the remote server first, then the files are uploaded.
+        With ``sync`` each remote directory is listed once and the files in it are compared to the local ones from that listing,
+        so unchanged files cost nothing more than their share of the listing.
+        libssh's SFTP requests hold the session until they are answered so files are always uploaded one at a time,
+        ``workers`` is only accepted to match the libssh2 client.
+        With ``tar`` the tree is sent as a tar archive built while ``local_path`` is walked, which is much faster for trees of many small files.
+
         :param local_path: The local path, on the machine where your code is running from, to upload from.
         :type local_path: ``str``
         :param remote_path: The remote path to upload the ``local_path`` to.
         :type remote_path: ``str``
+        :param workers: Ignored, see above.
+        :type workers: ``int``
+        :param sync: Only upload files that are missing on the remote server or differ in size or modification time from the local file.
+        :type sync: ``bool``
+        :param checksum: With ``sync``, compare files of the same size by their SHA-256 hash from ``sha256sum`` on the remote server instead of by modification time.
+        :type checksum: ``bool``
+        :param delete: With ``sync``, remove anything under ``remote_path`` that doesn't exist under ``local_path``.
+        :type delete: ``bool``
+        :param tar: Stream the whole tree as one tar archive into ``tar -x`` on the remote server instead of uploading file by file, needs ``tar`` on the remote server.
+        :type tar: ``bool``
+        :param compression: With ``tar``, gzip the archive on its way over the session. ``auto`` chooses from how well the start of the tree
+            compresses and the link speed measured by earlier transfers on this session, see :mod:`redssh.compression`.
+        :type compression: :class:`redssh.enums.Compression`
         '''
         if os.path.isdir(local_path)==True:
+            if tar==True:
+                self._tar_put_folder(local_path,remote_path,compression)
+                return
             try:
                 self.mkdir(remote_path,os.stat(local_path).st_mode)
             except libssh.exceptions.SFTPError:
                 pass
+            if sync==True:
+                self._sync_folder(local_path,remote_path,workers,checksum,delete)
+                return
+            files = []
             for (dirpath,dirnames,filenames) in os.walk(local_path):
+                remote_dir_path = os.path.normpath(os.path.join(remote_path,os.path.relpath(dirpath,local_path)))
                 for dirname in sorted(dirnames):
-                    local_dir_path = os.path.join(dirpath,dirname)
-                    tmp_rpath = local_dir_path[len(local_path):]
-                    if tmp_rpath.startswith(os.path.sep):
-                        tmp_rpath = tmp_rpath[1:]
-                    remote_dir_path = os.path.join(remote_path,tmp_rpath)
-                    if not dirname in self.list_dir(remote_path):
-                        self.mkdir(remote_dir_path,os.stat(local_dir_path).st_mode)
+                    self.mkdir(os.path.join(remote_dir_path,dirname),os.stat(os.path.join(dirpath,dirname)).st_mode)
                 for filename in filenames:
-                    local_file_path = os.path.join(dirpath,filename)
-                    remote_file_base = local_file_path[len(local_path):0-len(filename)]
-                    if remote_file_base.startswith('/'):
-                        remote_file_base = remote_file_base[1:]
-                    remote_file_path = os.path.join(os.path.join(remote_path,remote_file_base),filename)
-                    self.put_file(local_file_path,remote_file_path)
+                    files.append((os.path.join(dirpath,filename),os.path.join(remote_dir_path,filename)))
+            self._parallel(workers,'put_file',files)
 
-    def put_file(self,local_path,remote_path):
+    def put_file(self,local_path,remote_path,max_inflight=DEFAULT_MAX_INFLIGHT,chunk_size=DEFAULT_CHUNK_SIZE,resume=False,resume_check=0):
         '''
         Upload file via SFTP to the remote session. Similar to ``cp /files/file /target``.
-        Also retains file permissions.
+        Also retains file permissions and modification time.
+
+        The local file is streamed in pieces of ``max_inflight`` * ``chunk_size`` bytes so memory use doesn't grow with the file size.
+        ssh-python has no asynchronous SFTP write for libssh, so each write request is acknowledged before the next one is sent.
 
         :param local_path: The local path, on the machine where your code is running from, to upload from.
         :type local_path: ``str``
         :param remote_path: The remote path to upload the ``local_path`` to.
         :type remote_path: ``str``
+        :param max_inflight: The number of ``chunk_size`` pieces to read from the local file at a time.
+        :type max_inflight: ``int``
+        :param chunk_size: The size of each write request in bytes.
+        :type chunk_size: ``int``
+        :param resume: Carry on from where an earlier, interrupted, transfer of this file stopped instead of starting over.
+        :type resume: ``bool``
+        :param resume_check: With ``resume``, the amount of bytes at the end of the partial file to compare with the local file before resuming, the transfer starts over if they differ.
+        :type resume_check: ``int``
+        '''
+        local_stat = os.stat(local_path)
+        offset = 0
+        if resume==True:
+            try:
+                offset = self._resume_offset(local_path,remote_path,self._attrs_size(self.stat(remote_path)),local_stat.st_size,resume_check)
+            except libssh.exceptions.SFTPError:
+                pass
+        if offset>0:
+            f = self.open(remote_path,UPDATE_WRITE_MODE,local_stat.st_mode)
+            self.seek(f,offset)
+        else:
+            f = self.open(remote_path,DEFAULT_WRITE_MODE,local_stat.st_mode)
+        try:
+            buf = bytearray(max_inflight*chunk_size)
+            view = memoryview(buf)
+            with open(local_path,'rb') as local_file:
+                local_file.seek(offset)
+                size = local_file.readinto(buf)
+                while size>0:
+                    total_written = 0
+                    while total_written<size and self.ssh_session.__shutdown_all__.is_set()==False:
+                        total_written+=self._block_write(f.write,view[total_written:min(total_written+chunk_size,size)])
+                    size = local_file.readinto(buf)
+        finally:
+            self.close(f)
+        # SFTP.utimes() in ssh-python doesn't send the modification time it is given, so set both times directly.
+        attrs = libssh.SFTPAttributes.new_attrs(self.client)
+        attrs.flags = libssh.SSH_FILEXFER_ATTR_ACMODTIME
+        attrs.atime = int(local_stat.st_atime)
+        attrs.mtime = int(local_stat.st_mtime)
+        self.setstat(remote_path,attrs)
+
+    def put_file_delta(self,local_path,remote_path,block_size=DEFAULT_DELTA_BLOCK_SIZE):
+        '''
+        Upload file via SFTP to the remote session, only sending the parts of it that differ from the file already at ``remote_path``.
+        Also retains file permissions and modification time.
+
+        The remote file is split into blocks of ``block_size`` bytes and each block is hashed on the remote server with GNU ``split`` and ``sha256sum``.
+        Local blocks with a different hash are written in place with `redssh.sftp.RedSFTP.seek` and `redssh.sftp.RedSFTP.write`
+        and the remote file is cut to the local file's size.
+        This suits large files changed in place, like disk images, data inserted into a file moves every block after it and the rest of the file is sent.
+        If the remote file can't be hashed the whole file is uploaded with `redssh.sftp.RedSFTP.put_file`.
+
+        :param local_path: The local path, on the machine where your code is running from, to upload from.
+        :type local_path: ``str``
+        :param remote_path: The remote path to upload the ``local_path`` to.
+        :type remote_path: ``str``
+        :param block_size: The size of the blocks that are compared in bytes.
+        :type block_size: ``int``
+        :return: ``int`` - Amount of bytes sent.
+        '''
+        remote_hashes = self._remote_block_hashes(remote_path,block_size)
+        local_stat = os.stat(local_path)
+        if remote_hashes==None:
+            self.put_file(local_path,remote_path)
+            return(local_stat.st_size)
+        total_written = 0
+        f = self.open(remote_path,UPDATE_WRITE_MODE,local_stat.st_mode)
+        try:
+            for (offset,data) in self._changed_blocks(local_path,remote_hashes,block_size):
+                self.seek(f,offset)
+                self.write(f,data)
+                total_written+=len(data)
+        finally:
+            self.close(f)
+        attrs = libssh.SFTPAttributes.new_attrs(self.client)
+        attrs.flags = libssh.SSH_FILEXFER_ATTR_ACMODTIME
+        if self._attrs_size(self.stat(remote_path))>local_stat.st_size:
+            attrs.flags|=libssh.SSH_FILEXFER_ATTR_SIZE
+            attrs.size = local_stat.st_size
+        attrs.atime = int(local_stat.st_atime)
+        attrs.mtime = int(local_stat.st_mtime)
+        self.setstat(remote_path,attrs)
+        return(total_written)
+
+    def get_file(self,remote_path,local_path,max_inflight=DEFAULT_MAX_INFLIGHT,chunk_size=DEFAULT_CHUNK_SIZE,resume=False,resume_check=0):
         '''
-        f = self.open(remote_path,DEFAULT_WRITE_MODE,os.stat(local_path).st_mode)
-        self.write(f,open(local_path,'rb').read())
-        self.close(f)
+        Download file via SFTP from the remote session. Similar to ``cp /target/file /files/file``.
+        Also retains file permissions and modification time.
+
+        Up to ``max_inflight`` read requests of ``chunk_size`` bytes are kept outstanding at once
+        so the transfer speed isn't limited to one ``chunk_size`` per round trip.
+        Replies are written to ``local_path`` at the offset they were requested for.
+        Requests stop at the size of the file so small files only cost a round trip or two.
 
+        :param remote_path: The remote path to download from.
+        :type remote_path: ``str``
+        :param local_path: The local path, on the machine where your code is running from, to download to.
+        :type local_path: ``str``
+        :param max_inflight: The maximum number of read requests to have outstanding at once.
+        :type max_inflight: ``int``
+        :param chunk_size: The size of each read request in bytes.
+        :type chunk_size: ``int``
+        :param resume: Carry on from where an earlier, interrupted, transfer of this file stopped instead of starting over.
+        :type resume: ``bool``
+        :param resume_check: With ``resume``, the amount of bytes at the end of the partial file to compare with the remote file before resuming, the transfer starts over if they differ.
+        :type resume_check: ``int``
+        :return: ``int`` - Amount of bytes downloaded.
+        '''
+        total_read = 0
+        f = self.open(remote_path,DEFAULT_READ_MODE,DEFAULT_FILE_MODE)
+        try:
+            attrs = self.fstat(f)
+            self.ssh_session._call(f.set_nonblocking)
+            pending = collections.deque()
+            offset = 0
+            if resume==True and os.path.isfile(local_path)==True:
+                offset = self._resume_offset(local_path,remote_path,os.path.getsize(local_path),self._attrs_size(attrs),resume_check)
+            local_mode = 'wb'
+            if offset>0:
+                local_mode = 'r+b'
+            eof = False
+            file_size = self._attrs_size(attrs)
+            with open(local_path,local_mode) as local_file:
+                local_file.truncate(offset)
+                while (eof==False or len(pending)>0) and self.ssh_session.__shutdown_all__.is_set()==False:
+                    # Nothing is requested past the end of the file besides one request to pick up EOF,
+                    # a short reply asks again from where it stopped so a file that grew is still read to the end.
+                    while eof==False and len(pending)<max_inflight and (offset<=file_size or len(pending)==0):
+                        # libssh moves the file offset back on short reads, so always request from our own offset.
+                        self.ssh_session._call(f.seek64,offset)
+                        pending.append((self.ssh_session._call(f.async_read_begin,chunk_size),offset,chunk_size))
+                        offset+=chunk_size
+                    (request_id,request_offset,request_len) = pending.popleft()
+                    (size,data) = self.ssh_session._call(f.async_read,request_id,request_len)
+                    while size==libssh.error_codes.SSH_AGAIN and self.ssh_session.__shutdown_all__.is_set()==False:
+                        self.ssh_session._block_select()
+                        (size,data) = self.ssh_session._call(f.async_read,request_id,request_len)
+                    if size==0:
+                        eof = True
+                    elif size>0:
+                        local_file.seek(request_offset)
+                        local_file.write(data)
+                        total_read+=size
+                        if size<request_len and eof==False:
+                            self.ssh_session._call(f.seek64,request_offset+size)
+                            pending.append((self.ssh_session._call(f.async_read_begin,request_len-size),request_offset+size,request_len-size))
+            os.chmod(local_path,attrs.permissions & 0o7777)
+            os.utime(local_path,(attrs.atime,attrs.mtime))
+        finally:
+            self.close(f)
+        return(total_read)
@@ -32,18 +32,28 @@ class Poll(enum.IntEnum):
 class Channel(enum.Enum):
     setenv = 'setenv' # TODO set more channel methods below.
     request_pty = 'pty'
-    exec_command = 'request_exec'
+    exec_command = 'execute'
     get_exit_status = 'get_exit_status'
-    read = 'read_nonblocking'
+    read = 'read'
     write = 'write'
     flush = 'flush'
     send_eof = 'send_eof'
+    eof = 'eof'
     close = 'close'
 
+class MethodPreference(enum.Enum):
+    kex = (libssh2.LIBSSH2_METHOD_KEX,)
+    crypt = (libssh2.LIBSSH2_METHOD_CRYPT_CS,libssh2.LIBSSH2_METHOD_CRYPT_SC)
+    mac = (libssh2.LIBSSH2_METHOD_MAC_CS,libssh2.LIBSSH2_METHOD_MAC_SC)
+
 class SFTP(enum.IntEnum):
     DEFAULT_WRITE_MODE = libssh2.LIBSSH2_FXF_WRITE | libssh2.LIBSSH2_FXF_CREAT | libssh2.LIBSSH2_FXF_TRUNC
     DEFAULT_READ_MODE = libssh2.LIBSSH2_FXF_READ
     DEFAULT_FILE_MODE = libssh2.LIBSSH2_SFTP_S_IRUSR | libssh2.LIBSSH2_SFTP_S_IWUSR | libssh2.LIBSSH2_SFTP_S_IRGRP | libssh2.LIBSSH2_SFTP_S_IWGRP | libssh2.LIBSSH2_SFTP_S_IROTH
+    DEFAULT_CHUNK_SIZE = 32768
+    DEFAULT_MAX_INFLIGHT = 64
+    UPDATE_WRITE_MODE = libssh2.LIBSSH2_FXF_WRITE | libssh2.LIBSSH2_FXF_CREAT
+    DEFAULT_DELTA_BLOCK_SIZE = 1048576
 
 class SFTP_S(enum.IntEnum):
     # File mode masks
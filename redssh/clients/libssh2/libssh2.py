@@ -27,6 +27,9 @@ from ssh2.sftp import LIBSSH2_SFTP_S_IFMT,LIBSSH2_SFTP_S_IFIFO,LIBSSH2_SFTP_S_IF
 from ssh2.sftp import LIBSSH2_FXF_READ,LIBSSH2_FXF_WRITE,LIBSSH2_FXF_APPEND,LIBSSH2_FXF_CREAT,LIBSSH2_FXF_TRUNC,LIBSSH2_FXF_EXCL
 from ssh2.sftp import LIBSSH2_SFTP_S_IRWXU,LIBSSH2_SFTP_S_IRUSR,LIBSSH2_SFTP_S_IWUSR,LIBSSH2_SFTP_S_IXUSR,LIBSSH2_SFTP_S_IRWXG,LIBSSH2_SFTP_S_IRGRP,LIBSSH2_SFTP_S_IWGRP,LIBSSH2_SFTP_S_IXGRP,LIBSSH2_SFTP_S_IRWXO,LIBSSH2_SFTP_S_IROTH,LIBSSH2_SFTP_S_IWOTH,LIBSSH2_SFTP_S_IXOTH,LIBSSH2_SFTP_ST_RDONLY,LIBSSH2_SFTP_ST_NOSUID
 from ssh2.sftp_handle import SFTPAttributes
+# Not exported by ssh2-python, from libssh2_sftp.h
+LIBSSH2_SFTP_ATTR_SIZE = 0x00000001
+LIBSSH2_SFTP_ATTR_ACMODTIME = 0x00000008
 import ssh2.exceptions as exceptions
 from ssh2.session import LIBSSH2_METHOD_KEX, LIBSSH2_METHOD_HOSTKEY, LIBSSH2_METHOD_CRYPT_CS, LIBSSH2_METHOD_CRYPT_SC, LIBSSH2_METHOD_MAC_CS, LIBSSH2_METHOD_MAC_SC, LIBSSH2_METHOD_COMP_CS, LIBSSH2_METHOD_COMP_SC, LIBSSH2_METHOD_LANG_CS, LIBSSH2_METHOD_LANG_SC, LIBSSH2_FLAG_SIGPIPE, LIBSSH2_FLAG_COMPRESS
 from ssh2.session import LIBSSH2_CALLBACK_X11
@@ -21,6 +21,7 @@ import re
 import time
 import hashlib
 import threading
+import functools
 import multiprocessing
 import socket
 import select
@@ -31,6 +32,7 @@ from redssh.clients.libssh2 import libssh2
 from redssh.clients.libssh2 import enums as client_enums
 from redssh import exceptions
 from redssh import enums
+from redssh import known_hosts
 from redssh.clients.libssh2 import sftp
 from redssh.clients.libssh2 import scp
 from redssh.clients.libssh2 import tunneling
@@ -53,30 +55,35 @@ class LibSSH2(BaseClient):
     :param terminal: Set the terminal sent to the remote server to something other than the default of ``'vt100'``.
     :type terminal: ``str``
     :param ssh_host_key_verification: Change the behaviour of remote host key verification. Can be set to one of the following values, ``strict``, ``warn``, ``auto_add`` or ``none``.
+        Keys marked ``@revoked`` in the known hosts file are always refused unless this is ``none``.
     :type ssh_host_key_verification: :class:`redssh.enums.SSHHostKeyVerify`
     :param ssh_keepalive_interval: Enable or disable SSH keepalive packets, value is interval in seconds, ``0`` is off.
     :type ssh_keepalive_interval: ``float``
     :param set_flags: Not supported in ssh2-python 0.18.0
     :type set_flags: ``dict``
-    :param method_preferences: Not supported in ssh2-python 0.18.0
+    :param method_preferences: Algorithm preference strings to negotiate with, keyed by ``ssh2.session.LIBSSH2_METHOD_*``, these override ``method_profile``.
     :type method_preferences: ``dict``
+    :param method_profile: Negotiate ciphers, MACs and key exchanges from one of the built in profiles, ``throughput``, ``latency`` or ``low_cpu``. ``None`` leaves libssh2's defaults.
+    :type method_profile: :class:`redssh.enums.MethodProfile`
     :param callbacks: Not supported yet
     :type callbacks: ``dict``
     :param auto_terminate_tunnels: Automatically terminate tunnels when errors are detected
     :type auto_terminate_tunnels: ``bool``
     :param tcp_nodelay: Set `TCP_NODELAY` for the underlying :func:`socket.socket`, by default this is off via `False`.
     :type tcp_nodelay: ``bool``
+    :param tunnel_buffer_size: Most bytes buffered for each connection through a tunnel in each direction, by default this is 1MB.
+    :type tunnel_buffer_size: ``int``
     '''
-    def __init__(self,*args,set_flags={},method_preferences={},callbacks={},**kwargs):
+    def __init__(self,*args,set_flags={},method_preferences={},method_profile=None,callbacks={},**kwargs):
         super().__init__(*args,**kwargs)
 
         self.set_flags = set_flags
-        self.method_preferences = method_preferences
         self.callbacks = callbacks
         self._ssh_keepalive_thread = None
         self._ssh_keepalive_event = None
         self._modules = LibSSH2Modules
         self.enums = self._modules.client_enums
+        self.method_preferences = self._method_preferences(method_profile,method_preferences)
 
     def ssh_keepalive(self):
         timeout = 0.01
@@ -86,6 +93,17 @@ class LibSSH2(BaseClient):
             timeout = self._block(self.session.keepalive_send,_select_timeout=self._select_timeout)
             self._ssh_keepalive_event.wait(timeout=timeout)
 
+    def _close_sock(self):
+        # libssh2 puts the socket back into blocking mode when the session is freed, so the session closes the socket
+        # once it lets go of it. Closing it here could let the session change whatever reused the descriptor since.
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def _block_directions(self):
+        return(self.session.block_directions())
+
     def _block(self,func,*args,**kwargs):
         if self.__shutdown_all__.is_set()==False:
             default_str = 'sdkljfhklsdjf'
@@ -95,53 +113,67 @@ class LibSSH2(BaseClient):
             else:
                 _select_timeout = float(_select_timeout)
                 del kwargs['_select_timeout']
-            out = libssh2.LIBSSH2_ERROR_EAGAIN
-            while out==libssh2.LIBSSH2_ERROR_EAGAIN:
+            out = self._call(func,*args,**kwargs)
+            while out==libssh2.LIBSSH2_ERROR_EAGAIN and self.__shutdown_all__.is_set()==False:
+                if not self.metrics==None:
+                    self.metrics.increment('block.eagain')
                 self._block_select(_select_timeout)
-                with self.session._block_lock:
-                    out = func(*args,**kwargs)
+                out = self._call(func,*args,**kwargs)
             return(out)
 
     def _block_write(self,func,data,_select_timeout=None):
-        data_len = len(data)
+        view = self._write_buffer(data)
+        data_len = len(view)
         total_written = 0
-        while total_written<data_len:
-            if self.__shutdown_all__.is_set()==False:
+        while total_written<data_len and self.__shutdown_all__.is_set()==False:
+            (rc,bytes_written) = self._call(func,self._write_slice(view,total_written))
+            total_written+=bytes_written
+            if not self.metrics==None:
+                self.metrics.observe('write.bytes',bytes_written,self._metrics_tags(func))
+            if rc==libssh2.LIBSSH2_ERROR_EAGAIN:
+                if not self.metrics==None:
+                    self.metrics.increment('block.eagain')
                 self._block_select(_select_timeout)
-                with self.session._block_lock:
-                    (rc,bytes_written) = func(data[total_written:])
-                total_written+=bytes_written
         return(total_written)
 
     def _read_iter(self,func,block=False,max_read=-1,_select_timeout=None):
         pos = 0
+        total_read = 0
         remainder_len = 0
         remainder = b''
-        if self.__shutdown_all__.is_set()==False:
-            self._block_select(_select_timeout)
-            with self.session._block_lock:
-                (size,data) = func()
+        if self.__shutdown_all__.is_set()==False and max_read!=0:
+            (size,data) = self._call(func)
             while size==libssh2.LIBSSH2_ERROR_EAGAIN or size>0:
                 if size==libssh2.LIBSSH2_ERROR_EAGAIN:
-                    self._block_select(_select_timeout)
-                    if self.__shutdown_all__.is_set()==False:
-                        with self.session._block_lock:
-                            (size,data) = func()
+                    if not self.metrics==None:
+                        self.metrics.increment('block.eagain')
+                    if block==False and _select_timeout==None:
+                        self._block_select(self._select_timeout)
+                    else:
+                        self._block_select(_select_timeout)
+                    if self.__shutdown_all__.is_set()==True:
+                        return(b'')
+                    (size,data) = self._call(func)
                 # if timeout is not None and size==libssh2.LIBSSH2_ERROR_EAGAIN:
-                if size==libssh2.LIBSSH2_ERROR_EAGAIN and (block==False or (max_read>size and max_read!=-1)):
+                if size==libssh2.LIBSSH2_ERROR_EAGAIN and block==False:
                     return(b'')
                 while size>0:
+                    if not self.metrics==None:
+                        self.metrics.observe('read.bytes',size,self._metrics_tags(func))
                     while pos<size:
+                        if max_read!=-1 and size-pos>max_read-total_read:
+                            size = pos+max_read-total_read
                         if remainder_len>0:
                             yield(remainder+data[pos:size])
                             remainder = b''
                             remainder_len = 0
                         else:
                             yield(data[pos:size])
+                        total_read+=size-pos
                         pos = size
-                    self._block_select(_select_timeout)
-                    with self.session._block_lock:
-                        (size,data) = func()
+                    if max_read!=-1 and total_read>=max_read:
+                        return(b'')
+                    (size,data) = self._call(func)
                     pos = 0
             if remainder_len>0:
                 yield(remainder)
@@ -153,43 +185,73 @@ class LibSSH2(BaseClient):
             pass
         return(self.session.userauth_authenticated())
 
-    def _auth(self,username,password,allow_agent,host_based,key_filepath,passphrase,look_for_keys):
+    def _auth(self,hostname,port,username,password,allow_agent,host_based,key_filepath,passphrase,look_for_keys):
         auth_supported = self.session.userauth_list(username)
-        if isinstance(auth_supported,type([])):
-            auth_types_tried = []
-
-            if 'publickey' in auth_supported:
-                if allow_agent==True:
-                    auth_types_tried.append('publickey')
-                    if self._auth_attempt(self.session.agent_auth,username)==True:
-                        return()
-                if not key_filepath==None:
-                    if isinstance(key_filepath,type(''))==True:
-                        key_filepath = [key_filepath]
-                    if isinstance(key_filepath,type([]))==True:
-                        if passphrase==None:
-                            passphrase = ''
-                        for private_key in key_filepath:
-                            if os.path.exists(private_key) and os.path.isfile(private_key):
-                                auth_types_tried.append('publickey')
-                                if self._auth_attempt(self.session.userauth_publickey_fromfile,username,private_key,passphrase)==True:
-                                    return()
-                # elif host_based==True:
-                    # auth_types_tried.append('hostbased')
-                    # if res==self._auth_attempt(self.session.userauth_hostbased_fromfile,username,private_key,hostname,passphrase=passphrase):
-                        # return()
-            if not password==None:
-                if 'password' in auth_supported:
-                    auth_types_tried.append('password')
-                    if self._auth_attempt(self.session.userauth_password,username,password)==True:
-                        return()
-                if 'keyboard-interactive' in auth_supported:
-                    auth_types_tried.append('keyboard-interactive')
-                    if self._auth_attempt(self.session.userauth_keyboardinteractive,username,password)==True:
-                        return()
-
-        if self.session.userauth_authenticated()==False:
-            raise(exceptions.AuthenticationFailedException(list(set(auth_types_tried))))
+        if not isinstance(auth_supported,type([])):
+            if self.session.userauth_authenticated()==True:
+                return()
+            auth_supported = []
+        if passphrase==None:
+            passphrase = ''
+        methods = []
+
+        if 'publickey' in auth_supported:
+            if allow_agent==True:
+                methods.append(('agent',))
+            if not key_filepath==None:
+                if isinstance(key_filepath,type(''))==True:
+                    key_filepath = [key_filepath]
+                if isinstance(key_filepath,type([]))==True:
+                    for private_key in key_filepath:
+                        if os.path.exists(private_key) and os.path.isfile(private_key):
+                            methods.append(('publickey',private_key))
+            # elif host_based==True:
+                # auth_types_tried.append('hostbased')
+                # if res==self._auth_attempt(self.session.userauth_hostbased_fromfile,username,private_key,hostname,passphrase=passphrase):
+                    # return()
+        if not password==None:
+            if 'password' in auth_supported:
+                methods.append(('password',))
+            if 'keyboard-interactive' in auth_supported:
+                methods.append(('keyboard-interactive',))
+
+        remembered = None
+        if not self.auth_cache==None:
+            remembered = self.auth_cache.method(hostname,port,username)
+        self._auth_with(hostname,port,username,methods,lambda method: self._auth_method(method,username,password,passphrase,remembered))
+
+    def _auth_method(self,method,username,password,passphrase,remembered):
+        if method[0]=='agent':
+            return(self._auth_agent(username,remembered))
+        if method[0]=='publickey':
+            worked = self._auth_attempt(self.session.userauth_publickey_fromfile,username,method[1],passphrase)
+        elif method[0]=='password':
+            worked = self._auth_attempt(self.session.userauth_password,username,password)
+        else:
+            worked = self._auth_attempt(self.session.userauth_keyboardinteractive,username,password)
+        if worked==True:
+            return(method)
+
+    def _auth_agent(self,username,remembered):
+        # libssh2 ties an agent connection to its session, so instead of reusing the connection
+        # the identity that worked last time is offered first.
+        try:
+            agent = self.session.agent_init()
+            agent.connect()
+        except libssh2.exceptions.AgentError:
+            return(None)
+        try:
+            agent.list_identities()
+            identities = agent.get_identities()
+            if not remembered==None and len(remembered)>1:
+                identities = sorted(identities,key=lambda identity: not identity.blob==remembered[1])
+            for identity in identities:
+                if self._auth_attempt(agent.userauth,username,identity)==True:
+                    return(('agent',identity.blob))
+        except libssh2.exceptions.AgentError:
+            pass
+        finally:
+            agent.disconnect()
 
     def eof(self):
         '''
@@ -230,38 +292,26 @@ class LibSSH2(BaseClient):
         if self.ssh_host_key_verification==enums.SSHHostKeyVerify.none:
             return(None)
 
-        self.known_hosts = self.session.knownhost_init()
-        if os.path.exists(self.known_hosts_path)==True:
-            self.known_hosts.readfile(self.known_hosts_path)
+        self.known_hosts = known_hosts.get_known_hosts(self.known_hosts_path)
         (host_key,host_key_type) = self.session.hostkey()
-
-        if isinstance(hostname,type('')):
-            hostname = hostname.encode(self.encoding)
-        if host_key_type==libssh2.LIBSSH2_HOSTKEY_TYPE_RSA:
-            server_key_type = libssh2.LIBSSH2_KNOWNHOST_KEY_SSHRSA
+        (key_type,key) = known_hosts.key_from_blob(host_key)
+        result = self.known_hosts.check(hostname,port,key_type,key)
+        if result==enums.KnownHostsResult.match:
+            return(None)
+        host = known_hosts.host_name(hostname,port)
+        if result==enums.KnownHostsResult.not_found:
+            error = libssh2.exceptions.KnownHostCheckNotFoundError('Host key for '+host+' was not found in '+self.known_hosts_path)
         else:
-            server_key_type = libssh2.LIBSSH2_KNOWNHOST_KEY_SSHDSS
-        key_bitmask = libssh2.LIBSSH2_KNOWNHOST_TYPE_PLAIN|libssh2.LIBSSH2_KNOWNHOST_KEYENC_RAW|server_key_type
+            error = libssh2.exceptions.KnownHostCheckMisMatchError('Host key for '+host+' does not match '+self.known_hosts_path)
 
+        if self.ssh_host_key_verification==enums.SSHHostKeyVerify.strict or result==enums.KnownHostsResult.revoked:
+            raise(error)
 
-        if self.ssh_host_key_verification==enums.SSHHostKeyVerify.strict:
-            self.known_hosts.checkp(hostname,port,host_key,key_bitmask)
-
-        if self.ssh_host_key_verification==enums.SSHHostKeyVerify.warn:
-            try:
-                self.known_hosts.checkp(hostname,port,host_key,key_bitmask)
-            except Exception as e:
-                print('WARN: '+str(e))
+        if self.ssh_host_key_verification in [enums.SSHHostKeyVerify.warn,enums.SSHHostKeyVerify.warn_auto_add]:
+            print('WARN: '+str(error))
 
         if self.ssh_host_key_verification in [enums.SSHHostKeyVerify.auto_add,enums.SSHHostKeyVerify.warn_auto_add]:
-            try:
-                self.known_hosts.checkp(hostname,port,host_key,key_bitmask)
-                return(None)
-            except Exception as e:
-                if self.ssh_host_key_verification==enums.SSHHostKeyVerify.warn_auto_add:
-                    print('WARN: '+str(e))
-            self.known_hosts.addc(hostname,host_key,key_bitmask)
-            self.known_hosts.writefile(self.known_hosts_path)
+            self.known_hosts.add(hostname,port,key_type,key)
 
     def connect(self,hostname,port=22,username='',password=None,
         allow_agent=False,host_based=None,key_filepath=None,passphrase=None,
@@ -297,7 +347,7 @@ class LibSSH2(BaseClient):
             raise(exceptions.NoAuthenticationOfferedException())
         if self.past_login==False:
             if sock==None:
-                self.sock = socket.create_connection((hostname,port),timeout)
+                self.sock = self._timed('connect.tcp',socket.create_connection,(hostname,port),timeout)
                 self.sock.setsockopt(socket.SOL_SOCKET,socket.SO_KEEPALIVE,1)
                 self.sock.setsockopt(socket.IPPROTO_TCP,socket.TCP_NODELAY,self.tcp_nodelay)
             else:
@@ -319,7 +369,7 @@ class LibSSH2(BaseClient):
                     # for cbtype in self.callbacks:
                         # self.session.callback_set(cbtype, self.callbacks[cbtype])
 
-            self.session.handshake(self.sock)
+            self._timed('connect.handshake',self.session.handshake,self.sock)
 
             __initial = time.time()
             self.session.keepalive_send()
@@ -327,9 +377,9 @@ class LibSSH2(BaseClient):
             if new_select_timeout>self._select_timeout and self._auto_select_timeout_enabled==True:
                 self._select_timeout = new_select_timeout
 
-            self.check_host_key(hostname,port) # segfault on real ssh server????
+            self._timed('connect.host_key',self.check_host_key,hostname,port) # segfault on real ssh server????
 
-            self._auth(username,password,allow_agent,host_based,key_filepath,passphrase,look_for_keys)
+            self._timed('connect.auth',self._auth,hostname,port,username,password,allow_agent,host_based,key_filepath,passphrase,look_for_keys)
 
             self.session.set_blocking(False)
             if self.ssh_keepalive_interval>0:
@@ -337,7 +387,7 @@ class LibSSH2(BaseClient):
                 self._ssh_keepalive_thread = threading.Thread(target=self.ssh_keepalive)
                 self._ssh_keepalive_event = threading.Event()
                 self._ssh_keepalive_thread.start()
-            self.channel = self.open_channel(True,self.request_pty)
+            self.channel = self._timed('connect.channel',self.open_channel,True,self.request_pty)
 
             # if 'callback_set' in dir(self.session):
                 # self._forward_x11()
@@ -364,8 +414,8 @@ class LibSSH2(BaseClient):
         Send data to the remote session.
         Only works if the current session has made it past the login process.
 
-        :param string: String to send to the remote session.
-        :type string: ``str``
+        :param string: String to send to the remote session, ``bytes`` or any other object supporting the buffer protocol can also be sent.
+        :type string: ``str``/``bytes``
         :return: ``int`` - Amount of bytes sent to remote machine.
         '''
         if self.past_login==True:
@@ -409,21 +459,28 @@ class LibSSH2(BaseClient):
         '''
         if env==None:
             env = {}
-        if len(env)>0:
-            for key in env:
-                self.setenv(key,env[key])
-        out = b''
+        # Goes through the same loop as execute_many so stderr is drained and can't stall the command.
+        return(self._exec_all([functools.partial(self._exec_channel,command,env,pty,channel)],1)[0])
+
+    def _exec_channel(self,command,env,pty,channel=None):
         if channel==None:
-            channel = self.open_channel(True,pty)
+            channel = self.open_channel(False,pty)
+        for key in env:
+            self._block(channel.setenv,key,env[key])
         self._block(channel.execute,command)
-        iter = self._read_iter(channel.read,True)
-        for data in iter:
-            out+=data
-        self._block(channel.wait_eof)
-        self._block(channel.close)
-        ret = self._block(channel.get_exit_status)
-        del channel
-        return(ret,out)
+        return(channel)
+
+    def _exec_read_stderr(self,channel):
+        (size,data) = self._call(channel.read_stderr)
+        if size>0:
+            return(data[:size])
+        return(b'')
+
+    def _exec_exit_status(self,channel):
+        for func in [channel.close,channel.wait_closed]:
+            if self._call(func)==libssh2.LIBSSH2_ERROR_EAGAIN:
+                return(None)
+        return(self._call(channel.get_exit_status))
 
     def start_sftp(self):
         '''
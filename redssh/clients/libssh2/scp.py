@@ -18,17 +18,23 @@
 
 import os
 import re
+import datetime
+import threading
 
 from redssh.clients.libssh2 import libssh2
+from redssh.clients.base_transfer import BaseTransfer
+from redssh.enums import Compression
 from redssh import exceptions
 
-class RedSCP(object):
+class RedSCP(BaseTransfer):
     '''
     .. warning::
         This will only interact with the remote server as the user you logged in as, not the current user you are running commands as.
     '''
     def __init__(self,ssh_session):
         self.ssh_session = ssh_session
+        # libssh2 keeps the progress of starting an SCP transfer on the session, so only one can be starting at a time.
+        self._start_lock = threading.Lock()
         self._ls_re = re.compile(b'^(?P<file_type>[d\\-])(?P<owner_perm>[rwx-]{3})(?P<group_perm>[rwx-]{3})(?P<everyone_perm>[rwx-]{3})\\s+(?P<subitems>\\d+)\\s+(?P<owner_name>.+?)\\s+(?P<group_name>.+?)\\s+(?P<size>\\d+)\\s+(?P<datetime_m>[\\d-]+\\s+[\\d\\:\\.]+)\\s+(?P<tz>[\\-\\+]\\d+)\\s+(?P<file_name>.+?)$',re.MULTILINE)
 
 
@@ -85,41 +91,64 @@ class RedSCP(object):
         :return: ``None``
         '''
         stat = os.stat(local_path)
-        f = open(local_path,'rb',2097152)
-        chan = self.ssh_session._block(self.ssh_session.session.scp_send64,remote_path,stat.st_mode & 0o777,stat.st_size,stat.st_mtime,stat.st_atime)
-        for data in f:
-            self.ssh_session._block_write(chan.write,data)
+        buf = bytearray(2097152)
+        view = memoryview(buf)
+        f = open(local_path,'rb')
+        with self._start_lock:
+            chan = self.ssh_session._block(self.ssh_session.session.scp_send64,remote_path,stat.st_mode & 0o777,stat.st_size,stat.st_mtime,stat.st_atime)
+        size = f.readinto(buf)
+        while size>0:
+            self.ssh_session._block_write(chan.write,view[:size])
+            size = f.readinto(buf)
         self.ssh_session._block(chan.send_eof)
         self.ssh_session._block(chan.close)
         f.close()
 
-    def read(self,file_path,iter=True):
+    def read(self,file_path,iter=True,buffer=None):
         '''
         Read from file over SCP on the remote server.
 
         :param file_path: Remote file path to read from.
         :type file_path: ``str``
-        :return: ``byte str`` or ``iter``
+        :param iter: Flag for if you want the iterable object instead of just a byte string returned.
+        :type iter: ``bool``
+        :param buffer: Read straight into this writable buffer (eg a ``bytearray``) until it is full or the whole file has been read, ``iter`` is ignored when this is set.
+        :type buffer: ``bytearray`` or ``memoryview``
+        :return: ``byte str`` or ``iter``, or ``int`` the amount of bytes read into ``buffer``
         '''
-        (chan,file_info) = self.ssh_session._block(self.ssh_session.session.scp_recv2,file_path)
+        with self._start_lock:
+            (chan,file_info) = self.ssh_session._block(self.ssh_session.session.scp_recv2,file_path)
+        if not buffer==None:
+            view = memoryview(buffer).cast('B')
+            return(self.ssh_session._read_into(chan.read,view[:file_info.st_size]))
         if iter==True:
             return(self.ssh_session._read_iter(chan.read,True,file_info.st_size))
         elif iter==False:
-            data = b''
-            for chunk in self.ssh_session._read_iter(chan.read,True,file_info.st_size):
-                data+=chunk
-            return(data)
+            data = bytearray(file_info.st_size)
+            size = self.ssh_session._read_into(chan.read,data)
+            del data[size:]
+            return(bytes(data))
 
-    def put_folder(self,local_path,remote_path):
+    def put_folder(self,local_path,remote_path,tar=False,compression=Compression.none):
         '''
         Upload an entire folder via SCP to the remote session. Similar to ``scp /files/* user@host:/target``
         Also retains file permissions.
 
+        With ``tar`` the tree is sent as a tar archive built while ``local_path`` is walked, which is much faster for trees of many small files.
+
         :param local_path: The local path, on the machine where your code is running from, to upload from.
         :type local_path: ``str``
         :param remote_path: The remote path to upload the ``local_path`` to.
         :type remote_path: ``str``
+        :param tar: Stream the whole tree as one tar archive into ``tar -x`` on the remote server instead of uploading file by file, needs ``tar`` on the remote server.
+        :type tar: ``bool``
+        :param compression: With ``tar``, gzip the archive on its way over the session. ``auto`` chooses from how well the start of the tree
+            compresses and the link speed measured by earlier transfers on this session, see :mod:`redssh.compression`.
+        :type compression: :class:`redssh.enums.Compression`
         '''
+        if tar==True:
+            self._tar_put_folder(local_path,remote_path,compression)
+            return
         self.mkdir(remote_path,os.stat(local_path).st_mode)
         for (dirpath,dirnames,filenames) in os.walk(local_path):
             for dirname in dirnames:
@@ -149,3 +178,89 @@ class RedSCP(object):
         :type remote_path: ``str``
         '''
         self.write(local_path,remote_path)
+
+    def get_folder(self,remote_path,local_path,workers=1,tar=False,compression=Compression.none):
+        '''
+        Download an entire folder via SCP from the remote session. Similar to ``scp -rp user@host:/target/* /files``
+        Also retains file permissions and modification times.
+        Only directories and regular files are downloaded, symlinks and other special files are skipped.
+
+        The whole remote tree is listed and created locally first, then the files are downloaded.
+        With ``workers`` above ``1`` that many files are downloaded at once, each over its own channel on this session.
+        With ``tar`` the tree is unpacked from a tar archive as it arrives, which is much faster for trees of many small files.
+
+        :param remote_path: The remote path to download from.
+        :type remote_path: ``str``
+        :param local_path: The local path, on the machine where your code is running from, to download the ``remote_path`` to.
+        :type local_path: ``str``
+        :param workers: The number of files to download at once.
+        :type workers: ``int``
+        :param tar: Stream the whole tree as one tar archive from ``tar -c`` on the remote server instead of downloading file by file, needs ``tar`` on the remote server.
+        :type tar: ``bool``
+        :param compression: With ``tar``, gzip the archive on its way over the session. ``auto`` chooses from how well the start of the tree
+            compresses and the link speed measured by earlier transfers on this session, see :mod:`redssh.compression`.
+        :type compression: :class:`redssh.enums.Compression`
+        '''
+        if tar==True:
+            self._tar_get_folder(remote_path,local_path,compression)
+            return
+        dirs = [(remote_path,local_path,None)]
+        files = []
+        os.makedirs(local_path,exist_ok=True)
+        for (remote_dir_path,local_dir_path,dir_info) in dirs:
+            listing = self.list_dir(remote_dir_path)
+            for (name,file_info) in listing['dirs'].items():
+                name = name.decode('utf8')
+                if name=='.':
+                    if dir_info==None:
+                        dirs[0] = (remote_dir_path,local_dir_path,file_info)
+                elif not name=='..':
+                    os.makedirs(os.path.join(local_dir_path,name),exist_ok=True)
+                    dirs.append((os.path.join(remote_dir_path,name),os.path.join(local_dir_path,name),file_info))
+            for name in listing['files']:
+                name = name.decode('utf8')
+                files.append((os.path.join(remote_dir_path,name),os.path.join(local_dir_path,name)))
+        self._parallel(workers,'get_file',files)
+        # Deepest first, so the files going into a directory can't change its time or be stopped by its mode.
+        for (remote_dir_path,local_dir_path,dir_info) in reversed(dirs):
+            if not dir_info==None:
+                os.chmod(local_dir_path,self._ls_mode(dir_info))
+                mtime = self._ls_mtime(dir_info)
+                os.utime(local_dir_path,(mtime,mtime))
+
+    def get_file(self,remote_path,local_path):
+        '''
+        Download file via SCP from the remote session. Similar to ``scp -p user@host:/target/file /files/file``.
+        Also retains file permissions and modification time.
+
+        :param remote_path: The remote path to download from.
+        :type remote_path: ``str``
+        :param local_path: The local path, on the machine where your code is running from, to download to.
+        :type local_path: ``str``
+        :return: ``int`` - Amount of bytes downloaded.
+        '''
+        total_read = 0
+        with self._start_lock:
+            (chan,file_info) = self.ssh_session._block(self.ssh_session.session.scp_recv2,remote_path)
+        with open(local_path,'wb') as local_file:
+            for data in self.ssh_session._read_iter(chan.read,True,file_info.st_size):
+                local_file.write(data)
+                total_read+=len(data)
+        self.ssh_session._block(chan.close)
+        os.chmod(local_path,file_info.st_mode & 0o7777)
+        os.utime(local_path,(file_info.st_atime,file_info.st_mtime))
+        return(total_read)
+
+    def _ls_mode(self,file_info):
+        mode = 0
+        for perm in (file_info['owner_perm'],file_info['group_perm'],file_info['everyone_perm']):
+            mode = mode<<3
+            for (bit,char) in ((4,b'r'),(2,b'w'),(1,b'x')):
+                if char in perm:
+                    mode|=bit
+        return(mode)
+
+    def _ls_mtime(self,file_info):
+        (date_time,fraction) = (file_info['datetime_m']+b'.').split(b'.')[:2]
+        date_time = datetime.datetime.strptime((date_time+b' '+file_info['tz']).decode('utf8'),'%Y-%m-%d %H:%M:%S %z')
+        return(date_time.timestamp()+float(b'0.'+(fraction or b'0')))
@@ -0,0 +1,121 @@
+# RedSSH
+# Copyright (C) 2018 - 2022 Red_M ( http://bitbucket.com/Red_M )
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+'''
+Picks between compressed and uncompressed transfers from how well the data compresses and how fast the link has been.
+Every session keeps one :class:`redssh.compression.AdaptiveCompression` at ``RedSSH.client.adaptive_compression``,
+it is used by transfers given ``compression=redssh.enums.Compression.auto``.
+
+SSH's own compression is negotiated once when connecting, so the choice is made per transfer instead,
+by compressing the data sent over the transfer's exec channel with ``gzip``.
+'''
+
+import time
+import zlib
+import threading
+
+
+class AdaptiveCompression(object):
+    '''
+    Estimates of the link and ``zlib`` throughput for a session, and the choice of whether compressing a transfer would finish it sooner.
+
+    The link is only measured properly by uncompressed transfers, a compressed transfer can be slowed down by compression instead of the link,
+    so it can only ever raise the estimate. Until the link has been measured transfers are left uncompressed, unless ``link_throughput`` is given.
+
+    :param link_throughput: Starting estimate of the link throughput in bytes per second, ``None`` to measure it from the first transfer.
+    :type link_throughput: ``float``
+    :param max_ratio: Never compress data that only shrinks to more than this fraction of its size.
+    :type max_ratio: ``float``
+    :param min_saving: Only compress when it is expected to take this fraction off the transfer time, so fast links don't pay the CPU cost for little gain.
+    :type min_saving: ``float``
+    :param smoothing: Weight of each new measurement in the running throughput estimates.
+    :type smoothing: ``float``
+    '''
+    sample_size = 262144
+
+    def __init__(self,link_throughput=None,max_ratio=0.9,min_saving=0.25,smoothing=0.3):
+        self._lock = threading.Lock()
+        self.link_throughput = link_throughput
+        self.max_ratio = max_ratio
+        self.min_saving = min_saving
+        self.smoothing = smoothing
+        self.compress_throughput = None
+
+    def _smooth(self,current,value):
+        if current==None:
+            return(value)
+        return(current+(value-current)*self.smoothing)
+
+    def record_link(self,wire_bytes,seconds,compressed=False):
+        '''
+        Add a measurement of the link from a transfer that sent ``wire_bytes`` over the session in ``seconds``.
+        Transfers smaller than ``sample_size`` are ignored as their time is mostly round trips.
+
+        :param wire_bytes: Bytes that went over the session, after any compression.
+        :type wire_bytes: ``int``
+        :param seconds: How long the transfer took.
+        :type seconds: ``float``
+        :param compressed: Whether the transfer was compressed.
+        :type compressed: ``bool``
+        :return: ``float`` or ``None`` - the throughput measured, ``None`` if the transfer was too small.
+        '''
+        if wire_bytes<self.sample_size or seconds<=0:
+            return(None)
+        throughput = wire_bytes/seconds
+        with self._lock:
+            if compressed==False:
+                self.link_throughput = self._smooth(self.link_throughput,throughput)
+            elif self.link_throughput==None or throughput>self.link_throughput:
+                self.link_throughput = throughput
+        return(throughput)
+
+    def sample(self,data):
+        '''
+        Compress ``data`` the way a transfer would, to measure how well it compresses and how fast ``zlib`` is on this machine.
+
+        :param data: The start of the data to be transferred, about ``sample_size`` bytes is enough.
+        :type data: ``bytes``
+        :return: ``float`` - compressed size as a fraction of ``len(data)``
+        '''
+        if len(data)==0:
+            return(1.0)
+        start = time.perf_counter()
+        compressed_size = len(zlib.compress(data,1))
+        elapsed = time.perf_counter()-start
+        if elapsed>0:
+            with self._lock:
+                self.compress_throughput = self._smooth(self.compress_throughput,len(data)/elapsed)
+        return(compressed_size/len(data))
+
+    def choose(self,ratio):
+        '''
+        Whether data that compresses to ``ratio`` of its size should be compressed over this link.
+        Compression and sending overlap, so a compressed transfer takes as long as the slower of the two.
+
+        :param ratio: Compressed size as a fraction of the original, like from :func:`redssh.compression.AdaptiveCompression.sample`.
+        :type ratio: ``float``
+        :return: ``bool``
+        '''
+        with self._lock:
+            link_throughput = self.link_throughput
+            compress_throughput = self.compress_throughput
+        if ratio>=self.max_ratio or link_throughput==None:
+            return(False)
+        plain_time = 1.0/link_throughput
+        compressed_time = ratio/link_throughput
+        if not compress_throughput==None:
+            compressed_time = max(compressed_time,1.0/compress_throughput)
+        return(compressed_time<=plain_time*(1.0-self.min_saving))
@@ -26,6 +26,12 @@ class SSHHostKeyVerify(enum.IntEnum):
     auto_add = 3
     none = 4
 
+class KnownHostsResult(enum.IntEnum):
+    match = 0
+    mismatch = 1
+    not_found = 2
+    revoked = 3
+
 class TunnelType(StrEnum):
     local = 'local'
     remote = 'remote'
@@ -38,6 +44,45 @@ class TunnelErrorLevel(enum.IntEnum):
     error = 2
     debug = 3
 
+class Compression(enum.IntEnum):
+    none = 0
+    gzip = 1
+    auto = 2
+
 class SSHClient(StrEnum):
     libssh2 = 'LibSSH2'
     libssh = 'LibSSH'
+
+class MethodProfile(StrEnum):
+    default = 'default'
+    throughput = 'throughput'
+    latency = 'latency'
+    low_cpu = 'low_cpu'
+
+class MethodKind(StrEnum):
+    kex = 'kex'
+    crypt = 'crypt'
+    mac = 'mac'
+
+# Preference lists for each `MethodProfile`, most preferred first.
+# Algorithms the SSH library doesn't support are skipped by it, the widely supported ones at the end keep negotiation from failing.
+# throughput: AES-GCM is a single pass with AES-NI and needs no separate MAC, CTR with an encrypt-then-MAC SHA-2 is the fallback.
+# latency: the cheapest key exchanges, without group exchange as that costs an extra round trip while connecting.
+# low_cpu: ChaCha20-Poly1305 and UMAC beat AES on hosts without AES instructions.
+METHOD_PROFILES = {
+    MethodProfile.default:{},
+    MethodProfile.throughput:{
+        MethodKind.crypt:'aes128-gcm@openssh.com,aes256-gcm@openssh.com,aes128-ctr,aes192-ctr,aes256-ctr,chacha20-poly1305@openssh.com',
+        MethodKind.mac:'hmac-sha2-256-etm@openssh.com,hmac-sha2-256,hmac-sha2-512-etm@openssh.com,hmac-sha2-512,hmac-sha1'
+    },
+    MethodProfile.latency:{
+        MethodKind.kex:'curve25519-sha256,curve25519-sha256@libssh.org,ecdh-sha2-nistp256,ecdh-sha2-nistp384,ecdh-sha2-nistp521,diffie-hellman-group14-sha256,diffie-hellman-group16-sha512,diffie-hellman-group14-sha1',
+        MethodKind.crypt:'aes128-gcm@openssh.com,chacha20-poly1305@openssh.com,aes128-ctr,aes256-gcm@openssh.com,aes192-ctr,aes256-ctr',
+        MethodKind.mac:'hmac-sha2-256-etm@openssh.com,hmac-sha2-256,hmac-sha2-512,hmac-sha1'
+    },
+    MethodProfile.low_cpu:{
+        MethodKind.kex:'curve25519-sha256,curve25519-sha256@libssh.org,ecdh-sha2-nistp256,diffie-hellman-group14-sha256,diffie-hellman-group14-sha1',
+        MethodKind.crypt:'chacha20-poly1305@openssh.com,aes128-ctr,aes128-gcm@openssh.com,aes192-ctr,aes256-ctr,aes256-gcm@openssh.com',
+        MethodKind.mac:'umac-64-etm@openssh.com,umac-64@openssh.com,hmac-sha2-256-etm@openssh.com,hmac-sha2-256,hmac-sha1'
+    }
+}
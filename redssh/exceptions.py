@@ -36,3 +36,41 @@ class NoAuthenticationOfferedException(RedSSHException):
         RedSSHException.__init__(self,'Failed to authenticate because no methods were supplied.')
 
 
+
+class PoolExhaustedException(RedSSHException):
+    '''
+    No pooled session became available in time.
+    '''
+    def __init__(self,hostname,port,username):
+        RedSSHException.__init__(self,'No session available in the pool for '+str(username)+'@'+str(hostname)+':'+str(port))
+
+class PoolClosedException(RedSSHException):
+    '''
+    The connection pool has been closed.
+    '''
+    def __init__(self):
+        RedSSHException.__init__(self,'The connection pool has been closed.')
+
+class FanOutTimeoutException(RedSSHException):
+    '''
+    An operation on a host took longer than the fan out timeout.
+    '''
+    def __init__(self,hostname,timeout):
+        RedSSHException.__init__(self,'Operation on '+str(hostname)+' did not finish within '+str(timeout)+' seconds.')
+
+class RemoteCommandFailedException(RedSSHException):
+    '''
+    A command run on the remote server on behalf of another operation exited with a non-zero status.
+    '''
+    def __init__(self,command,return_code,output):
+        RedSSHException.__init__(self,'Remote command '+str(command)+' exited with '+str(return_code)+': '+output.decode('utf8','replace').strip())
+        self.return_code = return_code
+        self.output = output
+
+class UnsafeArchiveMemberException(RedSSHException):
+    '''
+    A tar archive being unpacked has a member that would end up outside of the folder it is unpacked into.
+    '''
+    def __init__(self,member_name,local_path):
+        RedSSHException.__init__(self,'Refusing to unpack '+str(member_name)+' as it would be written outside of '+str(local_path))
+        self.member_name = member_name
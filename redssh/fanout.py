@@ -0,0 +1,327 @@
+# RedSSH
+# Copyright (C) 2018 - 2022 Red_M ( http://bitbucket.com/Red_M )
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import time
+import socket
+import threading
+import concurrent.futures
+
+from . import exceptions
+from .redssh import RedSSH
+
+
+class HostResult(object):
+    '''
+    The outcome of running an operation against one host.
+
+    :param host: The inventory entry this result is for.
+    :type host: ``str`` or ``dict``
+    :param result: What the operation returned, ``None`` if it failed.
+    :param error: The exception that made the last attempt fail, ``None`` on success.
+    :type error: ``Exception``
+    :param attempts: How many attempts were made.
+    :type attempts: ``int``
+    :param latency: Seconds from the first attempt starting to the result being ready.
+    :type latency: ``float``
+    '''
+    def __init__(self,host,result=None,error=None,attempts=0,latency=0.0):
+        self.host = host
+        self.result = result
+        self.error = error
+        self.attempts = attempts
+        self.latency = latency
+
+    @property
+    def ok(self):
+        '''
+        ``True`` if the operation completed without raising.
+        '''
+        return(self.error==None)
+
+    def __repr__(self):
+        return('<HostResult host='+repr(self.host)+' ok='+str(self.ok)+' attempts='+str(self.attempts)+' latency='+'%.3f'%self.latency+'>')
+
+
+class FanOutStats(object):
+    '''
+    Aggregate throughput and latency for one :func:`redssh.fanout.FanOut.run`.
+    '''
+    def __init__(self):
+        self.hosts = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.attempts = 0
+        self.elapsed = 0.0
+        self.latencies = []
+
+    def add(self,host_result):
+        self.hosts+=1
+        self.attempts+=host_result.attempts
+        if host_result.ok==True:
+            self.succeeded+=1
+        else:
+            self.failed+=1
+        self.latencies.append(host_result.latency)
+
+    def percentile(self,percent):
+        '''
+        Latency percentile over every host.
+
+        :param percent: Percentile to get, between ``0`` and ``100``.
+        :type percent: ``float``
+        :return: ``float``
+        '''
+        if len(self.latencies)==0:
+            return(0.0)
+        latencies = sorted(self.latencies)
+        return(latencies[min(len(latencies)-1,int(len(latencies)*percent/100.0))])
+
+    def summary(self):
+        '''
+        :return: ``dict`` - of host counts, ``hosts_per_second`` and latency ``min``, ``mean``, ``p50``, ``p95`` and ``max`` in seconds.
+        '''
+        hosts_per_second = 0.0
+        if self.elapsed>0:
+            hosts_per_second = self.hosts/self.elapsed
+        latency = {'min':0.0,'mean':0.0,'p50':0.0,'p95':0.0,'max':0.0}
+        if len(self.latencies)>0:
+            latency = {
+                'min':min(self.latencies),
+                'mean':sum(self.latencies)/len(self.latencies),
+                'p50':self.percentile(50),
+                'p95':self.percentile(95),
+                'max':max(self.latencies)
+            }
+        return({'hosts':self.hosts,'succeeded':self.succeeded,'failed':self.failed,'attempts':self.attempts,
+            'elapsed':self.elapsed,'hosts_per_second':hosts_per_second,'latency':latency})
+
+
+class FanOut(object):
+    '''
+    Run the same operation against many hosts at once with bounded concurrency, streaming back a
+    :class:`redssh.fanout.HostResult` per host as each one completes.
+
+    Hosts in the inventory are either a hostname or a ``dict`` of arguments for :func:`redssh.RedSSH.connect`,
+    these are laid over ``connect_kwargs`` so common options such as ``username`` only need to be given once.
+
+    :param max_workers: Maximum amount of hosts being worked on at once.
+    :type max_workers: ``int``
+    :param max_connecting: Maximum amount of hosts doing their connect and authentication at once.
+    :type max_connecting: ``int``
+    :param timeout: Seconds each attempt on a host may take, including connecting, before it is aborted. ``None`` is no limit.
+    :type timeout: ``float``
+    :param retries: How many more attempts to make on a host after an attempt raises or times out.
+    :type retries: ``int``
+    :param retry_delay: Seconds to wait between attempts on a host.
+    :type retry_delay: ``float``
+    :param pool: Take sessions from this pool instead of opening and closing a session per host.
+    :type pool: :class:`redssh.pool.ConnectionPool`
+    :param redssh_kwargs: Keyword arguments for :class:`redssh.RedSSH` when not using a ``pool``.
+    :type redssh_kwargs: ``dict``
+    :param connect_kwargs: Any other keyword arguments are used as defaults for :func:`redssh.RedSSH.connect`.
+    :type connect_kwargs: ``dict``
+    '''
+    def __init__(self,max_workers=32,max_connecting=8,timeout=None,retries=0,retry_delay=1.0,pool=None,redssh_kwargs=None,**connect_kwargs):
+        self.max_workers = max_workers
+        self.max_connecting = max_connecting
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.pool = pool
+        if redssh_kwargs==None:
+            redssh_kwargs = {}
+        self.redssh_kwargs = redssh_kwargs
+        self.connect_kwargs = connect_kwargs
+        self.stats = FanOutStats()
+        self._connecting = threading.BoundedSemaphore(max(max_connecting,1))
+
+    def _host_kwargs(self,host):
+        kwargs = dict(self.connect_kwargs)
+        if isinstance(host,dict):
+            kwargs.update(host)
+        else:
+            kwargs['hostname'] = host
+        return(kwargs)
+
+    def _remaining(self,attempt):
+        if self.timeout==None:
+            return(None)
+        return(max(attempt['deadline']-time.monotonic(),0.0))
+
+    def _arm(self,attempt,delay):
+        attempt['timer'] = threading.Timer(delay,self._abort,(attempt,))
+        attempt['timer'].daemon = True
+        attempt['timer'].start()
+
+    def _abort(self,attempt):
+        with attempt['lock']:
+            if attempt['finished']==True:
+                return(None)
+            attempt['aborted'].set()
+            rs = attempt['rs']
+            if attempt['connected']==True:
+                rs.client.__shutdown_all__.set()
+                rs.client._wait_wake()
+                return(None)
+            if rs==None and not self.pool==None:
+                with self.pool._lock:
+                    rs = self.pool._connecting.get(attempt['thread'])
+            if not rs==None and rs.client.__check_for_attr__('sock')==True:
+                # A handshake or authentication blocked inside the library returns with an error once its socket is shut down.
+                try:
+                    rs.client.sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+            else:
+                # Still waiting for a connect slot, a pooled session or the TCP connect, which are all bounded by the time left,
+                # so check again shortly in case the attempt moves on to the handshake instead.
+                self._arm(attempt,0.05)
+
+    def _connect(self,attempt,kwargs):
+        if self.timeout==None:
+            self._connecting.acquire()
+        elif self._connecting.acquire(timeout=self._remaining(attempt))==False:
+            raise(exceptions.FanOutTimeoutException(kwargs['hostname'],self.timeout))
+        try:
+            if not self.timeout==None:
+                remaining = self._remaining(attempt)
+                if kwargs.get('timeout',None)==None or kwargs['timeout']>remaining:
+                    kwargs['timeout'] = remaining
+            if not self.pool==None:
+                if not self.timeout==None:
+                    kwargs['wait_timeout'] = kwargs['timeout']
+                return(self.pool.acquire(**kwargs))
+            rs = RedSSH(**self.redssh_kwargs)
+            with attempt['lock']:
+                attempt['rs'] = rs
+            try:
+                rs.connect(**kwargs)
+            except:
+                rs.exit()
+                raise
+            return(rs)
+        finally:
+            self._connecting.release()
+
+    def _attempt(self,host,func):
+        kwargs = self._host_kwargs(host)
+        attempt = {'lock':threading.Lock(),'aborted':threading.Event(),'thread':threading.get_ident(),
+            'rs':None,'connected':False,'finished':False,'timer':None,'deadline':None}
+        if not self.timeout==None:
+            attempt['deadline'] = time.monotonic()+self.timeout
+            self._arm(attempt,self.timeout)
+        rs = None
+        failed = True
+        try:
+            try:
+                rs = self._connect(attempt,kwargs)
+                with attempt['lock']:
+                    attempt['rs'] = rs
+                    attempt['connected'] = True
+                if attempt['aborted'].is_set()==False:
+                    result = func(rs)
+            except Exception:
+                if attempt['aborted'].is_set()==False:
+                    raise
+            if attempt['aborted'].is_set()==True:
+                raise(exceptions.FanOutTimeoutException(kwargs['hostname'],self.timeout))
+            failed = False
+            return(result)
+        finally:
+            with attempt['lock']:
+                attempt['finished'] = True
+                if not attempt['timer']==None:
+                    attempt['timer'].cancel()
+            if not rs==None:
+                if attempt['aborted'].is_set()==True:
+                    rs.client.__shutdown_all__.clear()
+                if self.pool==None:
+                    rs.exit()
+                else:
+                    self.pool.release(rs,failed)
+
+    def _run_host(self,host,func):
+        start = time.monotonic()
+        attempts = 0
+        while True:
+            attempts+=1
+            try:
+                result = self._attempt(host,func)
+                return(HostResult(host,result,None,attempts,time.monotonic()-start))
+            except Exception as e:
+                if attempts>self.retries:
+                    return(HostResult(host,None,e,attempts,time.monotonic()-start))
+            time.sleep(self.retry_delay)
+
+    def run(self,hosts,func):
+        '''
+        Run ``func`` against every host in ``hosts``.
+        Results are yielded in the order hosts complete, once the generator is exhausted ``self.stats`` covers the whole run.
+
+        :param hosts: Host inventory.
+        :type hosts: ``list``
+        :param func: Called with a connected :class:`redssh.RedSSH` for each host, whatever it returns is the host's result.
+        :type func: ``callable``
+        :return: ``generator`` - of :class:`redssh.fanout.HostResult`
+        '''
+        self.stats = FanOutStats()
+        start = time.monotonic()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(self.max_workers,1)) as executor:
+            futures = [executor.submit(self._run_host,host,func) for host in hosts]
+            try:
+                for future in concurrent.futures.as_completed(futures):
+                    host_result = future.result()
+                    self.stats.add(host_result)
+                    self.stats.elapsed = time.monotonic()-start
+                    yield(host_result)
+            finally:
+                for future in futures:
+                    future.cancel()
+        self.stats.elapsed = time.monotonic()-start
+
+    def execute_command(self,hosts,command,env=None,pty=False):
+        '''
+        Run ``command`` on every host in ``hosts`` via :func:`redssh.RedSSH.execute_command`.
+
+        :param hosts: Host inventory.
+        :type hosts: ``list``
+        :param command: Command to execute.
+        :type command: ``str``
+        :param env: Environment variables to set during ``command``.
+        :type env: ``dict``
+        :param pty: Request a pty for the command to be executed via.
+        :type pty: ``bool``
+        :return: ``generator`` - of :class:`redssh.fanout.HostResult` with a ``result`` of ``tuple (int, str)`` - of ``(return_code, command_output)``
+        '''
+        return(self.run(hosts,lambda rs: rs.execute_command(command,env=env,pty=pty)))
+
+    def put_file(self,hosts,local_path,remote_path):
+        '''
+        Upload ``local_path`` to ``remote_path`` on every host in ``hosts`` via :func:`redssh.sftp.RedSFTP.put_file`.
+
+        :param hosts: Host inventory.
+        :type hosts: ``list``
+        :param local_path: The local path of the file to upload.
+        :type local_path: ``str``
+        :param remote_path: The remote path to upload the file to.
+        :type remote_path: ``str``
+        :return: ``generator`` - of :class:`redssh.fanout.HostResult`
+        '''
+        def put_file(rs):
+            rs.start_sftp()
+            return(rs.sftp.put_file(local_path,remote_path))
+        return(self.run(hosts,put_file))
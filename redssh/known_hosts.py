@@ -0,0 +1,263 @@
+# RedSSH
+# Copyright (C) 2018 - 2022 Red_M ( http://bitbucket.com/Red_M )
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+'''
+An in-memory index of a ``known_hosts`` file that is shared by every session in the process that uses the same file.
+
+The file is parsed once, when it grows only the new lines are parsed and when it is replaced or rewritten it is parsed again.
+New host keys are appended as a single line while holding an exclusive lock on the file,
+so concurrent connects, in this process or others, don't overwrite each other's entries.
+'''
+
+import os
+import hmac
+import base64
+import fnmatch
+import threading
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from redssh import enums
+
+
+def host_name(hostname,port=22):
+    '''
+    The name ``hostname`` and ``port`` have in a ``known_hosts`` file.
+
+    :param hostname: Hostname or address connected to.
+    :type hostname: ``str``
+    :param port: SSH port connected to.
+    :type port: ``int``
+    :return: ``str``
+    '''
+    if isinstance(hostname,bytes):
+        hostname = hostname.decode('utf8')
+    hostname = hostname.lower()
+    if port==22:
+        return(hostname)
+    return('['+hostname+']:'+str(port))
+
+def key_from_blob(blob):
+    '''
+    The key type and base64 encoded key, as written in a ``known_hosts`` file, of a raw host key from the server.
+
+    :param blob: Host key in the SSH wire format.
+    :type blob: ``bytes``
+    :return: ``tuple`` of ``(key_type, key)``
+    '''
+    length = int.from_bytes(blob[:4],'big')
+    return((blob[4:4+length].decode('ascii'),base64.b64encode(blob).decode('ascii')))
+
+
+class KnownHosts(object):
+    '''
+    Index of the host keys in the ``known_hosts`` file at ``path``, use :func:`redssh.known_hosts.get_known_hosts` to get the one shared by the process.
+    Plain, hashed and wildcard host entries are supported along with ``@revoked`` markers, ``@cert-authority`` lines are ignored.
+
+    :param path: Path to the ``known_hosts`` file, it does not need to exist yet.
+    :type path: ``str``
+    '''
+    def __init__(self,path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._stat = None
+        self._offset = 0
+        self._tail = b''
+        self._hosts = {}
+        self._hashed = []
+        self._patterns = []
+        self._lookups = {}
+
+    def _parse_line(self,line):
+        fields = line.decode('utf8','replace').split()
+        if len(fields)==0 or fields[0].startswith('#'):
+            return(None)
+        marker = None
+        if fields[0].startswith('@'):
+            marker = fields.pop(0)
+        if len(fields)<3:
+            return(None)
+        (hosts,key_type,key) = fields[:3]
+        entry = (marker,key_type,key)
+        if hosts.startswith('|1|'):
+            parts = hosts.split('|')
+            try:
+                self._hashed.append((base64.b64decode(parts[2]),base64.b64decode(parts[3]),entry))
+            except (IndexError,ValueError):
+                pass
+            return(None)
+        names = hosts.lower().split(',')
+        if any([char in hosts for char in '*?!'])==True:
+            self._patterns.append((names,entry))
+        else:
+            for name in names:
+                self._hosts.setdefault(name,[]).append(entry)
+
+    def _refresh(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._reset()
+            return(None)
+        state = (stat.st_ino,stat.st_size,stat.st_mtime_ns)
+        if state==self._stat:
+            return(None)
+        with open(self.path,'rb') as f:
+            # Only parse what was appended when the file is the same one and still starts with what was parsed before,
+            # otherwise it was replaced or edited so start again.
+            appended = False
+            if not self._stat==None and stat.st_ino==self._stat[0] and stat.st_size>=self._offset:
+                f.seek(self._offset-len(self._tail))
+                appended = f.read(len(self._tail))==self._tail
+            if appended==False:
+                self._reset()
+                f.seek(0)
+            data = f.read()
+        hashed_count = len(self._hashed)
+        patterns_count = len(self._patterns)
+        lines = data.split(b'\n')
+        for line in lines:
+            self._parse_line(line)
+        for name in self._lookups:
+            self._lookups[name] += self._match(name,self._hashed[hashed_count:],self._patterns[patterns_count:])
+        # A last line without a newline may still be being written, so it is parsed again next time as well.
+        complete = len(data)-len(lines[-1])
+        self._offset += complete
+        self._tail = (self._tail+data[:complete])[-64:]
+        self._stat = state
+
+    def _match(self,name,hashed,patterns):
+        matched = []
+        encoded_name = name.encode('utf8')
+        for (salt,digest,entry) in hashed:
+            if hmac.digest(salt,encoded_name,'sha1')==digest:
+                matched.append(entry)
+        for (host_patterns,entry) in patterns:
+            if self._match_patterns(name,host_patterns)==True:
+                matched.append(entry)
+        return(matched)
+
+    def _entries(self,name):
+        # Hashed and wildcard entries have to be tried one by one, so what matched is kept for each name until the file is replaced.
+        if not name in self._lookups:
+            self._lookups[name] = self._match(name,self._hashed,self._patterns)
+        return(self._hosts.get(name,[])+self._lookups[name])
+
+    def _match_patterns(self,name,patterns):
+        found = False
+        for pattern in patterns:
+            if pattern.startswith('!'):
+                if fnmatch.fnmatchcase(name,pattern[1:])==True:
+                    return(False)
+            elif fnmatch.fnmatchcase(name,pattern)==True:
+                found = True
+        return(found)
+
+    def _check(self,name,key_type,key):
+        result = enums.KnownHostsResult.not_found
+        for (marker,entry_key_type,entry_key) in self._entries(name):
+            if marker=='@revoked' and entry_key==key:
+                return(enums.KnownHostsResult.revoked)
+            if marker==None:
+                if entry_key_type==key_type and entry_key==key:
+                    result = enums.KnownHostsResult.match
+                elif entry_key_type==key_type and not result==enums.KnownHostsResult.match:
+                    result = enums.KnownHostsResult.mismatch
+        return(result)
+
+    def check(self,hostname,port,key_type,key):
+        '''
+        Check the host key offered by ``hostname`` on ``port`` against the file, picking up any changes to the file first.
+        A host with a different key of the same type is a mismatch, a host only known by other key types is not found.
+
+        :param hostname: Hostname or address connected to.
+        :type hostname: ``str``
+        :param port: SSH port connected to.
+        :type port: ``int``
+        :param key_type: Type of the key, eg ``ssh-ed25519``.
+        :type key_type: ``str``
+        :param key: Base64 encoded key.
+        :type key: ``str``
+        :return: :class:`redssh.enums.KnownHostsResult`
+        '''
+        name = host_name(hostname,port)
+        with self._lock:
+            self._refresh()
+            return(self._check(name,key_type,key))
+
+    def add(self,hostname,port,key_type,key):
+        '''
+        Append a line for the host key of ``hostname`` on ``port`` to the file, creating it if needed.
+        Nothing is written if another session added the same key while this one was waiting for the file lock.
+
+        :param hostname: Hostname or address connected to.
+        :type hostname: ``str``
+        :param port: SSH port connected to.
+        :type port: ``int``
+        :param key_type: Type of the key, eg ``ssh-ed25519``.
+        :type key_type: ``str``
+        :param key: Base64 encoded key.
+        :type key: ``str``
+        :return: ``bool`` - ``True`` if the line was written.
+        '''
+        name = host_name(hostname,port)
+        line = (name+' '+key_type+' '+key+'\n').encode('utf8')
+        directory = os.path.dirname(self.path)
+        if not directory=='':
+            os.makedirs(directory,mode=0o700,exist_ok=True)
+        with self._lock:
+            fd = os.open(self.path,os.O_RDWR|os.O_APPEND|os.O_CREAT,0o600)
+            try:
+                if not fcntl==None:
+                    fcntl.flock(fd,fcntl.LOCK_EX)
+                self._refresh()
+                if self._check(name,key_type,key)==enums.KnownHostsResult.match:
+                    return(False)
+                size = os.fstat(fd).st_size
+                if size>0:
+                    os.lseek(fd,size-1,os.SEEK_SET)
+                    if not os.read(fd,1)==b'\n':
+                        line = b'\n'+line
+                os.write(fd,line)
+                self._refresh()
+                return(True)
+            finally:
+                if not fcntl==None:
+                    fcntl.flock(fd,fcntl.LOCK_UN)
+                os.close(fd)
+
+
+_known_hosts = {}
+_known_hosts_lock = threading.Lock()
+
+def get_known_hosts(path):
+    '''
+    The :class:`redssh.known_hosts.KnownHosts` for the file at ``path`` shared by every session in this process.
+
+    :param path: Path to the ``known_hosts`` file.
+    :type path: ``str``
+    :return: :class:`redssh.known_hosts.KnownHosts`
+    '''
+    path = os.path.abspath(os.path.expanduser(path))
+    with _known_hosts_lock:
+        if not path in _known_hosts:
+            _known_hosts[path] = KnownHosts(path)
+        return(_known_hosts[path])
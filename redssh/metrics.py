@@ -0,0 +1,182 @@
+# RedSSH
+# Copyright (C) 2018 - 2022 Red_M ( http://bitbucket.com/Red_M )
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+'''
+Metrics emitted by a session when given a sink via ``RedSSH(metrics=sink)``.
+Durations are in seconds and sizes are in bytes.
+
+Counters:
+
+- ``block.eagain`` - Library calls that had to be retried because they would have blocked.
+- ``select.calls`` - Waits on the session socket.
+- ``auth.attempts`` - Authentication methods tried while connecting, tagged with ``method``.
+- ``compression.choice`` - Transfers that chose whether to compress, tagged with ``compression`` as ``gzip`` or ``none``.
+
+Histograms:
+
+- ``select.wait`` - Time spent waiting on the session socket.
+- ``lock.wait`` - Time spent waiting to get the session lock.
+- ``lock.hold`` - Time the session lock was held for a library call.
+- ``read.bytes`` - Size of each chunk read, tagged with ``channel``.
+- ``write.bytes`` - Size of each write handed to the SSH library, tagged with ``channel``.
+- ``connect.tcp``, ``connect.handshake``, ``connect.host_key``, ``connect.auth``, ``connect.channel`` - Time taken by each phase of connecting.
+- ``compression.ratio`` - Compressed size as a fraction of the original for each sample taken by auto compression.
+- ``link.throughput`` - Bytes per second that went over the session for each transfer measuring the link, tagged with ``compression``.
+
+The ``channel`` tag is ``sftp`` for SFTP file handles and ``channel`` for everything else, like shells, commands, SCP and tunnels.
+'''
+
+import math
+import threading
+
+
+class MetricsSink(object):
+    '''
+    Interface for receiving metrics from a session, subclass this to forward metrics to your own monitoring.
+    Both methods may be called from any thread that is using the session.
+    '''
+    def increment(self,name,value=1,tags=None):
+        '''
+        Add ``value`` to the counter ``name``.
+
+        :param name: Counter name.
+        :type name: ``str``
+        :param value: Amount to add.
+        :type value: ``int``
+        :param tags: Extra dimensions for the counter.
+        :type tags: ``dict``
+        :return: ``None``
+        '''
+        pass
+
+    def observe(self,name,value,tags=None):
+        '''
+        Record one sample of ``value`` for the histogram ``name``.
+
+        :param name: Histogram name.
+        :type name: ``str``
+        :param value: Sample to record.
+        :type value: ``float``
+        :param tags: Extra dimensions for the histogram.
+        :type tags: ``dict``
+        :return: ``None``
+        '''
+        pass
+
+
+class Histogram(object):
+    '''
+    Count, total, min and max of the samples recorded, plus a count per power of two bucket.
+    '''
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.buckets = {}
+
+    def add(self,value):
+        self.count+=1
+        self.total+=value
+        if self.min==None or value<self.min:
+            self.min = value
+        if self.max==None or value>self.max:
+            self.max = value
+        bucket = 0.0
+        if value>0:
+            (mantissa,exponent) = math.frexp(value)
+            bucket = 2.0**exponent
+        self.buckets[bucket] = self.buckets.get(bucket,0)+1
+
+    def mean(self):
+        if self.count==0:
+            return(0.0)
+        return(self.total/self.count)
+
+    def as_dict(self):
+        return({'count':self.count,'total':self.total,'min':self.min,'max':self.max,'mean':self.mean(),'buckets':dict(self.buckets)})
+
+
+class InMemoryMetrics(MetricsSink):
+    '''
+    Keeps every counter and histogram in memory, useful for finding out where time goes in a session.
+    Metrics with tags are kept apart from each other, eg SFTP reads get their own ``read.bytes`` histogram.
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def _key(self,name,tags):
+        if tags==None:
+            return(name)
+        return((name,tuple(sorted(tags.items()))))
+
+    def increment(self,name,value=1,tags=None):
+        key = self._key(name,tags)
+        with self._lock:
+            self.counters[key] = self.counters.get(key,0)+value
+
+    def observe(self,name,value,tags=None):
+        key = self._key(name,tags)
+        with self._lock:
+            if not key in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].add(value)
+
+    def counter(self,name):
+        '''
+        Total of the counter ``name`` over all of its tags.
+
+        :return: ``int``
+        '''
+        with self._lock:
+            return(sum([value for (key,value) in self.counters.items() if key==name or (isinstance(key,tuple) and key[0]==name)]))
+
+    def histogram(self,name):
+        '''
+        The histogram ``name`` merged over all of its tags.
+
+        :return: :class:`redssh.metrics.Histogram`
+        '''
+        merged = Histogram()
+        with self._lock:
+            for (key,histogram) in self.histograms.items():
+                if key==name or (isinstance(key,tuple) and key[0]==name):
+                    merged.count+=histogram.count
+                    merged.total+=histogram.total
+                    if histogram.min!=None and (merged.min==None or histogram.min<merged.min):
+                        merged.min = histogram.min
+                    if histogram.max!=None and (merged.max==None or histogram.max>merged.max):
+                        merged.max = histogram.max
+                    for (bucket,count) in histogram.buckets.items():
+                        merged.buckets[bucket] = merged.buckets.get(bucket,0)+count
+        return(merged)
+
+    def snapshot(self):
+        '''
+        :return: ``dict`` - of ``{'counters': {key: int}, 'histograms': {key: dict}}``
+        '''
+        with self._lock:
+            return({
+                'counters':dict(self.counters),
+                'histograms':dict([(key,histogram.as_dict()) for (key,histogram) in self.histograms.items()])
+            })
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.histograms = {}
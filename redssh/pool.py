@@ -0,0 +1,288 @@
+# RedSSH
+# Copyright (C) 2018 - 2022 Red_M ( http://bitbucket.com/Red_M )
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import time
+import socket
+import select
+import hashlib
+import threading
+import contextlib
+
+from . import exceptions
+from .redssh import RedSSH
+
+
+class ConnectionPool(object):
+    '''
+    Hands out already connected and authenticated :class:`redssh.RedSSH` sessions so that repeated work against the same
+    hosts does not pay for a TCP connect, key exchange, host key check and authentication every time.
+
+    Sessions are keyed by ``(hostname, port, username, auth)``, where ``auth`` is every authentication option given to
+    :func:`redssh.pool.ConnectionPool.acquire`. Sessions handed back via :func:`redssh.pool.ConnectionPool.release` are
+    checked for liveness before being reused and are replaced by a new connection if they have died.
+
+    :param max_per_key: Maximum amount of sessions, idle or in use, to keep open per key.
+    :type max_per_key: ``int``
+    :param idle_timeout: Close sessions that have been idle for this many seconds, ``0`` keeps idle sessions forever.
+    :type idle_timeout: ``float``
+    :param redssh_class: Class to instance new sessions from.
+    :type redssh_class: :class:`redssh.RedSSH`
+    :param redssh_kwargs: Any other keyword arguments are passed on to ``redssh_class`` when creating a new session.
+    :type redssh_kwargs: ``dict``
+    '''
+    def __init__(self,max_per_key=4,idle_timeout=300.0,redssh_class=RedSSH,**redssh_kwargs):
+        self.max_per_key = max_per_key
+        self.idle_timeout = idle_timeout
+        self.redssh_class = redssh_class
+        self.redssh_kwargs = redssh_kwargs
+        self._lock = threading.Condition()
+        self._idle = {}
+        self._in_use = {}
+        self._counts = {}
+        # Sessions that are still connecting by the thread connecting them, so that something timing the thread can abort a stalled connect.
+        self._connecting = {}
+        self._closed = False
+
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self,*args):
+        self.close()
+
+    def _secret(self,value):
+        if value==None:
+            return(None)
+        if isinstance(value,str):
+            value = value.encode('utf8')
+        return(hashlib.sha256(value).hexdigest())
+
+    def key(self,hostname,port=22,username='',password=None,allow_agent=False,host_based=None,key_filepath=None,passphrase=None,look_for_keys=False):
+        '''
+        Build the key sessions are pooled under. Secrets are hashed so that the key is safe to log.
+        See :func:`redssh.RedSSH.connect` for the arguments.
+
+        :return: ``tuple``
+        '''
+        if isinstance(key_filepath,list):
+            key_filepath = tuple(key_filepath)
+        auth = (self._secret(password),allow_agent,host_based,key_filepath,self._secret(passphrase),look_for_keys)
+        return((hostname,port,username,auth))
+
+    def is_alive(self,rs):
+        '''
+        Check if a pooled session can still be used.
+        The socket is checked for the remote end hanging up, a keepalive is sent if the client supports it and the main
+        channel must not have recieved an ``EOF``.
+
+        :param rs: Session to check.
+        :type rs: :class:`redssh.RedSSH`
+        :return: ``bool``
+        '''
+        client = rs.client
+        if client.past_login==False or client.__shutdown_all__.is_set()==True:
+            return(False)
+        try:
+            (readable,writable,errored) = select.select([client.sock],[],[client.sock],0)
+            if len(errored)>0:
+                return(False)
+            if len(readable)>0 and client.sock.recv(1,socket.MSG_PEEK)==b'':
+                return(False)
+            if 'keepalive_send' in dir(client.session):
+                client._block(client.session.keepalive_send)
+            elif 'is_connected' in dir(client.session) and client.session.is_connected()==False:
+                return(False)
+            if rs.eof()==True:
+                return(False)
+        except Exception:
+            return(False)
+        return(True)
+
+    def _connect(self,hostname,port,username,connect_kwargs):
+        rs = self.redssh_class(**self.redssh_kwargs)
+        with self._lock:
+            self._connecting[threading.get_ident()] = rs
+        try:
+            rs.connect(hostname,port,username,**connect_kwargs)
+        except:
+            self._close_session(rs)
+            raise
+        finally:
+            with self._lock:
+                self._connecting.pop(threading.get_ident(),None)
+        session = rs.client.session
+        if 'keepalive_config' in dir(session) and rs.client.ssh_keepalive_interval==0:
+            # Only sends a keepalive from is_alive() when the session has been quiet for a second,
+            # without this libssh2 never puts anything on the wire for the liveness check.
+            session.keepalive_config(False,1)
+        return(rs)
+
+    def _close_session(self,rs):
+        try:
+            rs.exit()
+        except Exception:
+            pass
+
+    def _forget(self,key):
+        with self._lock:
+            self._counts[key]-=1
+            if self._counts[key]==0:
+                del self._counts[key]
+            self._lock.notify_all()
+
+    def _expired(self,last_used,now):
+        return(self.idle_timeout>0 and now-last_used>=self.idle_timeout)
+
+    def acquire(self,hostname,port=22,username='',password=None,allow_agent=False,host_based=None,key_filepath=None,passphrase=None,
+        look_for_keys=False,timeout=None,wait_timeout=None):
+        '''
+        Get a connected session for the given host and credentials, reusing an idle one if there is one that is still alive.
+        Takes the same arguments as :func:`redssh.RedSSH.connect` except for ``sock``.
+        The session must be given back with :func:`redssh.pool.ConnectionPool.release` when done with.
+
+        :param wait_timeout: How long to wait for a session when ``max_per_key`` sessions are already in use, ``None`` waits forever.
+        :type wait_timeout: ``float``
+        :return: :class:`redssh.RedSSH`
+        :raises: :class:`redssh.exceptions.PoolExhaustedException` if no session became available within ``wait_timeout``.
+        '''
+        key = self.key(hostname,port,username,password,allow_agent,host_based,key_filepath,passphrase,look_for_keys)
+        connect_kwargs = {'password':password,'allow_agent':allow_agent,'host_based':host_based,'key_filepath':key_filepath,
+            'passphrase':passphrase,'look_for_keys':look_for_keys,'timeout':timeout}
+        deadline = None
+        if not wait_timeout==None:
+            deadline = time.monotonic()+wait_timeout
+        self.prune()
+        while True:
+            rs = None
+            last_used = None
+            with self._lock:
+                while True:
+                    if self._closed==True:
+                        raise(exceptions.PoolClosedException())
+                    idle = self._idle.get(key,[])
+                    if len(idle)>0:
+                        (rs,last_used) = idle.pop()
+                        break
+                    if self._counts.get(key,0)<self.max_per_key:
+                        self._counts[key] = self._counts.get(key,0)+1
+                        break
+                    remaining = None
+                    if not deadline==None:
+                        remaining = deadline-time.monotonic()
+                        if remaining<=0:
+                            raise(exceptions.PoolExhaustedException(hostname,port,username))
+                    self._lock.wait(remaining)
+            if rs==None:
+                try:
+                    rs = self._connect(hostname,port,username,connect_kwargs)
+                except:
+                    self._forget(key)
+                    raise
+            elif self._expired(last_used,time.monotonic())==True or self.is_alive(rs)==False:
+                self._close_session(rs)
+                self._forget(key)
+                continue
+            with self._lock:
+                self._in_use[rs] = key
+            return(rs)
+
+    def release(self,rs,discard=False):
+        '''
+        Give a session back to the pool.
+
+        :param rs: Session that was returned by :func:`redssh.pool.ConnectionPool.acquire`.
+        :type rs: :class:`redssh.RedSSH`
+        :param discard: Close the session instead of keeping it for reuse, eg when it was left in an unknown state.
+        :type discard: ``bool``
+        :return: ``None``
+        '''
+        with self._lock:
+            key = self._in_use.pop(rs)
+            if discard==False and self._closed==False:
+                if not key in self._idle:
+                    self._idle[key] = []
+                self._idle[key].append((rs,time.monotonic()))
+                self._lock.notify_all()
+                return
+        self._close_session(rs)
+        self._forget(key)
+
+    @contextlib.contextmanager
+    def session(self,*args,**kwargs):
+        '''
+        Context manager around :func:`redssh.pool.ConnectionPool.acquire` and :func:`redssh.pool.ConnectionPool.release`.
+        The session is discarded instead of reused if the block raises.
+
+        :return: :class:`redssh.RedSSH`
+        '''
+        rs = self.acquire(*args,**kwargs)
+        try:
+            yield(rs)
+        except:
+            self.release(rs,True)
+            raise
+        self.release(rs)
+
+    def prune(self):
+        '''
+        Close every idle session that has been idle for longer than ``idle_timeout``.
+
+        :return: ``int`` - Amount of sessions closed.
+        '''
+        expired = []
+        now = time.monotonic()
+        with self._lock:
+            for key in list(self._idle):
+                keep = []
+                for (rs,last_used) in self._idle[key]:
+                    if self._expired(last_used,now)==True:
+                        expired.append((key,rs))
+                    else:
+                        keep.append((rs,last_used))
+                if len(keep)>0:
+                    self._idle[key] = keep
+                else:
+                    del self._idle[key]
+        for (key,rs) in expired:
+            self._close_session(rs)
+            self._forget(key)
+        return(len(expired))
+
+    def stats(self):
+        '''
+        Amount of sessions per key.
+
+        :return: ``dict`` - of ``{key: (idle, in_use)}``
+        '''
+        with self._lock:
+            return(dict([(key,(len(self._idle.get(key,[])),count-len(self._idle.get(key,[])))) for (key,count) in self._counts.items()]))
+
+    def close(self):
+        '''
+        Close every idle session and stop handing out sessions.
+        Sessions still in use are closed when they are released.
+
+        :return: ``None``
+        '''
+        with self._lock:
+            self._closed = True
+            idle = self._idle
+            self._idle = {}
+            self._lock.notify_all()
+        for key in idle:
+            for (rs,last_used) in idle[key]:
+                self._close_session(rs)
+                self._forget(key)
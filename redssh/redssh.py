@@ -33,13 +33,27 @@ class RedSSH(object):
 
     :param encoding: Set the encoding to something other than the default of ``'utf8'`` when your target SSH server doesn't return UTF-8.
     :type encoding: ``str``
+    :param metrics: Report counters and timings from inside the session to this sink, see :mod:`redssh.metrics`. ``None`` disables metrics.
+    :type metrics: :class:`redssh.metrics.MetricsSink`
+    :param tunnel_buffer_size: Most bytes buffered for each connection through a tunnel in each direction. Bigger buffers help bulk transfers over fast links.
+    :type tunnel_buffer_size: ``int``
+    :param method_profile: Negotiate ciphers, MACs and key exchanges from one of the built in profiles, ``throughput``, ``latency`` or ``low_cpu``.
+        Explicit ``method_preferences`` still win. ``benchmarks/bench.py --only ciphers`` shows which ciphers are fastest on your hosts.
+    :type method_profile: :class:`redssh.enums.MethodProfile`
+    :param auth_cache: Remember which authentication method worked for each host, loaded keys and agent connections in this cache, see :mod:`redssh.auth`.
+        ``None``, the default, disables caching. Give every session :data:`redssh.auth.shared_cache` to share one cache across the process,
+        keys in a cache stay decrypted in memory until :func:`redssh.auth.AuthCache.clear` is called.
+    :type auth_cache: :class:`redssh.auth.AuthCache`
     '''
     def __init__(self,encoding='utf8',terminal='vt100',known_hosts=None,ssh_host_key_verification=enums.SSHHostKeyVerify.warn,
-        ssh_keepalive_interval=0.0,set_flags={},method_preferences={},callbacks={},auto_terminate_tunnels=False,tcp_nodelay=False):
+        ssh_keepalive_interval=0.0,set_flags={},method_preferences={},callbacks={},auto_terminate_tunnels=False,tcp_nodelay=False,metrics=None,tunnel_buffer_size=1048576,
+        method_profile=None,auth_cache=None):
         self.debug = False
         self.client = self.pick_client()(encoding=encoding,terminal=terminal,known_hosts=known_hosts,ssh_host_key_verification=ssh_host_key_verification,
-            ssh_keepalive_interval=ssh_keepalive_interval,set_flags=set_flags,method_preferences=method_preferences,callbacks=callbacks,
-            auto_terminate_tunnels=auto_terminate_tunnels,tcp_nodelay=tcp_nodelay)
+            ssh_keepalive_interval=ssh_keepalive_interval,set_flags=set_flags,method_preferences=method_preferences,method_profile=method_profile,callbacks=callbacks,
+            auto_terminate_tunnels=auto_terminate_tunnels,tcp_nodelay=tcp_nodelay,tunnel_buffer_size=tunnel_buffer_size)
+        self.client.metrics = metrics
+        self.client.auth_cache = auth_cache
         self.enums = self.client.enums
 
     def pick_client(self,ssh_client=None,custom_ssh_clients={}):
@@ -126,8 +140,8 @@ class RedSSH(object):
         Send data to the remote session.
         Only works if the current session has made it past the login process.
 
-        :param string: String to send to the remote session.
-        :type string: ``str``
+        :param string: String to send to the remote session, ``bytes`` or any other object supporting the buffer protocol can also be sent.
+        :type string: ``str``/``bytes``
         :return: ``int`` - Amount of bytes sent to remote machine.
         '''
         return(self.client.send(string))
@@ -173,6 +187,23 @@ class RedSSH(object):
         '''
         return(self.client.execute_command(command,env=env,channel=channel,pty=pty))
 
+    def execute_many(self,commands,env=None,pty=False,max_channels=8):
+        '''
+        Run several commands at the same time on this session, each on its own channel, without needing a connection per command.
+        This will block until every command has exited.
+
+        :param commands: Commands to execute.
+        :type commands: ``list``
+        :param env: Environment variables to set for every command.
+        :type env: ``dict``
+        :param pty: Request a pty for the commands to be executed via.
+        :type pty: ``bool``
+        :param max_channels: Maximum amount of channels to have open at once, the remaining commands are started as earlier ones finish.
+        :type max_channels: ``int``
+        :return: ``list`` - of ``tuple (int, str)`` - of ``(return_code, command_output)`` in the same order as ``commands``
+        '''
+        return(self.client.execute_many(commands,env=env,pty=pty,max_channels=max_channels))
+
     def start_sftp(self):
         '''
         Start the SFTP client.
@@ -220,7 +251,7 @@ class RedSSH(object):
         :type remote_port: ``int``
         :param bind_addr: The bind address on this machine to bind to for the local port.
         :type bind_addr: ``str``
-        :param error_level: The level of verbosity that errors in tunnel threads will use.
+        :param error_level: The level of verbosity that errors in tunnels will use.
         :type error_level: :class:`redssh.enums.TunnelErrorLevel`
         :return: ``int`` The local port that has been bound.
         '''
@@ -237,7 +268,7 @@ class RedSSH(object):
         :type remote_host: ``str``
         :param remote_port: The remote host's port to connect to via the local machine.
         :type remote_port: ``int``
-        :param error_level: The level of verbosity that errors in tunnel threads will use.
+        :param error_level: The level of verbosity that errors in tunnels will use.
         :type error_level: :class:`redssh.enums.TunnelErrorLevel`
         :return: ``None``
         '''
@@ -255,7 +286,7 @@ class RedSSH(object):
         :type local_port: ``int``
         :param bind_addr: The bind address on this machine to bind to for the local port.
         :type bind_addr: ``str``
-        :param error_level: The level of verbosity that errors in tunnel threads will use.
+        :param error_level: The level of verbosity that errors in tunnels will use.
         :type error_level: :class:`redssh.enums.TunnelErrorLevel`
         :return: ``int`` The local port that has been bound.
         '''
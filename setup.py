@@ -52,7 +52,9 @@ package_excludes = [
     'tests',
     'tests.*',
     '*.tests',
-    '*.tests.*'
+    '*.tests.*',
+    'benchmarks',
+    'benchmarks.*'
 ]
 
 setuptools.setup(
@@ -0,0 +1,79 @@
+import os
+import asyncio
+import unittest
+import redssh
+
+from .base_test import base_test as unittest_base
+
+class RedSSHUnitTest(unittest_base):
+
+    async def start_async_session(self):
+        server_port = self.start_ssh_server()
+        rs = redssh.AsyncRedSSH()
+        await rs.connect(self.server_bind_host,server_port,username=self.username,key_filepath=self.key_path)
+        return(rs)
+
+    async def wait_for(self,rs,wait_string):
+        wait_string = wait_string.encode('utf8')
+        read_data = b''
+        while not wait_string in read_data:
+            read_data+=await rs.read(True)
+        return(read_data)
+
+    def test_async_read_write(self):
+        async def run():
+            rs = await self.start_async_session()
+            await self.wait_for(rs,self.prompt)
+            await rs.send('echo async_test\r\n')
+            out = await self.wait_for(rs,'async_test\r\n')
+            assert b'async_test' in out
+            assert await rs.eof()==False
+            await rs.exit()
+        for client in sorted(redssh.clients.enabled_clients):
+            with self.subTest(client=client):
+                redssh.clients.default_client = client
+                asyncio.run(run())
+
+    def test_async_exec_command(self):
+        async def run():
+            rs = await self.start_async_session()
+            (ret,out) = await rs.execute_command('echo test')
+            assert ret==0
+            assert out==b'test\n'
+            (ret,out) = await rs.execute_command('exit 3')
+            assert ret==3
+            await rs.exit()
+        for client in sorted(redssh.clients.enabled_clients):
+            with self.subTest(client=client):
+                redssh.clients.default_client = client
+                asyncio.run(run())
+
+    def test_async_concurrent_sessions(self):
+        async def run_one(i):
+            rs = await self.start_async_session()
+            (ret,out) = await rs.execute_command('sleep 0.5; echo '+str(i))
+            await rs.exit()
+            return(ret,out)
+        async def run():
+            results = await asyncio.gather(*[run_one(i) for i in range(5)])
+            assert results==[(0,(str(i)+'\n').encode('utf8')) for i in range(5)]
+        for client in sorted(redssh.clients.enabled_clients):
+            with self.subTest(client=client):
+                redssh.clients.default_client = client
+                asyncio.run(run())
+
+    def test_async_execute_many(self):
+        async def run():
+            rs = await self.start_async_session()
+            results = await rs.execute_many(['echo '+str(i)+'; exit '+str(i) for i in range(4)],max_channels=2)
+            assert results==[(i,(str(i)+'\n').encode('utf8')) for i in range(4)]
+            await rs.exit()
+        for client in sorted(redssh.clients.enabled_clients):
+            with self.subTest(client=client):
+                redssh.clients.default_client = client
+                asyncio.run(run())
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -85,6 +85,80 @@ class RedSSHUnitTest(unittest_base):
                     failed = True
                 assert(failed==True)
 
+    def test_auth_cache_remembers_method(self):
+        for client in sorted(redssh.clients.enabled_clients):
+            with self.subTest(client=client):
+                redssh.clients.default_client = client
+                auth_cache = redssh.auth.AuthCache()
+                server_port = self.start_ssh_server()
+                connect_args = {'password':'','allow_agent':False,'key_filepath':[self.key_pub_path,self.key_path]}
+                for attempts in [2,1,1]:
+                    metrics = redssh.metrics.InMemoryMetrics()
+                    sshs = self.start_ssh_session(server_port=server_port,class_init={'metrics':metrics,'auth_cache':auth_cache},connect_args=dict(connect_args))
+                    sshs.wait_for(self.prompt)
+                    assert metrics.counter('auth.attempts')==attempts
+                    assert auth_cache.method(self.server_bind_host,server_port,self.username)==('publickey',self.key_path)
+                metrics = redssh.metrics.InMemoryMetrics()
+                sshs = self.start_ssh_session(server_port=server_port,class_init={'metrics':metrics},connect_args=dict(connect_args))
+                sshs.wait_for(self.prompt)
+                assert sshs.rs.client.auth_cache==None
+                assert metrics.counter('auth.attempts')==2
+                failed = False
+                try:
+                    self.start_ssh_session(server_port=server_port,class_init={'auth_cache':auth_cache},connect_args={'password':'','allow_agent':False,'key_filepath':self.bad_key_path})
+                except redssh.exceptions.AuthenticationFailedException:
+                    failed = True
+                assert failed==True
+                assert auth_cache.method(self.server_bind_host,server_port,self.username)==None
+
+    def test_auth_cache_keys(self):
+        auth_cache = redssh.auth.AuthCache()
+        loads = []
+        def loader(path,passphrase):
+            loads.append(passphrase)
+            return(object())
+        key = auth_cache.load_key(self.key_path,None,loader)
+        assert auth_cache.load_key(self.key_path,'',loader) is key
+        assert not auth_cache.load_key(self.key_path,'secret',loader) is key
+        assert auth_cache.load_key(self.key_path,'secret',loader) is auth_cache.load_key(self.key_path,'secret',loader)
+        assert loads==['','secret']
+        stat = os.stat(self.key_path)
+        os.utime(self.key_path,ns=(stat.st_atime_ns,stat.st_mtime_ns+1000000000))
+        assert not auth_cache.load_key(self.key_path,'',loader) is key
+        assert loads==['','secret','']
+        auth_cache.clear()
+        auth_cache.load_key(self.key_path,'',loader)
+        assert len(loads)==4
+
+    def test_auth_cache_agent(self):
+        for client in sorted(redssh.clients.enabled_clients):
+            with self.subTest(client=client):
+                redssh.clients.default_client = client
+                old_ssh_agent = os.environ.pop('SSH_AUTH_SOCK',None)
+                proc = subprocess.run('/usr/bin/ssh-agent',env=os.environ,capture_output=True,check=True,text=True)
+                os.environ['SSH_AUTH_SOCK'] = proc.stdout.split(';')[0].split('=')[-1]
+                agent_pid = proc.stdout.split(';')[-2].split(' ')[-1]
+                auth_cache = redssh.auth.AuthCache()
+                try:
+                    subprocess.run(['/usr/bin/ssh-add',self.key_path],env=os.environ,check=True,capture_output=True)
+                    server_port = self.start_ssh_server()
+                    for i in range(3):
+                        metrics = redssh.metrics.InMemoryMetrics()
+                        sshs = self.start_ssh_session(server_port=server_port,class_init={'metrics':metrics,'auth_cache':auth_cache},connect_args={'allow_agent':True,'key_filepath':self.key_pub_path})
+                        sshs.wait_for(self.prompt)
+                        assert auth_cache.method(self.server_bind_host,server_port,self.username)[0]=='agent'
+                        if i>0:
+                            assert metrics.counter('auth.attempts')==1
+                    if client==redssh.clients.SSHClient.libssh:
+                        assert list(auth_cache._agents)==[os.environ['SSH_AUTH_SOCK']]
+                finally:
+                    auth_cache.clear()
+                    subprocess.run(['/bin/kill',agent_pid],env=os.environ,check=True)
+                    if old_ssh_agent==None:
+                        del os.environ['SSH_AUTH_SOCK']
+                    else:
+                        os.environ['SSH_AUTH_SOCK'] = old_ssh_agent
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -1,4 +1,5 @@
 import os
+import shutil
 import time
 import socket
 import pytest
@@ -21,6 +22,16 @@ class RedSSHUnitTest(unittest_base):
                 sshs.sendline('echo')
                 assert sshs.rs.eof()==False
 
+    def test_basic_send_buffers(self):
+        for client in sorted(redssh.clients.enabled_clients):
+            with self.subTest(client=client):
+                redssh.clients.default_client = client
+                sshs = self.start_ssh_session()
+                sshs.wait_for(self.prompt)
+                for data in [b'echo bytes_test\r\n',bytearray(b'echo bytearray_test\r\n'),memoryview(b'xxecho memoryview_test\r\n')[2:]]:
+                    assert sshs.rs.send(data)==len(data)
+                    sshs.wait_for(bytes(data[5:-2]).decode('utf8')+'\r\n')
+
     def test_basic_set_session_options(self):
         for client in sorted(redssh.clients.enabled_clients):
             with self.subTest(client=client):
@@ -31,7 +42,7 @@ class RedSSHUnitTest(unittest_base):
                 if client=='LibSSH2':
                     res = sshs.rs.methods(redssh.libssh2.LIBSSH2_METHOD_CRYPT_SC)
                 elif client=='LibSSH':
-                    pass # TODO
+                    res = sshs.rs.methods('CIPHERS_S_C')
 
 
     def test_basic_setenv(self):
@@ -86,6 +97,26 @@ class RedSSHUnitTest(unittest_base):
                 sshs.wait_for(self.prompt)
                 sshs.sendline('echo')
 
+    def test_method_profiles(self):
+        for client in sorted(redssh.clients.enabled_clients):
+            with self.subTest(client=client):
+                redssh.clients.default_client = client
+                if client=='LibSSH2':
+                    crypt = redssh.libssh2.LIBSSH2_METHOD_CRYPT_CS
+                elif client=='LibSSH':
+                    crypt = 'CIPHERS_C_S'
+                for profile in redssh.enums.MethodProfile:
+                    sshs = self.start_ssh_session(class_init={'method_profile':profile})
+                    assert sshs.rs.execute_command('echo profile')[1]==b'profile\n'
+                    if not profile==redssh.enums.MethodProfile.default:
+                        negotiated = sshs.rs.methods(crypt)
+                        if isinstance(negotiated,bytes):
+                            negotiated = negotiated.decode('utf8')
+                        assert negotiated in redssh.enums.METHOD_PROFILES[profile][redssh.enums.MethodKind.crypt].split(',')
+                    self.end_ssh_session(sshs)
+                sshs = self.start_ssh_session(class_init={'method_profile':'throughput','method_preferences':{crypt:'aes256-ctr'}})
+                assert sshs.rs.methods(crypt) in ('aes256-ctr',b'aes256-ctr')
+
     def test_known_hosts(self):
         for client in sorted(redssh.clients.enabled_clients):
             with self.subTest(client=client):
@@ -151,6 +182,33 @@ class RedSSHUnitTest(unittest_base):
                     assert ret == 0
                 except libssh2_exceptions.BadUseError:
                     pass
+                # More stderr than fits in the channel window must not stall the command.
+                assert sshs.rs.execute_command('head -c 4000000 /dev/zero >&2; echo ok')==(0,b'ok\n')
+                assert sshs.rs.execute_command('echo $LC_REDSSH_TEST; exit 3',env={'LC_REDSSH_TEST':'test'})==(3,b'test\n')
+                assert sshs.rs.execute_command('echo channel',channel=sshs.rs.client.open_channel(client==redssh.clients.SSHClient.libssh,False))==(0,b'channel\n')
+
+    def test_execute_many(self):
+        for client in sorted(redssh.clients.enabled_clients):
+            with self.subTest(client=client):
+                redssh.clients.default_client = client
+                sshs = self.start_ssh_session()
+                sshs.wait_for(self.prompt)
+                barrier_path = os.path.join(self.real_remote_dir,'test_execute_many',client.value)
+                shutil.rmtree(barrier_path,ignore_errors=True)
+                os.makedirs(barrier_path)
+                # The first 4 commands only see each other's marker files when they are running at the same time.
+                barrier = 'touch '+barrier_path+'/$MARK; n=0; while [ $(ls '+barrier_path+' | wc -l) -lt 4 ] && [ $n -lt 100 ]; do sleep 0.1; n=$((n+1)); done; '
+                barrier += 'if [ $n -lt 100 ]; then echo together; else echo alone; fi; '
+                commands = ['MARK='+str(i)+'; '+barrier+'echo '+str(i)+'; exit '+str(i) for i in range(4)]
+                commands += ['echo $LC_REDSSH_TEST; exit 4','echo err >&2; echo ok; exit 5','head -c 300000 /dev/zero >&2; echo ok']
+                commands.append('head -c 300000 /dev/zero')
+                results = sshs.rs.execute_many(commands,env={'LC_REDSSH_TEST':'test'},max_channels=4)
+                assert results[:4]==[(i,('together\n'+str(i)+'\n').encode('utf8')) for i in range(4)]
+                assert results[4]==(4,b'test\n')
+                assert results[5]==(5,b'ok\n')
+                assert results[6]==(0,b'ok\n')
+                assert results[7]==(0,b'\x00'*300000)
+                assert sshs.rs.execute_many([])==[]
 
 
 if __name__ == '__main__':
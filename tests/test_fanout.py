@@ -0,0 +1,76 @@
+import os
+import socket
+import unittest
+import redssh
+
+from .base_test import base_test as unittest_base
+
+class RedSSHUnitTest(unittest_base):
+
+    def start_fanout(self,**kwargs):
+        return(redssh.fanout.FanOut(username=self.username,key_filepath=self.key_path,**kwargs))
+
+    def test_fanout_execute_command(self):
+        for client in sorted(redssh.clients.enabled_clients):
+            with self.subTest(client=client):
+                redssh.clients.default_client = client
+                hosts = [{'hostname':self.server_bind_host,'port':self.start_ssh_server()} for i in range(3)]
+                fan = self.start_fanout(max_workers=2,max_connecting=1)
+                results = list(fan.execute_command(hosts*2,'echo $((1+1))'))
+                assert len(results)==6
+                for host_result in results:
+                    assert host_result.ok==True
+                    assert host_result.result==(0,b'2\n')
+                    assert host_result.attempts==1
+                stats = fan.stats.summary()
+                assert stats['hosts']==6
+                assert stats['succeeded']==6
+                assert stats['latency']['max']>=stats['latency']['p50']>0
+
+    def test_fanout_retries_and_timeout(self):
+        for client in sorted(redssh.clients.enabled_clients):
+            with self.subTest(client=client):
+                redssh.clients.default_client = client
+                server_port = self.start_ssh_server()
+                dead_host = {'hostname':self.server_bind_host,'port':self.start_ssh_server()}
+                self.ssh_servers.pop().stop()
+                fan = self.start_fanout(retries=1,retry_delay=0.1,timeout=1.0)
+                results = dict([(host_result.host['port'],host_result) for host_result in fan.execute_command([{'hostname':self.server_bind_host,'port':server_port},dead_host],'sleep 5')])
+                assert isinstance(results[server_port].error,redssh.exceptions.FanOutTimeoutException)
+                assert results[server_port].attempts==2
+                assert results[dead_host['port']].ok==False
+                assert results[dead_host['port']].attempts==2
+                assert fan.stats.summary()['failed']==2
+
+    def test_fanout_timeout_covers_connect(self):
+        # The kernel completes the TCP connect but nothing ever answers, so the handshake stalls.
+        stalled = socket.socket(socket.AF_INET,socket.SOCK_STREAM)
+        self.addCleanup(stalled.close)
+        stalled.bind((self.server_bind_host,0))
+        stalled.listen(8)
+        host = {'hostname':self.server_bind_host,'port':stalled.getsockname()[1]}
+        for client in sorted(redssh.clients.enabled_clients):
+            for use_pool in [False,True]:
+                with self.subTest(client=client,use_pool=use_pool):
+                    redssh.clients.default_client = client
+                    with redssh.pool.ConnectionPool() as pool:
+                        fan = self.start_fanout(timeout=1.0,pool=[None,pool][use_pool])
+                        results = list(fan.execute_command([host],'echo test'))
+                        assert isinstance(results[0].error,redssh.exceptions.FanOutTimeoutException),results[0].error
+                        assert results[0].latency<5.0
+                        assert pool._counts=={}
+
+    def test_fanout_with_pool(self):
+        for client in sorted(redssh.clients.enabled_clients):
+            with self.subTest(client=client):
+                redssh.clients.default_client = client
+                host = {'hostname':self.server_bind_host,'port':self.start_ssh_server()}
+                with redssh.pool.ConnectionPool(max_per_key=2) as pool:
+                    fan = self.start_fanout(max_workers=2,pool=pool)
+                    results = list(fan.run([host]*6,lambda rs: rs.execute_command('echo test')))
+                    assert [host_result.result for host_result in results]==[(0,b'test\n')]*6
+                    assert list(pool.stats().values())[0][0]<=2
+
+
+if __name__ == '__main__':
+    unittest.main()
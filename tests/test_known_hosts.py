@@ -0,0 +1,119 @@
+import os
+import hmac
+import base64
+import hashlib
+import threading
+import unittest
+import redssh
+
+from .base_test import base_test as unittest_base
+
+class RedSSHUnitTest(unittest_base):
+
+    def known_hosts_file(self,test_name):
+        known_hosts_file = os.path.join('tests',test_name+'_known_hosts')
+        try:
+            os.remove(known_hosts_file)
+        except:
+            pass
+        self.addCleanup(lambda: os.path.exists(known_hosts_file) and os.remove(known_hosts_file))
+        return(known_hosts_file)
+
+    def test_known_hosts_index(self):
+        known_hosts_file = self.known_hosts_file('test_known_hosts_index')
+        salt = os.urandom(20)
+        hashed_name = hmac.new(salt,b'[hashed.example.com]:2222',hashlib.sha1).digest()
+        with open(known_hosts_file,'w') as f:
+            f.write('# comment\n')
+            f.write('plain.example.com,10.0.0.1 ssh-ed25519 AAAAplain\n')
+            f.write('|1|'+base64.b64encode(salt).decode('ascii')+'|'+base64.b64encode(hashed_name).decode('ascii')+' ecdsa-sha2-nistp256 AAAAhashed\n')
+            f.write('*.wild.example.com,!bad.wild.example.com ssh-rsa AAAAwild\n')
+            f.write('@revoked plain.example.com ssh-rsa AAAArevoked\n')
+            f.write('@cert-authority *.example.com ssh-rsa AAAAca\n')
+        known_hosts = redssh.known_hosts.KnownHosts(known_hosts_file)
+        result = redssh.enums.KnownHostsResult
+        assert known_hosts.check('plain.example.com',22,'ssh-ed25519','AAAAplain')==result.match
+        assert known_hosts.check('10.0.0.1',22,'ssh-ed25519','AAAAplain')==result.match
+        assert known_hosts.check('PLAIN.example.com',22,'ssh-ed25519','AAAAother')==result.mismatch
+        assert known_hosts.check('plain.example.com',22,'ssh-ed448','AAAAother')==result.not_found
+        assert known_hosts.check('plain.example.com',2222,'ssh-ed25519','AAAAplain')==result.not_found
+        assert known_hosts.check('plain.example.com',22,'ssh-rsa','AAAArevoked')==result.revoked
+        assert known_hosts.check('hashed.example.com',2222,'ecdsa-sha2-nistp256','AAAAhashed')==result.match
+        assert known_hosts.check('hashed.example.com',22,'ecdsa-sha2-nistp256','AAAAhashed')==result.not_found
+        assert known_hosts.check('host.wild.example.com',22,'ssh-rsa','AAAAwild')==result.match
+        assert known_hosts.check('bad.wild.example.com',22,'ssh-rsa','AAAAwild')==result.not_found
+        assert known_hosts.check('ca.example.com',22,'ssh-rsa','AAAAca')==result.not_found
+
+    def test_known_hosts_refresh(self):
+        known_hosts_file = self.known_hosts_file('test_known_hosts_refresh')
+        result = redssh.enums.KnownHostsResult
+        known_hosts = redssh.known_hosts.get_known_hosts(known_hosts_file)
+        assert known_hosts is redssh.known_hosts.get_known_hosts(os.path.abspath(known_hosts_file))
+        assert known_hosts.check('one.example.com',22,'ssh-ed25519','AAAAone')==result.not_found
+        with open(known_hosts_file,'w') as f:
+            f.write('one.example.com ssh-ed25519 AAAAone\n')
+        assert known_hosts.check('one.example.com',22,'ssh-ed25519','AAAAone')==result.match
+        offset = known_hosts._offset
+        # Lines appended by something else are picked up without parsing the file again.
+        with open(known_hosts_file,'a') as f:
+            f.write('two.example.com ssh-ed25519 AAAAtwo')
+        assert known_hosts.check('two.example.com',22,'ssh-ed25519','AAAAtwo')==result.match
+        assert known_hosts._offset==offset
+        assert known_hosts.add('three.example.com',22,'ssh-ed25519','AAAAthree')==True
+        assert known_hosts.add('three.example.com',22,'ssh-ed25519','AAAAthree')==False
+        with open(known_hosts_file,'r') as f:
+            assert f.read().splitlines()==['one.example.com ssh-ed25519 AAAAone','two.example.com ssh-ed25519 AAAAtwo','three.example.com ssh-ed25519 AAAAthree']
+        assert known_hosts.check('two.example.com',22,'ssh-ed25519','AAAAtwo')==result.match
+        # A replaced file is parsed from the start.
+        replacement = known_hosts_file+'.new'
+        with open(replacement,'w') as f:
+            f.write('four.example.com ssh-ed25519 AAAAfour\n')
+        os.replace(replacement,known_hosts_file)
+        assert known_hosts.check('four.example.com',22,'ssh-ed25519','AAAAfour')==result.match
+        assert known_hosts.check('one.example.com',22,'ssh-ed25519','AAAAone')==result.not_found
+
+    def test_known_hosts_concurrent_add(self):
+        known_hosts_file = self.known_hosts_file('test_known_hosts_concurrent_add')
+        # Separate instances stand in for separate processes, so only the file lock keeps them apart.
+        instances = [redssh.known_hosts.KnownHosts(known_hosts_file) for i in range(8)]
+        def add(known_hosts):
+            for i in range(50):
+                known_hosts.add('host'+str(i)+'.example.com',22,'ssh-ed25519','AAAA'+str(i))
+        threads = [threading.Thread(target=add,args=(known_hosts,)) for known_hosts in instances]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        with open(known_hosts_file,'r') as f:
+            lines = f.read().splitlines()
+        assert sorted(lines)==sorted(['host'+str(i)+'.example.com ssh-ed25519 AAAA'+str(i) for i in range(50)])
+
+    def test_known_hosts_auto_add(self):
+        for client in sorted(['LibSSH2']):
+            with self.subTest(client=client):
+                redssh.clients.default_client = client
+                known_hosts_file = self.known_hosts_file('test_known_hosts_auto_add')
+                class_init = {
+                    'known_hosts':known_hosts_file,
+                    'ssh_host_key_verification':redssh.enums.SSHHostKeyVerify.auto_add
+                }
+                sshs = self.start_ssh_session(class_init=class_init)
+                sshs.wait_for(self.prompt)
+                with open(known_hosts_file,'r') as f:
+                    lines = f.read().splitlines()
+                assert len(lines)==1
+                (host,key_type,key) = lines[0].split(' ')
+                assert host=='['+sshs.connected_hostname+']:'+str(sshs.connected_port)
+                assert key_type=='ssh-rsa'
+                class_init['ssh_host_key_verification'] = redssh.enums.SSHHostKeyVerify.strict
+                sshs2 = self.start_ssh_session(server_port=sshs.connected_port,class_init=class_init)
+                sshs2.wait_for(self.prompt)
+                with open(known_hosts_file,'w') as f:
+                    f.write('@revoked '+host+' '+key_type+' '+key+'\n')
+                class_init['ssh_host_key_verification'] = redssh.enums.SSHHostKeyVerify.auto_add
+                with self.assertRaises(redssh.libssh2.exceptions.KnownHostCheckMisMatchError):
+                    self.start_ssh_session(server_port=sshs.connected_port,class_init=class_init)
+
+
+if __name__ == '__main__':
+    unittest.main()
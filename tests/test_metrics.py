@@ -0,0 +1,66 @@
+import os
+import unittest
+import redssh
+
+from .base_test import base_test as unittest_base
+
+class RedSSHUnitTest(unittest_base):
+
+    def test_metrics_disabled_by_default(self):
+        for client in sorted(redssh.clients.enabled_clients):
+            with self.subTest(client=client):
+                redssh.clients.default_client = client
+                sshs = self.start_ssh_session()
+                assert sshs.rs.client.metrics==None
+                sshs.wait_for(self.prompt)
+
+    def test_in_memory_metrics(self):
+        for client in sorted(redssh.clients.enabled_clients):
+            with self.subTest(client=client):
+                redssh.clients.default_client = client
+                metrics = redssh.metrics.InMemoryMetrics()
+                sshs = self.start_ssh_session(class_init={'metrics':metrics})
+                sshs.wait_for(self.prompt)
+                sshs.sendline('echo metrics_test')
+                sshs.wait_for('metrics_test\r\n')
+                (ret,out) = sshs.rs.execute_command('head -c 100000 /dev/zero')
+                assert len(out)==100000
+                for name in ['connect.tcp','connect.handshake','connect.host_key','connect.auth','connect.channel']:
+                    assert metrics.histogram(name).count==1
+                assert metrics.histogram('read.bytes').total>=100000
+                assert metrics.histogram('write.bytes').total==len('echo metrics_test\r\n')
+                assert metrics.histogram('lock.wait').count>0
+                assert metrics.histogram('lock.hold').count==metrics.histogram('lock.wait').count
+                assert metrics.counter('select.calls')==metrics.histogram('select.wait').count
+                assert metrics.counter('block.eagain')>0
+                channels = [key for key in metrics.snapshot()['histograms'] if isinstance(key,tuple) and key[0]=='read.bytes']
+                assert channels==[('read.bytes',(('channel','channel'),))]
+                remote_path = os.path.join(self.remote_dir,'test_metrics_sftp')
+                sshs.rs.start_sftp()
+                sshs.rs.sftp.put_file(os.path.abspath(__file__),remote_path)
+                file_obj = sshs.rs.sftp.open(remote_path,sshs.rs.enums.SFTP.DEFAULT_READ_MODE,sshs.rs.enums.SFTP.DEFAULT_FILE_MODE)
+                sshs.rs.sftp.read(file_obj,iter=False)
+                sshs.rs.sftp.close(file_obj)
+                sftp_reads = metrics.snapshot()['histograms'][('read.bytes',(('channel','sftp'),))]
+                assert sftp_reads['total']==os.path.getsize(os.path.abspath(__file__))
+
+    def test_custom_metrics_sink(self):
+        class Sink(redssh.metrics.MetricsSink):
+            def __init__(self):
+                self.names = set()
+            def increment(self,name,value=1,tags=None):
+                self.names.add(name)
+            def observe(self,name,value,tags=None):
+                self.names.add(name)
+        for client in sorted(redssh.clients.enabled_clients):
+            with self.subTest(client=client):
+                redssh.clients.default_client = client
+                sink = Sink()
+                sshs = self.start_ssh_session(class_init={'metrics':sink})
+                sshs.wait_for(self.prompt)
+                assert 'connect.auth' in sink.names
+                assert 'lock.wait' in sink.names
+
+
+if __name__ == '__main__':
+    unittest.main()
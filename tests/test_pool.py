@@ -0,0 +1,70 @@
+import os
+import threading
+import unittest
+import redssh
+
+from .base_test import base_test as unittest_base
+
+class RedSSHUnitTest(unittest_base):
+
+    def acquire(self,pool,server_port,**kwargs):
+        return(pool.acquire(self.server_bind_host,server_port,username=self.username,key_filepath=self.key_path,**kwargs))
+
+    def test_pool_reuses_sessions(self):
+        for client in sorted(redssh.clients.enabled_clients):
+            with self.subTest(client=client):
+                redssh.clients.default_client = client
+                server_port = self.start_ssh_server()
+                with redssh.pool.ConnectionPool() as pool:
+                    rs = self.acquire(pool,server_port)
+                    pool.release(rs)
+                    assert self.acquire(pool,server_port) is rs
+                    other = self.acquire(pool,server_port)
+                    assert not other is rs
+                    assert list(pool.stats().values())==[(0,2)]
+                    pool.release(other)
+                    pool.release(rs,True)
+                    assert list(pool.stats().values())==[(1,0)]
+                    with pool.session(self.server_bind_host,server_port,username=self.username,key_filepath=self.key_path) as rs:
+                        assert rs is other
+                        assert pool.is_alive(rs)==True
+
+    def test_pool_replaces_dead_sessions(self):
+        for client in sorted(redssh.clients.enabled_clients):
+            with self.subTest(client=client):
+                redssh.clients.default_client = client
+                server_port = self.start_ssh_server()
+                with redssh.pool.ConnectionPool() as pool:
+                    rs = self.acquire(pool,server_port)
+                    assert pool.is_alive(rs)==True
+                    rs.client.sock.shutdown(2)
+                    pool.release(rs)
+                    new_rs = self.acquire(pool,server_port)
+                    assert not new_rs is rs
+                    assert pool.is_alive(new_rs)==True
+                    pool.release(new_rs)
+                    assert list(pool.stats().values())==[(1,0)]
+
+    def test_pool_limits_and_idle_timeout(self):
+        for client in sorted(redssh.clients.enabled_clients):
+            with self.subTest(client=client):
+                redssh.clients.default_client = client
+                server_port = self.start_ssh_server()
+                with redssh.pool.ConnectionPool(max_per_key=1,idle_timeout=0.2) as pool:
+                    rs = self.acquire(pool,server_port)
+                    failed = False
+                    try:
+                        self.acquire(pool,server_port,wait_timeout=0.1)
+                    except redssh.exceptions.PoolExhaustedException:
+                        failed = True
+                    assert failed==True
+                    threading.Timer(0.1,pool.release,(rs,)).start()
+                    assert self.acquire(pool,server_port,wait_timeout=5) is rs
+                    pool.release(rs)
+                    threading.Event().wait(0.3)
+                    assert pool.prune()==1
+                    assert pool.stats()=={}
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -80,5 +80,89 @@ class RedSSHUnitTest(unittest_base):
                     failed = True
                 assert failed==False
 
+    def test_read_into_buffer_via_scp(self):
+        for client in sorted(['LibSSH2']): #Remove when libssh implements nonblocking SFTP/SCP
+        #for client in sorted(redssh.clients.enabled_clients):
+            with self.subTest(client=client):
+                redssh.clients.default_client = client
+                test_name = 'test_read_into_buffer_via_scp'
+                remote_path = os.path.join(self.remote_dir,test_name)
+                sshs = self.start_ssh_session(test_name)
+                sshs.rs.start_scp()
+                file_data = os.urandom(3000017)
+                remote_file_path = os.path.join(remote_path,'remote_file')
+                with open(remote_file_path,'wb') as f:
+                    f.write(file_data)
+                assert sshs.rs.scp.read(remote_file_path,iter=False)==file_data
+                buf = bytearray(len(file_data)+100)
+                assert sshs.rs.scp.read(remote_file_path,buffer=buf)==len(file_data)
+                assert buf[:len(file_data)]==file_data
+                buf = bytearray(1000)
+                assert sshs.rs.scp.read(remote_file_path,buffer=buf)==len(buf)
+                assert buf==file_data[:len(buf)]
+
+
+    def test_get_folder_via_scp(self):
+        for client in sorted(['LibSSH2']): #Remove when libssh implements nonblocking SFTP/SCP
+        #for client in sorted(redssh.clients.enabled_clients):
+            with self.subTest(client=client):
+                redssh.clients.default_client = client
+                test_name = 'test_get_folder_via_scp'
+                remote_path = os.path.join(self.remote_dir,test_name)
+                sshs = self.start_ssh_session(test_name)
+                sshs.rs.start_scp()
+                source_path = os.path.join(remote_path,'remote')
+                files = {}
+                for i in range(20):
+                    file_path = os.path.join('dir'+str(i%4),'file'+str(i))
+                    files[file_path] = os.urandom(i*4099)
+                    os.makedirs(os.path.join(source_path,os.path.dirname(file_path)),exist_ok=True)
+                    with open(os.path.join(source_path,file_path),'wb') as f:
+                        f.write(files[file_path])
+                    os.chmod(os.path.join(source_path,file_path),0o600+(i%2)*0o40)
+                    os.utime(os.path.join(source_path,file_path),(1500000000+i,1500000000+i))
+                os.chmod(os.path.join(source_path,'dir1'),0o750)
+                os.utime(os.path.join(source_path,'dir1'),(1400000000,1400000000))
+                for workers in [1,4]:
+                    target_path = os.path.join(remote_path,'workers'+str(workers))
+                    sshs.rs.scp.get_folder(source_path,target_path,workers=workers)
+                    for file_path in files:
+                        with open(os.path.join(target_path,file_path),'rb') as f:
+                            assert f.read()==files[file_path]
+                        source_stat = os.stat(os.path.join(source_path,file_path))
+                        target_stat = os.stat(os.path.join(target_path,file_path))
+                        assert target_stat.st_mode==source_stat.st_mode
+                        assert int(target_stat.st_mtime)==int(source_stat.st_mtime)
+                    assert os.stat(os.path.join(target_path,'dir1')).st_mode & 0o777==0o750
+                    assert int(os.stat(os.path.join(target_path,'dir1')).st_mtime)==1400000000
+
+
+    def test_tar_folder_via_scp(self):
+        for client in sorted(['LibSSH2']): #Remove when libssh implements nonblocking SFTP/SCP
+        #for client in sorted(redssh.clients.enabled_clients):
+            with self.subTest(client=client):
+                redssh.clients.default_client = client
+                test_name = 'test_tar_folder_via_scp'
+                remote_path = os.path.join(self.remote_dir,test_name)
+                sshs = self.start_ssh_session(test_name)
+                sshs.rs.start_scp()
+                source_path = os.path.join(remote_path,'local')
+                files = {}
+                for i in range(50):
+                    file_path = os.path.join('dir'+str(i%4),'file'+str(i))
+                    files[file_path] = os.urandom(i*37)
+                    os.makedirs(os.path.join(source_path,os.path.dirname(file_path)),exist_ok=True)
+                    with open(os.path.join(source_path,file_path),'wb') as f:
+                        f.write(files[file_path])
+                uploaded_path = os.path.join(remote_path,'uploaded')
+                downloaded_path = os.path.join(remote_path,'downloaded')
+                sshs.rs.scp.put_folder(source_path,uploaded_path,tar=True)
+                sshs.rs.scp.get_folder(uploaded_path,downloaded_path,tar=True)
+                for target_path in [uploaded_path,downloaded_path]:
+                    for file_path in files:
+                        with open(os.path.join(target_path,file_path),'rb') as f:
+                            assert f.read()==files[file_path]
+
+
 if __name__ == '__main__':
     unittest.main()
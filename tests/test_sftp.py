@@ -179,6 +179,366 @@ class RedSSHUnitTest(unittest_base):
                 del file_data
                 f.rewind()
 
+    def test_put_file_via_sftp(self):
+        for client in sorted(redssh.clients.enabled_clients):
+            with self.subTest(client=client):
+                redssh.clients.default_client = client
+                test_name = 'test_put_file_via_sftp'
+                remote_path = os.path.join(self.remote_dir,test_name)
+                sshs = self.start_ssh_session(test_name)
+                sshs.rs.start_sftp()
+                file_data = os.urandom(1000003)
+                local_file_path = os.path.join(remote_path,'local_file')
+                remote_file_path = os.path.join(remote_path,'remote_file')
+                with open(local_file_path,'wb') as f:
+                    f.write(file_data)
+                os.chmod(local_file_path,0o640)
+                for (max_inflight,chunk_size) in [(1,65536),(16,4096),(64,32768)]:
+                    sshs.rs.sftp.put_file(local_file_path,remote_file_path,max_inflight,chunk_size)
+                    with open(remote_file_path,'rb') as f:
+                        assert f.read()==file_data
+                    assert os.stat(remote_file_path).st_mode & 0o777==0o640
+                    os.remove(remote_file_path)
+    def test_put_file_delta_via_sftp(self):
+        for client in sorted(redssh.clients.enabled_clients):
+            with self.subTest(client=client):
+                redssh.clients.default_client = client
+                test_name = 'test_put_file_delta_via_sftp'
+                remote_path = os.path.join(self.remote_dir,test_name)
+                sshs = self.start_ssh_session(test_name)
+                sshs.rs.start_sftp()
+                block_size = 65536
+                file_data = bytearray(os.urandom(block_size*20+1234))
+                local_file_path = os.path.join(remote_path,'local_file')
+                remote_file_path = os.path.join(remote_path,'remote_file')
+                def put_delta():
+                    with open(local_file_path,'wb') as f:
+                        f.write(file_data)
+                    sent = sshs.rs.sftp.put_file_delta(local_file_path,remote_file_path,block_size)
+                    with open(remote_file_path,'rb') as f:
+                        assert f.read()==file_data
+                    assert int(os.stat(remote_file_path).st_mtime)==int(os.stat(local_file_path).st_mtime)
+                    return(sent)
+                assert put_delta()==len(file_data)
+                file_data[block_size*3+10] ^= 0xff
+                file_data[block_size*15] ^= 0xff
+                assert put_delta()==block_size*2
+                file_data.extend(os.urandom(block_size))
+                assert put_delta()==block_size+1234
+                del file_data[block_size*5:]
+                assert put_delta()==0
+                os.remove(remote_file_path)
+
+    def test_resume_transfers_via_sftp(self):
+        for client in sorted(redssh.clients.enabled_clients):
+            with self.subTest(client=client):
+                redssh.clients.default_client = client
+                test_name = 'test_resume_transfers_via_sftp'
+                remote_path = os.path.join(self.remote_dir,test_name)
+                sshs = self.start_ssh_session(test_name)
+                sshs.rs.start_sftp()
+                file_data = os.urandom(500003)
+                partial_size = 200000
+                source_file_path = os.path.join(remote_path,'source_file')
+                partial_file_path = os.path.join(remote_path,'partial_file')
+                with open(source_file_path,'wb') as f:
+                    f.write(file_data)
+                def check_partial(transfer,partial_data,expected_read,resume_check=0):
+                    with open(partial_file_path,'wb') as f:
+                        f.write(partial_data)
+                    if transfer=='get':
+                        assert sshs.rs.sftp.get_file(source_file_path,partial_file_path,resume=True,resume_check=resume_check)==expected_read
+                    else:
+                        sshs.rs.sftp.put_file(source_file_path,partial_file_path,resume=True,resume_check=resume_check)
+                    with open(partial_file_path,'rb') as f:
+                        assert f.read()==file_data
+                for transfer in ['get','put']:
+                    check_partial(transfer,file_data[:partial_size],len(file_data)-partial_size)
+                    check_partial(transfer,file_data[:partial_size],len(file_data)-partial_size,4096)
+                    corrupt_data = file_data[:partial_size-1]+bytes([file_data[partial_size-1]^0xff])
+                    check_partial(transfer,corrupt_data,len(file_data),4096)
+                    check_partial(transfer,file_data+b'extra',len(file_data))
+                os.remove(partial_file_path)
+                assert sshs.rs.sftp.get_file(source_file_path,partial_file_path,resume=True)==len(file_data)
+                os.remove(partial_file_path)
+                sshs.rs.sftp.put_file(source_file_path,partial_file_path,resume=True)
+                with open(partial_file_path,'rb') as f:
+                    assert f.read()==file_data
+                os.remove(partial_file_path)
+
+
+    def test_get_file_via_sftp(self):
+        for client in sorted(redssh.clients.enabled_clients):
+            with self.subTest(client=client):
+                redssh.clients.default_client = client
+                test_name = 'test_get_file_via_sftp'
+                remote_path = os.path.join(self.remote_dir,test_name)
+                sshs = self.start_ssh_session(test_name)
+                sshs.rs.start_sftp()
+                file_data = os.urandom(1000003)
+                remote_file_path = os.path.join(remote_path,'remote_file')
+                local_file_path = os.path.join(remote_path,'local_file')
+                with open(remote_file_path,'wb') as f:
+                    f.write(file_data)
+                os.chmod(remote_file_path,0o640)
+                for (max_inflight,chunk_size) in [(1,65536),(16,4096),(64,32768)]:
+                    assert sshs.rs.sftp.get_file(remote_file_path,local_file_path,max_inflight,chunk_size)==len(file_data)
+                    with open(local_file_path,'rb') as f:
+                        assert f.read()==file_data
+                    assert os.stat(local_file_path).st_mode & 0o777==0o640
+                    os.remove(local_file_path)
+
+    def test_get_small_file_via_sftp(self):
+        for client in sorted(redssh.clients.enabled_clients):
+            with self.subTest(client=client):
+                redssh.clients.default_client = client
+                test_name = 'test_get_small_file_via_sftp'
+                remote_path = os.path.join(self.remote_dir,test_name)
+                sshs = self.start_ssh_session(test_name)
+                sshs.rs.start_sftp()
+                local_file_path = os.path.join(remote_path,'local_file')
+                for file_size in [0,1024,32768,40000]:
+                    file_data = os.urandom(file_size)
+                    remote_file_path = os.path.join(remote_path,'remote_file_'+str(file_size))
+                    with open(remote_file_path,'wb') as f:
+                        f.write(file_data)
+                    assert sshs.rs.sftp.get_file(remote_file_path,local_file_path)==file_size
+                    with open(local_file_path,'rb') as f:
+                        assert f.read()==file_data
+                # A tiny file should cost about the same with the default window as with a single small request.
+                timings = []
+                for window in [{'max_inflight':1,'chunk_size':4096},{}]:
+                    start = time.perf_counter()
+                    for i in range(10):
+                        sshs.rs.sftp.get_file(os.path.join(remote_path,'remote_file_1024'),local_file_path,**window)
+                    timings.append(time.perf_counter()-start)
+                assert timings[1]<timings[0]*3+0.05,timings
+
+
+    def test_put_folder_workers_via_sftp(self):
+        for client in sorted(redssh.clients.enabled_clients):
+            with self.subTest(client=client):
+                redssh.clients.default_client = client
+                test_name = 'test_put_folder_workers_via_sftp'
+                remote_path = os.path.join(self.remote_dir,test_name)
+                sshs = self.start_ssh_session(test_name)
+                sshs.rs.start_sftp()
+                local_path = os.path.join(remote_path,'local')
+                files = {}
+                for i in range(40):
+                    file_path = os.path.join('dir'+str(i%4),'sub'+str(i%3),'file'+str(i))
+                    files[file_path] = os.urandom(i*4099)
+                    os.makedirs(os.path.join(local_path,os.path.dirname(file_path)),exist_ok=True)
+                    with open(os.path.join(local_path,file_path),'wb') as f:
+                        f.write(files[file_path])
+                    os.chmod(os.path.join(local_path,file_path),0o600+(i%2)*0o40)
+                for workers in [1,4]:
+                    target_path = os.path.join(remote_path,'workers'+str(workers))
+                    sshs.rs.sftp.put_folder(local_path,target_path,workers=workers)
+                    for file_path in files:
+                        with open(os.path.join(target_path,file_path),'rb') as f:
+                            assert f.read()==files[file_path]
+                        assert os.stat(os.path.join(target_path,file_path)).st_mode==os.stat(os.path.join(local_path,file_path)).st_mode
+
+    def test_put_folder_sync_via_sftp(self):
+        for client in sorted(redssh.clients.enabled_clients):
+            with self.subTest(client=client):
+                redssh.clients.default_client = client
+                test_name = 'test_put_folder_sync_via_sftp'
+                remote_path = os.path.join(self.remote_dir,test_name)
+                sshs = self.start_ssh_session(test_name)
+                sshs.rs.start_sftp()
+                local_path = os.path.join(remote_path,client.value,'local')
+                target_path = os.path.join(remote_path,client.value,'remote')
+                for i in range(10):
+                    os.makedirs(os.path.join(local_path,'dir'+str(i%2)),exist_ok=True)
+                    with open(os.path.join(local_path,'dir'+str(i%2),'file'+str(i)),'wb') as f:
+                        f.write(os.urandom(1000+i))
+                def assert_synced():
+                    for (dirpath,dirnames,filenames) in os.walk(local_path):
+                        for filename in filenames:
+                            local_file_path = os.path.join(dirpath,filename)
+                            remote_file_path = os.path.join(target_path,os.path.relpath(local_file_path,local_path))
+                            with open(local_file_path,'rb') as local_file, open(remote_file_path,'rb') as remote_file:
+                                assert local_file.read()==remote_file.read()
+                            assert int(os.stat(remote_file_path).st_mtime)==int(os.stat(local_file_path).st_mtime)
+                sshs.rs.sftp.put_folder(local_path,target_path,sync=True)
+                assert_synced()
+                # Same size and time as the local file, so only a checksum can tell it apart.
+                tampered_path = os.path.join(target_path,'dir0','file0')
+                tampered_stat = os.stat(tampered_path)
+                with open(tampered_path,'wb') as f:
+                    f.write(b'\x00'*tampered_stat.st_size)
+                os.utime(tampered_path,(tampered_stat.st_atime,tampered_stat.st_mtime))
+                with open(os.path.join(local_path,'dir1','file1'),'wb') as f:
+                    f.write(os.urandom(2000))
+                with open(os.path.join(local_path,'dir1','new_file'),'wb') as f:
+                    f.write(os.urandom(3000))
+                os.makedirs(os.path.join(target_path,'extra_dir'))
+                with open(os.path.join(target_path,'extra_dir','extra_file'),'wb') as f:
+                    f.write(b'extra')
+                sshs.rs.sftp.put_folder(local_path,target_path,workers=2,sync=True)
+                with open(tampered_path,'rb') as f:
+                    assert f.read()==b'\x00'*tampered_stat.st_size
+                assert os.path.exists(os.path.join(target_path,'extra_dir','extra_file'))==True
+                with open(os.path.join(target_path,'dir1','new_file'),'rb') as f, open(os.path.join(local_path,'dir1','new_file'),'rb') as local_file:
+                    assert f.read()==local_file.read()
+                sshs.rs.sftp.put_folder(local_path,target_path,sync=True,checksum=True,delete=True)
+                assert_synced()
+                assert os.path.exists(os.path.join(target_path,'extra_dir'))==False
+
+
+    def test_get_folder_via_sftp(self):
+        for client in sorted(redssh.clients.enabled_clients):
+            with self.subTest(client=client):
+                redssh.clients.default_client = client
+                test_name = 'test_get_folder_via_sftp'
+                remote_path = os.path.join(self.remote_dir,test_name)
+                sshs = self.start_ssh_session(test_name)
+                sshs.rs.start_sftp()
+                source_path = os.path.join(remote_path,client.value,'remote')
+                files = {}
+                for i in range(40):
+                    file_path = os.path.join('dir'+str(i%4),'sub'+str(i%3),'file'+str(i))
+                    files[file_path] = os.urandom(i*4099)
+                    os.makedirs(os.path.join(source_path,os.path.dirname(file_path)),exist_ok=True)
+                    with open(os.path.join(source_path,file_path),'wb') as f:
+                        f.write(files[file_path])
+                    os.chmod(os.path.join(source_path,file_path),0o600+(i%2)*0o40)
+                    os.utime(os.path.join(source_path,file_path),(1500000000+i,1500000000+i))
+                os.chmod(os.path.join(source_path,'dir1'),0o750)
+                os.utime(os.path.join(source_path,'dir1'),(1400000000,1400000000))
+                os.symlink(os.path.join(source_path,'dir0'),os.path.join(source_path,'link'))
+                for workers in [1,4]:
+                    target_path = os.path.join(remote_path,client.value,'workers'+str(workers))
+                    sshs.rs.sftp.get_folder(source_path,target_path,workers=workers)
+                    for file_path in files:
+                        with open(os.path.join(target_path,file_path),'rb') as f:
+                            assert f.read()==files[file_path]
+                        source_stat = os.stat(os.path.join(source_path,file_path))
+                        target_stat = os.stat(os.path.join(target_path,file_path))
+                        assert target_stat.st_mode==source_stat.st_mode
+                        assert int(target_stat.st_mtime)==int(source_stat.st_mtime)
+                    assert os.stat(os.path.join(target_path,'dir1')).st_mode & 0o777==0o750
+                    assert int(os.stat(os.path.join(target_path,'dir1')).st_mtime)==1400000000
+                    assert os.path.exists(os.path.join(target_path,'link'))==False
+
+
+    def test_tar_folder_via_sftp(self):
+        for client in sorted(redssh.clients.enabled_clients):
+            with self.subTest(client=client):
+                redssh.clients.default_client = client
+                test_name = 'test_tar_folder_via_sftp'
+                remote_path = os.path.join(self.remote_dir,test_name)
+                sshs = self.start_ssh_session(test_name)
+                sshs.rs.start_sftp()
+                source_path = os.path.join(remote_path,client.value,'local')
+                files = {}
+                for i in range(200):
+                    file_path = os.path.join('dir'+str(i%5),'sub'+str(i%3),'file'+str(i))
+                    files[file_path] = os.urandom(i*37)
+                    os.makedirs(os.path.join(source_path,os.path.dirname(file_path)),exist_ok=True)
+                    with open(os.path.join(source_path,file_path),'wb') as f:
+                        f.write(files[file_path])
+                    os.chmod(os.path.join(source_path,file_path),0o600+(i%2)*0o40)
+                    os.utime(os.path.join(source_path,file_path),(1500000000+i,1500000000+i))
+                os.chmod(os.path.join(source_path,'dir1'),0o750)
+                os.utime(os.path.join(source_path,'dir1'),(1400000000,1400000000))
+                uploaded_path = os.path.join(remote_path,client.value,'uploaded')
+                downloaded_path = os.path.join(remote_path,client.value,'downloaded')
+                sshs.rs.sftp.put_folder(source_path,uploaded_path,tar=True)
+                sshs.rs.sftp.get_folder(uploaded_path,downloaded_path,tar=True)
+                for target_path in [uploaded_path,downloaded_path]:
+                    for file_path in files:
+                        with open(os.path.join(target_path,file_path),'rb') as f:
+                            assert f.read()==files[file_path]
+                        source_stat = os.stat(os.path.join(source_path,file_path))
+                        target_stat = os.stat(os.path.join(target_path,file_path))
+                        assert target_stat.st_mode==source_stat.st_mode
+                        assert int(target_stat.st_mtime)==int(source_stat.st_mtime)
+                    assert os.stat(os.path.join(target_path,'dir1')).st_mode & 0o777==0o750
+                    assert int(os.stat(os.path.join(target_path,'dir1')).st_mtime)==1400000000
+                with self.assertRaises(redssh.exceptions.RemoteCommandFailedException):
+                    sshs.rs.sftp.get_folder(os.path.join(remote_path,client.value,'missing'),os.path.join(remote_path,client.value,'missing_download'),tar=True)
+                # Links inside the tree are kept, one pointing out of it stops the download before anything is written through it.
+                links_path = os.path.join(remote_path,client.value,'links')
+                os.makedirs(os.path.join(links_path,'dir'))
+                os.symlink(os.path.join('..','dir'),os.path.join(links_path,'dir','inside'))
+                sshs.rs.sftp.get_folder(links_path,os.path.join(remote_path,client.value,'links_download'),tar=True)
+                assert os.readlink(os.path.join(remote_path,client.value,'links_download','dir','inside'))==os.path.join('..','dir')
+                os.symlink(os.path.join('..','..','outside'),os.path.join(links_path,'dir','outside'))
+                with self.assertRaises(redssh.exceptions.UnsafeArchiveMemberException):
+                    sshs.rs.sftp.get_folder(links_path,os.path.join(remote_path,client.value,'escape_download'),tar=True)
+                assert os.path.lexists(os.path.join(remote_path,client.value,'escape_download','dir','outside'))==False
+
+
+    def test_tar_folder_compression_via_sftp(self):
+        for client in sorted(redssh.clients.enabled_clients):
+            with self.subTest(client=client):
+                redssh.clients.default_client = client
+                test_name = 'test_tar_folder_compression_via_sftp'
+                remote_path = os.path.join(self.remote_dir,test_name)
+                metrics = redssh.metrics.InMemoryMetrics()
+                sshs = self.start_ssh_session(test_name,class_init={'metrics':metrics})
+                sshs.rs.start_sftp()
+                source_path = os.path.join(remote_path,client.value,'local')
+                files = {}
+                for i in range(20):
+                    file_path = os.path.join('dir'+str(i%3),'file'+str(i)+'.log')
+                    files[file_path] = b''.join([('line '+str(line)+' of log '+str(i)+' nothing to report\n').encode('utf8') for line in range(2000)])
+                    os.makedirs(os.path.join(source_path,os.path.dirname(file_path)),exist_ok=True)
+                    with open(os.path.join(source_path,file_path),'wb') as f:
+                        f.write(files[file_path])
+                adaptive_compression = sshs.rs.client.adaptive_compression
+                def transfer(compression,link_throughput,expected):
+                    uploaded_path = os.path.join(remote_path,client.value,'uploaded')
+                    downloaded_path = os.path.join(remote_path,client.value,'downloaded')
+                    for (target_path,start_transfer) in [
+                        (uploaded_path,lambda: sshs.rs.sftp.put_folder(source_path,uploaded_path,tar=True,compression=compression)),
+                        (downloaded_path,lambda: sshs.rs.sftp.get_folder(uploaded_path,downloaded_path,tar=True,compression=compression))
+                    ]:
+                        metrics.reset()
+                        adaptive_compression.link_throughput = link_throughput
+                        start_transfer()
+                        for file_path in files:
+                            with open(os.path.join(target_path,file_path),'rb') as f:
+                                assert f.read()==files[file_path]
+                        assert metrics.counters[('compression.choice',(('compression',expected),))]==1
+                        if expected=='none':
+                            assert metrics.histogram('link.throughput').count==1
+                    shutil.rmtree(uploaded_path)
+                    shutil.rmtree(downloaded_path)
+                transfer(redssh.enums.Compression.gzip,None,'gzip')
+                transfer(redssh.enums.Compression.auto,None,'none')
+                assert not adaptive_compression.link_throughput==None
+                transfer(redssh.enums.Compression.auto,100000.0,'gzip')
+                assert metrics.histogram('compression.ratio').max<0.2
+                transfer(redssh.enums.Compression.auto,1e12,'none')
+
+
+    def test_read_into_buffer_via_sftp(self):
+        for client in sorted(redssh.clients.enabled_clients):
+            with self.subTest(client=client):
+                redssh.clients.default_client = client
+                test_name = 'test_read_into_buffer_via_sftp'
+                remote_path = os.path.join(self.remote_dir,test_name)
+                sshs = self.start_ssh_session(test_name)
+                sshs.rs.start_sftp()
+                file_data = os.urandom(3000017)
+                remote_file_path = os.path.join(remote_path,'remote_file')
+                with open(remote_file_path,'wb') as f:
+                    f.write(file_data)
+                f = sshs.rs.sftp.open(remote_file_path,sshs.rs.client.enums.SFTP.DEFAULT_READ_MODE,sshs.rs.client.enums.SFTP_S.IRUSR,True)
+                assert f.read(iter=False)==file_data
+                f.seek(0)
+                buf = bytearray(1000000)
+                assert f.read(buffer=buf)==len(buf)
+                assert buf==file_data[:len(buf)]
+                buf = bytearray(len(file_data)+100)
+                assert f.read(buffer=buf)==len(file_data)-1000000
+                assert buf[:len(file_data)-1000000]==file_data[1000000:]
+                f.close()
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,5 +1,7 @@
+import os
 import pytest
 import socket
+import struct
 import unittest
 import threading
 import multiprocessing
@@ -18,6 +20,53 @@ def get_local(url,headers={},proxies={},timeout=(3,3)):
         # print(e)
 
 
+def start_echo_server():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(('127.0.0.1', 0))
+    sock.listen(64)
+    def echo(conn):
+        with conn:
+            data = conn.recv(65536)
+            while len(data)>0:
+                conn.sendall(data)
+                data = conn.recv(65536)
+    def serve():
+        while True:
+            try:
+                (conn,addr) = sock.accept()
+            except OSError:
+                return()
+            threading.Thread(target=echo,args=(conn,),daemon=True).start()
+    threading.Thread(target=serve,daemon=True).start()
+    return(sock)
+
+
+def echo_through(port,payload):
+    sock = socket.create_connection(('127.0.0.1',port))
+    sender = threading.Thread(target=sock.sendall,args=(payload,),daemon=True)
+    sender.start()
+    out = b''
+    while len(out)<len(payload):
+        data = sock.recv(65536)
+        if len(data)==0:
+            break
+        out+=data
+    sender.join()
+    sock.close()
+    return(out)
+
+
+def socks_connect(port,host,target_port):
+    sock = socket.create_connection(('127.0.0.1',port))
+    sock.sendall(b'\x05\x01\x00')
+    assert sock.recv(2)==b'\x05\x00'
+    sock.sendall(b'\x05\x01\x00\x01'+socket.inet_aton(host)+struct.pack('!H',target_port))
+    reply = sock.recv(10)
+    assert reply[:2]==b'\x05\x00'
+    return(sock)
+
+
 class RedSSHUnitTest(unittest_base):
 
     def test_local_tunnel_bad_host(self):
@@ -90,6 +139,159 @@ class RedSSHUnitTest(unittest_base):
                 assert self.response_text in out
                 assert sshs.rs.tunnel_is_alive(redssh.enums.TunnelType.local,port,self.remote_tunnel_hostname,self.remote_tunnel_port)
 
+    def test_local_tunnel_concurrent_streams(self):
+        for client in sorted(redssh.clients.enabled_clients):
+            with self.subTest(client=client):
+                redssh.clients.default_client = client
+                echo_server = start_echo_server()
+                sshs = self.start_ssh_session()
+                sshs.wait_for(self.prompt)
+                sshs.sendline('echo')
+                sshs.wait_for(self.prompt)
+                port = sshs.rs.local_tunnel(0,'127.0.0.1',echo_server.getsockname()[1],error_level=self.error_level)
+                payloads = [os.urandom(262144) for i in range(16)]
+                results = [None]*len(payloads)
+                def stream(index):
+                    results[index] = echo_through(port,payloads[index])
+                threads = [threading.Thread(target=stream,args=(index,)) for index in range(len(payloads))]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join(60)
+                assert results==payloads
+                assert sshs.rs.execute_command('echo done')==(0,b'done\n')
+                sshs.rs.close_tunnels()
+                echo_server.close()
+
+    def test_channel_io_keeps_running_after_errors(self):
+        for client in sorted(redssh.clients.enabled_clients):
+            with self.subTest(client=client):
+                redssh.clients.default_client = client
+                echo_server = start_echo_server()
+                sshs = self.start_ssh_session()
+                sshs.wait_for(self.prompt)
+                sshs.sendline('echo')
+                sshs.wait_for(self.prompt)
+                port = sshs.rs.local_tunnel(0,'127.0.0.1',echo_server.getsockname()[1],error_level=self.error_level)
+                payload = os.urandom(65536)
+                assert echo_through(port,payload)==payload
+                engine = sshs.rs.client._channel_io()
+                reported = []
+                for forward in engine.forwards:
+                    forward.report = reported.append
+                def fail():
+                    raise(RuntimeError('failed command'))
+                engine._submit(fail)
+                pump = engine._pump
+                def failing_pump(session_ready):
+                    engine._pump = pump
+                    raise(RuntimeError('failed iteration'))
+                engine._pump = failing_pump
+                engine.wake()
+                assert echo_through(port,payload)==payload
+                assert reported==[('127.0.0.1',port)]*2
+                assert engine.is_alive()==True
+                sshs.rs.close_tunnels()
+                echo_server.close()
+
+    def test_local_tunnel_buffer_sizes(self):
+        for client in sorted(redssh.clients.enabled_clients):
+            for tunnel_buffer_size in [4096,4194304]:
+                with self.subTest(client=client,tunnel_buffer_size=tunnel_buffer_size):
+                    redssh.clients.default_client = client
+                    echo_server = start_echo_server()
+                    sshs = self.start_ssh_session(class_init={'tunnel_buffer_size':tunnel_buffer_size})
+                    sshs.wait_for(self.prompt)
+                    sshs.sendline('echo')
+                    sshs.wait_for(self.prompt)
+                    port = sshs.rs.local_tunnel(0,'127.0.0.1',echo_server.getsockname()[1],error_level=self.error_level)
+                    payload = os.urandom(4194304)
+                    assert echo_through(port,payload)==payload
+                    sshs.rs.close_tunnels()
+                    echo_server.close()
+
+    def test_local_tunnel_slow_consumer(self):
+        for client in sorted(redssh.clients.enabled_clients):
+            with self.subTest(client=client):
+                redssh.clients.default_client = client
+                echo_server = start_echo_server()
+                sshs = self.start_ssh_session(class_init={'tunnel_buffer_size':65536})
+                sshs.wait_for(self.prompt)
+                sshs.sendline('echo')
+                sshs.wait_for(self.prompt)
+                port = sshs.rs.local_tunnel(0,'127.0.0.1',echo_server.getsockname()[1],error_level=self.error_level)
+                # Keep sending on a connection that never reads its echo until every buffer on the way is full.
+                stuck = socket.create_connection(('127.0.0.1',port))
+                stuck.setblocking(False)
+                sent = 0
+                deadline = time.time()+2
+                while time.time()<deadline:
+                    try:
+                        sent+=stuck.send(b'\x00'*65536)
+                    except BlockingIOError:
+                        time.sleep(0.05)
+                # Other connections and the session itself still get through.
+                payload = os.urandom(262144)
+                assert echo_through(port,payload)==payload
+                assert sshs.rs.execute_command('echo done')==(0,b'done\n')
+                stuck.setblocking(True)
+                received = 0
+                stuck.shutdown(socket.SHUT_WR)
+                data = stuck.recv(65536)
+                while len(data)>0:
+                    received+=len(data)
+                    data = stuck.recv(65536)
+                assert received==sent
+                stuck.close()
+                sshs.rs.close_tunnels()
+                echo_server.close()
+
+    def test_dynamic_tunnel_many_connections(self):
+        for client in sorted(redssh.clients.enabled_clients):
+            with self.subTest(client=client):
+                redssh.clients.default_client = client
+                echo_server = start_echo_server()
+                sshs = self.start_ssh_session()
+                sshs.wait_for(self.prompt)
+                sshs.sendline('echo')
+                sshs.wait_for(self.prompt)
+                port = sshs.rs.dynamic_tunnel(0,error_level=self.error_level)
+                threads = threading.active_count()
+                socks = [socks_connect(port,'127.0.0.1',echo_server.getsockname()[1]) for i in range(32)]
+                # Every connection is handled by the session's one tunnel thread.
+                assert threading.active_count()<=threads+len(socks)+1
+                for (index,sock) in enumerate(socks):
+                    payload = ('stream'+str(index)).encode('utf8')
+                    sock.sendall(payload)
+                    assert sock.recv(len(payload))==payload
+                    sock.close()
+                assert sshs.rs.execute_command('echo done')==(0,b'done\n')
+                sshs.rs.close_tunnels()
+                echo_server.close()
+
+    def test_remote_tunnel_echo(self):
+        for client in sorted(redssh.clients.enabled_clients):
+            with self.subTest(client=client):
+                redssh.clients.default_client = client
+                echo_server = start_echo_server()
+                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                sock.bind(('127.0.0.1', 0))
+                rem_port = int(sock.getsockname()[1])
+                sock.close()
+
+                sshs = self.start_ssh_session()
+                sshs.wait_for(self.prompt)
+                sshs.sendline('echo')
+                sshs.wait_for(self.prompt)
+                sshs.rs.remote_tunnel(rem_port,'127.0.0.1',echo_server.getsockname()[1],error_level=self.error_level)
+                payloads = [os.urandom(65536) for i in range(4)]
+                for payload in payloads:
+                    assert echo_through(rem_port,payload)==payload
+                assert sshs.rs.tunnel_is_alive(redssh.enums.TunnelType.remote,rem_port,'127.0.0.1',echo_server.getsockname()[1])
+                sshs.rs.shutdown_tunnel(redssh.enums.TunnelType.remote,rem_port,'127.0.0.1',echo_server.getsockname()[1])
+                echo_server.close()
+
     # @pytest.mark.xfail
     def test_dynamic_tunnel_read_write(self):
         for client in sorted(redssh.clients.enabled_clients):